@@ -4,14 +4,20 @@
 
 import OpenAI from "openai";
 
+/**
+ * Embed one query. `dimensions` requests a matryoshka-reduced vector to
+ * match a collection imported with `import_qdrant.py --dims N`.
+ */
 export async function getEmbedding(
   client: OpenAI,
   text: string,
   model: string,
+  dimensions?: number,
 ): Promise<number[]> {
   const response = await client.embeddings.create({
     model,
     input: [text],
+    ...(dimensions ? { dimensions } : {}),
   });
   return response.data[0].embedding;
 }
@@ -10,9 +10,87 @@ export interface QdrantSearchOptions {
   vector: number[];
   limit: number;
   filterTags?: string[];
+  /** Collection stores quantized vectors: search them, then rescore with the originals */
+  quantized?: boolean;
+  /** Collection has passage vectors: fold each chunk's best passage score into its hit */
+  passages?: boolean;
 }
 
-/** Vector search, optionally filtered to points with matching tags metadata */
+/** Vector configuration of a collection (import_qdrant.py --dims / --quantization / --passages) */
+export interface CollectionVectors {
+  size: number;
+  quantized: boolean;
+  passages: boolean;
+}
+
+/** Best passages of one parent chunk, with the chunk itself looked up (points/search/groups) */
+interface PassageGroup {
+  id: string | number;
+  hits: SearchHit[];
+  lookup?: { id: string | number; payload: SearchHit["payload"] };
+}
+
+/** Sibling collection holding the passage vectors of long chunks (import_qdrant.py --passages) */
+function passageCollection(config: QueryConfig): string {
+  return `${config.collectionName}_passages`;
+}
+
+/** Candidates fetched per result from quantized vectors before rescoring */
+const QUANTIZATION_OVERSAMPLING = 2.0;
+
+/** Matches "$D41B"-style address tags (the form number_enrichment emits) */
+const ADDRESS_TAG = /^\$([0-9A-F]{2,4})$/i;
+
+/**
+ * Filter conditions for one tag.
+ *
+ * Every tag is an exact keyword match on `tags`. An address tag also
+ * matches any point whose `addr_ranges` payload has a single interval
+ * with start <= address <= end, so "$D41B" finds chunks documenting
+ * $D400-$D41C without that range being expanded into per-address tags.
+ */
+function tagConditions(tag: string): Record<string, unknown>[] {
+  const conditions: Record<string, unknown>[] = [{ key: "tags", match: { value: tag } }];
+  const address = ADDRESS_TAG.exec(tag);
+  if (address) {
+    const value = parseInt(address[1], 16);
+    conditions.push({
+      nested: {
+        key: "addr_ranges",
+        filter: {
+          must: [
+            { key: "start", range: { lte: value } },
+            { key: "end", range: { gte: value } },
+          ],
+        },
+      },
+    });
+  }
+  return conditions;
+}
+
+async function qdrantPost<T>(config: QueryConfig, path: string, body: Record<string, unknown>): Promise<T> {
+  const response = await fetch(`${config.qdrantUrl}/collections/${path}`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body),
+  });
+
+  if (!response.ok) {
+    throw new Error(`Qdrant search failed: ${response.status} ${response.statusText}`);
+  }
+
+  const data = (await response.json()) as { result?: T };
+  return data.result as T;
+}
+
+/**
+ * Vector search, optionally filtered to points with matching tags or covering address ranges.
+ *
+ * With passages, the passage collection is searched with the same filter for
+ * the best passage per parent chunk (grouped by parent_id, parent payload
+ * looked up), and each chunk scores the best of its own vector and its passages.
+ */
 export async function qdrantSearch(
   config: QueryConfig,
   options: QdrantSearchOptions,
@@ -23,30 +101,87 @@ export async function qdrantSearch(
     with_payload: true,
   };
 
+  if (options.quantized) {
+    body.params = {
+      quantization: { rescore: true, oversampling: QUANTIZATION_OVERSAMPLING },
+    };
+  }
+
   if (options.filterTags && options.filterTags.length > 0) {
     body.filter = {
-      should: options.filterTags.map((tag) => ({
-        key: "tags",
-        match: { value: tag },
-      })),
+      should: options.filterTags.flatMap(tagConditions),
     };
   }
 
-  const response = await fetch(
-    `${config.qdrantUrl}/collections/${config.collectionName}/points/search`,
-    {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(body),
-    },
-  );
+  if (!options.passages) {
+    return (await qdrantPost<SearchHit[]>(config, `${config.collectionName}/points/search`, body)) || [];
+  }
+
+  const [hits, grouped] = await Promise.all([
+    qdrantPost<SearchHit[]>(config, `${config.collectionName}/points/search`, body),
+    qdrantPost<{ groups: PassageGroup[] }>(config, `${passageCollection(config)}/points/search/groups`, {
+      ...body,
+      group_by: "parent_id",
+      group_size: 1,
+      with_lookup: { collection: config.collectionName, with_payload: true, with_vectors: false },
+    }),
+  ]);
+  return foldPassages(hits || [], grouped?.groups || [], options.limit);
+}
 
-  if (!response.ok) {
-    throw new Error(`Qdrant search failed: ${response.status} ${response.statusText}`);
+/** Chunk hits with each chunk's score raised to its best passage's; chunks found only by a passage are added */
+function foldPassages(hits: SearchHit[], groups: PassageGroup[], limit: number): SearchHit[] {
+  const byId = new Map<string | number, SearchHit>(hits.map((hit) => [hit.id, { ...hit }]));
+  for (const group of groups) {
+    const best = group.hits[0];
+    if (!best) continue;
+    const parent = byId.get(group.id);
+    if (parent) {
+      parent.score = Math.max(parent.score, best.score);
+    } else if (group.lookup) {
+      byId.set(group.id, { id: group.lookup.id, score: best.score, payload: group.lookup.payload });
+    }
   }
+  return [...byId.values()].sort((a, b) => b.score - a.score).slice(0, limit);
+}
 
-  const data = (await response.json()) as { result?: SearchHit[] };
-  return data.result || [];
+/** Collection info per Qdrant URL and collection name, fetched once per process */
+const collectionVectorsCache = new Map<string, Promise<CollectionVectors>>();
+
+/**
+ * Vector size and quantization of the collection (so queries are embedded to match), and whether it has passages.
+ * Memoised per process: only the first query pays the collection info round trips. A failed lookup is retried.
+ */
+export function getCollectionVectors(config: QueryConfig): Promise<CollectionVectors> {
+  const key = `${config.qdrantUrl}/${config.collectionName}`;
+  let cached = collectionVectorsCache.get(key);
+  if (!cached) {
+    cached = fetchCollectionVectors(config);
+    collectionVectorsCache.set(key, cached);
+    cached.catch(() => collectionVectorsCache.delete(key));
+  }
+  return cached;
+}
+
+async function fetchCollectionVectors(config: QueryConfig): Promise<CollectionVectors> {
+  const response = await fetch(`${config.qdrantUrl}/collections/${config.collectionName}`);
+  if (!response.ok) {
+    throw new Error(`Qdrant collection info failed: ${response.status} ${response.statusText}`);
+  }
+  const data = (await response.json()) as {
+    result: {
+      config: {
+        params: { vectors: { size: number } };
+        quantization_config?: Record<string, unknown> | null;
+      };
+    };
+  };
+  const passages = await fetch(`${config.qdrantUrl}/collections/${passageCollection(config)}`);
+  return {
+    size: data.result.config.params.vectors.size,
+    quantized: Boolean(data.result.config.quantization_config),
+    passages: passages.ok,
+  };
 }
 
 /** Merge two result sets, deduplicating by point id. Primary results come first. */
@@ -13,7 +13,7 @@
 import OpenAI from "openai";
 import type { QueryConfig, SearchHit } from "../types.js";
 import { getEmbedding } from "./embedding.js";
-import { qdrantSearch, mergeResults, trimByScore } from "./qdrant.js";
+import { getCollectionVectors, qdrantSearch, mergeResults, trimByScore } from "./qdrant.js";
 
 export type SearchStrategy = "hybrid" | "filtered" | "semantic";
 
@@ -68,13 +68,16 @@ export async function executeStrategy(
   strategy: SearchStrategy,
 ): Promise<SearchResult> {
   const fetchLimit = Math.max(config.fetchLimit, config.limit);
-  const vector = await getEmbedding(client, enrichedQuery, config.embeddingModel);
+  const collection = await getCollectionVectors(config);
+  const vector = await getEmbedding(client, enrichedQuery, config.embeddingModel, collection.size);
+  const quantized = collection.quantized;
+  const passages = collection.passages;
 
   switch (strategy) {
     case "hybrid": {
       const [filtered, unfiltered] = await Promise.all([
-        qdrantSearch(config, { vector, limit: fetchLimit, filterTags: tags }),
-        qdrantSearch(config, { vector, limit: fetchLimit }),
+        qdrantSearch(config, { vector, limit: fetchLimit, filterTags: tags, quantized, passages }),
+        qdrantSearch(config, { vector, limit: fetchLimit, quantized, passages }),
       ]);
       const merged = mergeResults(filtered, unfiltered, fetchLimit);
       const trimmed = trimByScore(merged, config.limit, config.minScoreRatio);
@@ -89,6 +92,8 @@ export async function executeStrategy(
         vector,
         limit: fetchLimit,
         filterTags: tags,
+        quantized,
+        passages,
       });
       const trimmed = trimByScore(results, config.limit, config.minScoreRatio);
       return {
@@ -98,7 +103,7 @@ export async function executeStrategy(
     }
 
     case "semantic": {
-      const results = await qdrantSearch(config, { vector, limit: fetchLimit });
+      const results = await qdrantSearch(config, { vector, limit: fetchLimit, quantized, passages });
       const trimmed = trimByScore(results, config.limit, config.minScoreRatio);
       return { results: trimmed, mode: "semantic" };
     }
@@ -34,6 +34,7 @@ export interface SearchHit {
     document?: string;
     references?: Array<{ chunk: string; description: string }>;
     tags?: string[];
+    addr_ranges?: Array<{ start: number; end: number }>;
     [key: string]: unknown;
   };
 }
@@ -14,14 +14,19 @@ Usage:
     uv run scripts/add_key_registers.py some_chunk.md    # Process specific file
     uv run scripts/add_key_registers.py --dry-run         # Show what would be processed
     uv run scripts/add_key_registers.py --model gpt-4o    # Use different model
+    uv run scripts/add_key_registers.py --pack            # Pack small chunks into shared requests
+    uv run scripts/add_key_registers.py --pack --token-budget 12000
+
+Packed mode (see request_packing.py) sends several chunks per request as a
+JSON array; any slot that comes back malformed is retried on its own.
 """
 
 import os
 import sys
-import time
 from pathlib import Path
 
-from openai import OpenAI
+from llm_gateway import LLMGateway
+from request_packing import DEFAULT_BUDGET, ModeReport, plan_packs, request_pack
 
 SYSTEM_PROMPT = """\
 You are given a cleaned Markdown document about Commodore 64 / MOS 6502 programming.
@@ -83,10 +88,19 @@ def get_key_registers(client, model, content):
     if usage:
         info += f", tokens={usage.prompt_tokens}+{usage.completion_tokens}={usage.total_tokens}"
 
+    return parse_key_registers(result), info
+
+
+def parse_key_registers(result):
+    """The register lines of a reply, or None for NONE / anything else."""
     if result == "NONE" or not result.startswith("- "):
-        return None, info
+        return None
+    return result
 
-    return result, info
+
+def valid_packed_reply(result):
+    """A packed slot must be NONE or register lines; anything else is retried singly."""
+    return result == "NONE" or result.startswith("- ")
 
 
 def insert_key_registers(content, registers_section):
@@ -107,21 +121,27 @@ def main():
     data_dir = Path(__file__).parent.parent / "data"
 
     dry_run = "--dry-run" in sys.argv
+    pack = "--pack" in sys.argv
     model = "gpt-5-mini"
+    budget = DEFAULT_BUDGET
 
     if "--model" in sys.argv:
         idx = sys.argv.index("--model")
         model = sys.argv[idx + 1]
 
+    if "--token-budget" in sys.argv:
+        idx = sys.argv.index("--token-budget")
+        budget = int(sys.argv[idx + 1])
+
     # Collect target files
-    skip_flags = {"--dry-run", "--model"}
+    skip_flags = {"--dry-run", "--model", "--pack", "--token-budget"}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
         if skip_next:
             skip_next = False
             continue
-        if a == "--model":
+        if a in ("--model", "--token-budget"):
             skip_next = True
             continue
         if a not in skip_flags:
@@ -171,36 +191,72 @@ def main():
         print("Error: OPENAI_API_KEY not set")
         sys.exit(1)
 
-    client = OpenAI(api_key=api_key)
+    client = LLMGateway(api_key)
+    report = ModeReport("packed" if pack else "single", budget if pack else None)
 
     processed = 0
     added = 0
     no_registers = 0
     errors = 0
-
-    for i, (f, content) in enumerate(to_process, 1):
-        print(f"  [{i}/{len(to_process)}] {f.name} ...", end="", flush=True)
+    done = 0
+
+    def apply(f, content, registers, info):
+        nonlocal processed, added, no_registers
+        if registers:
+            updated = insert_key_registers(content, registers)
+            f.write_text(updated)
+            added += 1
+            print(f" added ({info})")
+        else:
+            no_registers += 1
+            print(f" no key registers ({info})")
+        processed += 1
+
+    singles = to_process
+    if pack:
+        by_name = {f.name: (f, content) for f, content in to_process}
+        packs, single_items = plan_packs([(f.name, content) for f, content in to_process], budget)
+        singles = [by_name[name] for name, _ in single_items]
+        print(f"Packing {len(to_process) - len(singles)} chunks into {len(packs)} requests"
+              f" (budget {budget:,} tokens), {len(singles)} sent singly")
+
+        for pack_items in packs:
+            try:
+                outputs, response = request_pack(client, model, SYSTEM_PROMPT, pack_items,
+                                                 validate=valid_packed_reply)
+                info = f"packed x{len(pack_items)}, model={response.model}"
+            except Exception as e:
+                print(f"  packed request failed ({e}); retrying its {len(pack_items)} chunks singly")
+                outputs = {}
+            report.count(packs=1, packed_items=len(pack_items), retried=len(pack_items) - len(outputs))
+            for name, _ in pack_items:
+                if name not in outputs:
+                    singles.append(by_name[name])  # Malformed slot: retry on its own below
+                    continue
+                done += 1
+                print(f"  [{done}/{len(to_process)}] {name} ...", end="", flush=True)
+                try:
+                    apply(*by_name[name], parse_key_registers(outputs[name]), info)
+                except Exception as e:
+                    errors += 1
+                    print(f" ERROR: {e}")
+
+    for f, content in singles:
+        done += 1
+        print(f"  [{done}/{len(to_process)}] {f.name} ...", end="", flush=True)
         try:
             registers, info = get_key_registers(client, model, content)
-            if registers:
-                updated = insert_key_registers(content, registers)
-                f.write_text(updated)
-                added += 1
-                print(f" added ({info})")
-            else:
-                no_registers += 1
-                print(f" no key registers ({info})")
-
-            processed += 1
-            if i < len(to_process):
-                time.sleep(0.3)
-
+            apply(f, content, registers, info)
         except Exception as e:
             errors += 1
             print(f" ERROR: {e}")
 
     print(f"\n{'='*50}")
     print(f"Processed: {processed}, Added: {added}, No registers: {no_registers}, Errors: {errors}")
+    for line in report.lines(len(to_process), client):
+        print(line)
+    print(client.summary())
+    client.close()
 
 
 if __name__ == "__main__":
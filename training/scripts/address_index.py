@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["openai", "requests"]
+# ///
+"""
+Address intervals for chunk metadata, and a local interval-tree lookup.
+
+import_qdrant used to expand every "$XXXX-$YYYY" Key Registers range of up
+to 256 addresses into one "$XXXX" tag per address, and tagged every .,XXXX
+line of a ROM disassembly. That bloated the payloads and the Qdrant keyword
+index, and ranges wider than 256 only matched their two endpoints. Chunks
+now carry their addresses as merged integer intervals instead:
+
+    "addr_ranges": [{"start": 54272, "end": 54300}, {"start": 56320, "end": 56320}]
+
+with integer payload indexes on addr_ranges[].start and addr_ranges[].end.
+"Which chunks cover $D41B" is a nested filter, start <= $D41B <= end, on a
+single interval (query/src/search/qdrant.ts). Tags keep the individually
+named addresses and range endpoints, for exact keyword matches.
+
+IntervalTree answers the same question locally, in O(log n + hits), over
+the intervals of every chunk in training/data/:
+
+    python3 training/scripts/address_index.py '$D41B' 53280
+    python3 training/scripts/address_index.py --stats    # payload size of tags vs intervals
+"""
+
+import json
+import re
+import sys
+
+# Pattern: $XXXX-$YYYY (address range, dash with optional whitespace)
+RANGE_PATTERN = re.compile(r"\$([0-9A-Fa-f]{2,4})[-–]\$([0-9A-Fa-f]{2,4})")
+# Pattern: individual $XXXX
+ADDR_PATTERN = re.compile(r"\$([0-9A-Fa-f]{2,4})")
+
+CODE_GAP = 64  # disassembly addresses further apart than this start a new interval
+
+
+def line_intervals(line: str) -> list[tuple[int, int]]:
+    """(start, end) address intervals of a Key Registers line.
+
+    '$D000-$D02E' gives (0xD000, 0xD02E); '$D020/$D021' gives two single-address
+    intervals. Inverted ranges keep just their endpoints.
+    """
+    intervals = []
+    spans = []
+    for m in RANGE_PATTERN.finditer(line):
+        start, end = int(m.group(1), 16), int(m.group(2), 16)
+        spans.append((m.start(), m.end()))
+        if start <= end:
+            intervals.append((start, end))
+        else:
+            intervals.extend(((start, start), (end, end)))
+    for m in ADDR_PATTERN.finditer(line):
+        if not any(s <= m.start() and m.end() <= e for s, e in spans):
+            value = int(m.group(1), 16)
+            intervals.append((value, value))
+    return intervals
+
+
+def merge_intervals(intervals: list[tuple[int, int]], gap: int = 0) -> list[tuple[int, int]]:
+    """Sorted, non-overlapping intervals; ones within gap addresses of each other are joined."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + gap + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def covered(intervals: list[tuple[int, int]]) -> int:
+    """Number of addresses in merged intervals."""
+    return sum(end - start + 1 for start, end in intervals)
+
+
+def to_payload(intervals: list[tuple[int, int]]) -> list[dict]:
+    return [{"start": start, "end": end} for start, end in intervals]
+
+
+class IntervalTree:
+    """Static centred interval tree over closed (start, end, value) intervals.
+
+    Each node keeps the intervals containing its centre, sorted by start
+    ascending and by end descending; stab(x) walks one root-to-leaf path and
+    stops scanning a node's lists at the first interval that misses x.
+    """
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, intervals: list[tuple[int, int, object]]):
+        endpoints = sorted(p for start, end, _ in intervals for p in (start, end))
+        self.center = endpoints[len(endpoints) // 2] if endpoints else 0
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        self.by_start = sorted(here, key=lambda i: i[0])
+        self.by_end = sorted(here, key=lambda i: -i[1])
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def stab(self, x: int) -> list:
+        """Values of every interval containing x."""
+        hits = []
+        node = self
+        while node is not None:
+            if x < node.center:
+                for start, _, value in node.by_start:
+                    if start > x:
+                        break
+                    hits.append(value)
+                node = node.left
+            elif x > node.center:
+                for _, end, value in node.by_end:
+                    if end < x:
+                        break
+                    hits.append(value)
+                node = node.right
+            else:
+                hits.extend(value for _, _, value in node.by_start)
+                break
+        return hits
+
+
+def build_index(chunks: dict[str, list[tuple[int, int]]]) -> IntervalTree:
+    """Interval tree of chunk name -> address intervals."""
+    return IntervalTree([(start, end, name) for name, intervals in chunks.items()
+                         for start, end in intervals])
+
+
+def parse_address(text: str) -> int:
+    """'$D41B', '0xD41B' or '54299'."""
+    text = text.strip()
+    if text.startswith("$"):
+        return int(text[1:], 16)
+    return int(text, 0)
+
+
+def main():
+    from import_qdrant import DATA_DIR, extract_metadata
+
+    metadata = {}
+    for path in sorted(DATA_DIR.glob("*.md")):
+        metadata[path.name] = extract_metadata(path.read_text(encoding="utf-8"), path.name)
+
+    if "--stats" in sys.argv:
+        tags = sum(len(m.get("tags", [])) for m in metadata.values())
+        intervals = sum(len(m.get("addr_ranges", [])) for m in metadata.values())
+        tag_bytes = sum(len(json.dumps(m.get("tags", []))) for m in metadata.values())
+        interval_bytes = sum(len(json.dumps(m.get("addr_ranges", []))) for m in metadata.values())
+        print(f"{len(metadata)} chunks: {tags} tags ({tag_bytes / 1024:.0f} KB),"
+              f" {intervals} address intervals ({interval_bytes / 1024:.0f} KB)")
+        return
+
+    chunks = {name: [(r["start"], r["end"]) for r in m.get("addr_ranges", [])]
+              for name, m in metadata.items()}
+    tree = build_index(chunks)
+    for arg in sys.argv[1:]:
+        address = parse_address(arg)
+        hits = sorted(tree.stab(address))
+        print(f"${address:04X}: {len(hits)} chunks")
+        for name in hits:
+            print(f"  {name}")
+
+
+if __name__ == "__main__":
+    main()
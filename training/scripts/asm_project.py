@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Local project summaries for the multi-file examples in document_examples.py.
+
+The files of a project (MULTI_FILE_PROJECTS: dustlayer_intro,
+c64lib_chipset, ...) were each documented in isolation, so the model never
+saw where a symbol, macro or include came from and re-explained the shared
+symbol/include files in every header. project_summary() parses the whole
+project locally, with no API call, into one compact text block:
+
+    Project dustlayer_intro (10 files)
+    Include graph:
+      index.asm -> main.asm, setup_symbols.asm, ...
+    Definitions:
+      setup_symbols.asm: address_music=$1000, sid_init=$1000, sid_play=$1006
+      vic2.asm: .macro setupRaster(line, irq), .function toSpritePtr(addr), ...
+    Labels:
+      main.asm: init, irq, ...
+
+Both assembler dialects in examples/ are understood: KickAssembler
+(#import, .import source, .const/.label/.var, .macro/.function/
+.pseudocommand) and ACME (!source/!src, NAME = value, !macro, labels with or
+without a colon). Include paths are resolved against the including file,
+then by file name within the project (dustlayer's "code/" directory was
+flattened); anything else is listed as external. Each list is truncated to
+keep the summary under MAX_SUMMARY_CHARS.
+
+Print the summary of one project:
+    python3 training/scripts/asm_project.py dustlayer_intro
+"""
+
+import hashlib
+import re
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+MAX_SUMMARY_CHARS = 6000   # ~1500 tokens of shared prefix per request
+MAX_ITEMS_PER_FILE = 40
+MAX_VALUE_CHARS = 40
+
+_INCLUDE = re.compile(r'^\s*(?:#import(?:once)?|\.import\s+source|#include|!source|!src)\s+"([^"]+)"')
+_DEFINE = re.compile(r'^\s*\.(const|label|var)\s+([A-Za-z_]\w*)\s*=\s*(.+)$')
+_ASSIGN = re.compile(r'^([A-Za-z_]\w*)\s*=\s*(.+)$')
+_CALLABLE = re.compile(r'^\s*(\.macro|\.function|\.pseudocommand|!macro)\s+([A-Za-z_]\w*)\s*(\([^)]*\)|[^{]*)')
+_LABEL = re.compile(r'^([A-Za-z_][\w.]*)(:|\s|$)')
+
+MNEMONICS = frozenset("""
+adc and asl bcc bcs beq bit bmi bne bpl brk bvc bvs clc cld cli clv cmp cpx cpy
+dec dex dey eor inc inx iny jmp jsr lda ldx ldy lsr nop ora pha php pla plp rol
+ror rti rts sbc sec sed sei sta stx sty tax tay tsx txa txs tya
+""".split())
+
+
+class FileSymbols(NamedTuple):
+    includes: list[str]           # include paths as written
+    definitions: list[str]        # "NAME=value", ".macro name(args)", ...
+    labels: list[str]
+
+
+def _strip_comment(line: str) -> str:
+    """Line without a ; or // comment (quotes are not tracked; good enough for symbols)."""
+    for marker in (";", "//"):
+        pos = line.find(marker)
+        if pos >= 0:
+            line = line[:pos]
+    return line.rstrip()
+
+
+def _short(value: str) -> str:
+    value = value.strip()
+    return value if len(value) <= MAX_VALUE_CHARS else value[:MAX_VALUE_CHARS] + "..."
+
+
+def parse_asm(text: str) -> FileSymbols:
+    """Includes, symbol/macro definitions and code labels of one source file."""
+    includes, definitions, labels = [], [], []
+    in_block_comment = False
+    for raw in text.splitlines():
+        if in_block_comment:
+            if "*/" in raw:
+                in_block_comment = False
+            continue
+        if raw.lstrip().startswith("/*"):
+            in_block_comment = "*/" not in raw
+            continue
+        m = _INCLUDE.match(raw)
+        if m:
+            includes.append(m.group(1))
+            continue
+        line = _strip_comment(raw)
+        if not line.strip():
+            continue
+        if m := _DEFINE.match(line):
+            definitions.append(f"{m.group(2)}={_short(m.group(3))}")
+        elif m := _CALLABLE.match(line):
+            args = " ".join(m.group(3).split())
+            if args and not args.startswith("("):
+                args = " " + args  # ACME/pseudocommand parameters are not parenthesised
+            definitions.append(f"{m.group(1)} {m.group(2)}{args}")
+        elif m := _ASSIGN.match(line):
+            definitions.append(f"{m.group(1)}={_short(m.group(2))}")
+        elif (m := _LABEL.match(line)) and m.group(1).lower() not in MNEMONICS:
+            labels.append(m.group(1))
+    return FileSymbols(includes, definitions, labels)
+
+
+def project_files(project_dir: Path) -> list[Path]:
+    return sorted(project_dir.rglob("*.asm"))
+
+
+def project_md5(project_dir: Path) -> str:
+    """One MD5 over every source file of the project (names and bytes)."""
+    h = hashlib.md5()
+    for path in project_files(project_dir):
+        h.update(str(path.relative_to(project_dir)).encode())
+        h.update(hashlib.md5(path.read_bytes()).digest())
+    return h.hexdigest()
+
+
+def _resolve(include: str, source: Path, project_dir: Path, by_name: dict[str, Path]) -> str:
+    """Project-relative path of an include, or "external:<path>"."""
+    candidate = (source.parent / include).resolve()
+    if candidate.is_relative_to(project_dir.resolve()) and candidate.exists():
+        return str(candidate.relative_to(project_dir.resolve()))
+    found = by_name.get(Path(include).name)
+    if found is not None:
+        return str(found.relative_to(project_dir))
+    return f"external:{include}"
+
+
+def _limited(items: list[str]) -> str:
+    shown = ", ".join(items[:MAX_ITEMS_PER_FILE])
+    if len(items) > MAX_ITEMS_PER_FILE:
+        shown += f", ... (+{len(items) - MAX_ITEMS_PER_FILE} more)"
+    return shown
+
+
+def project_summary(project_dir: Path, description: str = "") -> str:
+    """Compact include graph, definitions and labels of every file in a project."""
+    files = project_files(project_dir)
+    by_name = {path.name: path for path in files}
+    parsed = {path: parse_asm(path.read_text(encoding="utf-8", errors="replace")) for path in files}
+
+    lines = [f"Project {project_dir.name} ({len(files)} files)" + (f": {description}" if description else "")]
+    graph = []
+    for path, symbols in parsed.items():
+        if symbols.includes:
+            targets = [_resolve(inc, path, project_dir, by_name) for inc in symbols.includes]
+            graph.append(f"  {path.relative_to(project_dir)} -> {', '.join(targets)}")
+    if graph:
+        lines.append("Include graph:")
+        lines.extend(graph)
+    for title, field in (("Definitions", "definitions"), ("Labels", "labels")):
+        entries = [f"  {path.relative_to(project_dir)}: {_limited(getattr(symbols, field))}"
+                   for path, symbols in parsed.items() if getattr(symbols, field)]
+        if entries:
+            lines.append(f"{title}:")
+            lines.extend(entries)
+
+    summary = "\n".join(lines)
+    if len(summary) > MAX_SUMMARY_CHARS:
+        summary = summary[:MAX_SUMMARY_CHARS].rsplit("\n", 1)[0] + "\n  ... (truncated)"
+    return summary
+
+
+def main():
+    examples_dir = Path(__file__).parent.parent / "examples"
+    names = sys.argv[1:] or sorted(p.name for p in examples_dir.iterdir() if p.is_dir())
+    for name in names:
+        summary = project_summary(examples_dir / name)
+        print(summary)
+        print(f"({len(summary)} chars)\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,17 +16,39 @@ Usage:
     uv run scripts/audit_chunks.py --model gpt-4o     # Use different model
     uv run scripts/audit_chunks.py --threshold 0.3    # Lower heuristic threshold (more candidates)
     uv run scripts/audit_chunks.py --workers 8        # Process 8 chunks concurrently (default: 4)
+    uv run scripts/audit_chunks.py --duplicates       # Report near-duplicate chunks (no API calls)
+    uv run scripts/audit_chunks.py --duplicates --dup-threshold 0.6
+    uv run scripts/audit_chunks.py --all --batch      # Confirm candidates in one Batch API job
+
+Near-duplicates: overlapping split windows and refine passes can leave two
+chunks covering mostly the same text, which costs embeddings twice and
+returns the same passage twice in search. Each chunk is reduced to hashed
+word 5-gram shingles; a content-defined sample of them (hash % 8 == 0, so
+a shared passage samples the same shingles in both chunks) is indexed, and
+only chunks sharing sampled shingles are compared exactly (Jaccard, and
+containment for a small chunk inside a larger one).
+
+Batch mode (see batch_runner.py) sends all candidates as one Batch API job
+instead of through the thread pool; verdicts are applied the same way.
 """
 
+import hashlib
 import json
 import os
 import re
 import sys
 import threading
+import zlib
+from collections import Counter, defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import combinations
 from pathlib import Path
 
-from openai import OpenAI
+from batch_runner import run_batch
+from llm_gateway import LLMGateway
+from md_sections import parse_sections
+from split_training import sanitize_name
+import telemetry
 
 
 JUNK_KEYWORDS_FILENAME = [
@@ -35,22 +57,30 @@ JUNK_KEYWORDS_FILENAME = [
     'heading_and_', '_heading', 'cartridge', 'resources',
 ]
 
-JUNK_PATTERNS_CONTENT = [
-    re.compile(r'\[\*{3}\s*OMITTED\s*\*{3}\]', re.IGNORECASE),
-    re.compile(r'no technical content', re.IGNORECASE),
-    re.compile(r'no code,?\s*registers,?\s*or technical', re.IGNORECASE),
-    re.compile(r'placeholder', re.IGNORECASE),
-    re.compile(r'metadata only', re.IGNORECASE),
-    re.compile(r'not included in this', re.IGNORECASE),
-    re.compile(r'omitted from the text', re.IGNORECASE),
-    re.compile(r'widely available elsewhere', re.IGNORECASE),
-    re.compile(r'generation metadata', re.IGNORECASE),
-    re.compile(r'\(omitted\s*[—–-]\s*not applicable\)', re.IGNORECASE),
-    re.compile(r'chapter head(er|ing) and mini-?(table of contents|toc)', re.IGNORECASE),
-    re.compile(r'this (chunk|page) is (a |the )?(chapter|section) head', re.IGNORECASE),
-    re.compile(r'no code or register maps', re.IGNORECASE),
-    re.compile(r'only\s+(a\s+)?(high-level|brief)\s+(product\s+)?description', re.IGNORECASE),
-]
+# Matched against the lowercased content: a case-sensitive search can
+# use its literal prefix to skip ahead, re.IGNORECASE cannot (~6x faster)
+JUNK_PATTERNS_CONTENT = [re.compile(p) for p in (
+    r'\[\*{3}\s*omitted\s*\*{3}\]',
+    r'no technical content',
+    r'no code,?\s*registers,?\s*or technical',
+    r'placeholder',
+    r'metadata only',
+    r'not included in this',
+    r'omitted from the text',
+    r'widely available elsewhere',
+    r'generation metadata',
+    r'\(omitted\s*[—–-]\s*not applicable\)',
+    r'chapter head(er|ing) and mini-?(table of contents|toc)',
+    r'this (chunk|page) is (a |the )?(chapter|section) head',
+    r'no code or register maps',
+    r'only\s+(a\s+)?(high-level|brief)\s+(product\s+)?description',
+)]
+
+# Near-duplicate detection
+SHINGLE_WORDS = 5
+SAMPLE_MOD = 8         # index shingles whose hash % SAMPLE_MOD == 0
+MAX_POSTING = 50       # sampled shingles in more chunks than this are boilerplate
+MIN_SHARED = 2         # sampled shingles two chunks must share to be compared
 
 AUDIT_PROMPT = """\
 You are auditing chunks for a Commodore 64 / 6502 vector knowledge base (Qdrant).
@@ -102,20 +132,21 @@ def score_chunk(file_path: Path, content: str) -> tuple[float, list[str]]:
             break
 
     # Content pattern matches
+    lowered = content.lower()
     for pattern in JUNK_PATTERNS_CONTENT:
-        if pattern.search(content):
+        if pattern.search(lowered):
             score += 0.3
             reasons.append(f'content matches /{pattern.pattern}/')
             break
 
     # Very short content (strip markdown formatting for line count)
-    lines = [l for l in content.splitlines() if l.strip() and not l.startswith('#')]
-    if len(lines) < 8:
+    line_count = sum(1 for l in content.splitlines() if l.strip() and not l.startswith('#'))
+    if line_count < 8:
         score += 0.3
-        reasons.append(f'very short ({len(lines)} non-heading lines)')
-    elif len(lines) < 15:
+        reasons.append(f'very short ({line_count} non-heading lines)')
+    elif line_count < 15:
         score += 0.15
-        reasons.append(f'short ({len(lines)} non-heading lines)')
+        reasons.append(f'short ({line_count} non-heading lines)')
 
     # Small file size (known junk: 382-868 bytes; legit small chunks: 900+)
     size = len(content.encode('utf-8'))
@@ -127,15 +158,18 @@ def score_chunk(file_path: Path, content: str) -> tuple[float, list[str]]:
         reasons.append(f'small file ({size} bytes)')
 
     # No Key Registers AND no Source Code — less likely to be technical
-    has_registers = '## Key Registers' in content and '(none)' not in content.split('## Key Registers')[1][:100] if '## Key Registers' in content else False
-    has_source = '## Source Code' in content
+    sections = parse_sections(content)
+    kr = sections.find('Key Registers')
+    sc = sections.find('Source Code')
+    kr_section = sections.body(kr)[:200] if kr else ''
+    sc_section = sections.body(sc)[:200] if sc else ''
+    has_registers = kr is not None and '(none)' not in kr_section[:100]
+    has_source = sc is not None
     if not has_registers and not has_source:
         score += 0.1
         reasons.append('no registers or source code')
 
     # Both Key Registers and Source Code explicitly say omitted/none
-    kr_section = content.split('## Key Registers')[1][:200] if '## Key Registers' in content else ''
-    sc_section = content.split('## Source Code')[1][:200] if '## Source Code' in content else ''
     both_empty = (
         re.search(r'\((?:omitted|none)', kr_section, re.IGNORECASE) and
         re.search(r'\((?:omitted|none)', sc_section, re.IGNORECASE)
@@ -147,54 +181,134 @@ def score_chunk(file_path: Path, content: str) -> tuple[float, list[str]]:
     return min(score, 1.0), reasons
 
 
-def find_split_config(chunk_name: str, config_dir: Path) -> tuple[Path | None, int | None]:
-    """Find which split config JSON contains the given chunk name.
-    Returns (config_path, split_index) or (None, None)."""
-    for config_path in config_dir.glob('*.json'):
+def build_split_index(config_dir: Path) -> dict[str, tuple[Path, int]]:
+    """Map every chunk name to (config_path, split_index), parsing each config once.
+
+    Keyed by the raw split name and by its file stem; when two configs
+    produce the same chunk, the later one wins, as in split_training.py.
+    """
+    index = {}
+    for config_path in sorted(config_dir.glob('*.json')):
         try:
             with open(config_path) as f:
                 config = json.load(f)
         except (json.JSONDecodeError, OSError):
             continue
-
         for i, split in enumerate(config.get('splits', [])):
-            if split.get('name') == chunk_name:
-                return config_path, i
+            name = split.get('name')
+            if name:
+                index[name] = (config_path, i)
+                index[sanitize_name(name)] = (config_path, i)
+    return index
 
-    return None, None
 
-
-def mark_split_ignored(config_path: Path, split_index: int, reason: str) -> bool:
-    """Mark a split entry as ignored in its config file. Returns True if changed."""
+def mark_splits_ignored(config_path: Path, entries: list[tuple[int, str]]) -> int:
+    """Mark split entries (index, reason) as ignored in one config file.
+    Returns how many changed; the file is rewritten once."""
     with open(config_path) as f:
         config = json.load(f)
 
-    split = config['splits'][split_index]
-    if split.get('ignore'):
-        return False  # Already ignored
-
-    split['ignore'] = True
-    split['reason'] = f"audit: {reason}"
-
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
-        f.write('\n')
+    changed = 0
+    for split_index, reason in entries:
+        split = config['splits'][split_index]
+        if split.get('ignore'):
+            continue  # Already ignored
+        split['ignore'] = True
+        split['reason'] = f"audit: {reason}"
+        changed += 1
+
+    if changed:
+        with open(config_path, 'w') as f:
+            json.dump(config, f, indent=2)
+            f.write('\n')
+    return changed
+
+
+def shingle_hashes(content: str) -> set[int]:
+    """CRC32s of the word 5-grams of a chunk, ignoring its References list."""
+    text = parse_sections(content).without('References').lower()
+    words = re.findall(r'[a-z0-9$]+', text)
+    if len(words) < SHINGLE_WORDS:
+        return {zlib.crc32(' '.join(words).encode())} if words else set()
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE_WORDS]).encode())
+            for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def find_near_duplicates(chunks: dict[str, str], threshold: float = 0.8) -> list[tuple]:
+    """Find pairs of chunks that share most of their text.
+
+    Returns [(similarity, kind, name_a, name_b)], most similar first;
+    kind is 'jaccard' for near-identical chunks or 'contained' when the
+    smaller chunk's shingles are mostly inside the larger one.
+    """
+    shingles = {name: shingle_hashes(content) for name, content in chunks.items()}
+
+    postings = defaultdict(list)
+    for name in sorted(shingles):
+        for h in shingles[name]:
+            if h % SAMPLE_MOD == 0:
+                postings[h].append(name)
+
+    shared = Counter()
+    for names in postings.values():
+        if len(names) <= MAX_POSTING:
+            shared.update(combinations(names, 2))
+
+    pairs = []
+    for (a, b), count in shared.items():
+        if count < MIN_SHARED:
+            continue
+        sa, sb = shingles[a], shingles[b]
+        inter = len(sa & sb)
+        jaccard = inter / len(sa | sb)
+        containment = inter / min(len(sa), len(sb))
+        if jaccard >= threshold:
+            pairs.append((jaccard, 'jaccard', a, b))
+        elif containment >= threshold:
+            pairs.append((containment, 'contained', a, b))
+    return sorted(pairs, key=lambda p: (-p[0], p[2], p[3]))
+
+
+def report_duplicates(md_files: list[Path], threshold: float):
+    """--duplicates: print near-duplicate chunk pairs."""
+    chunks = {f.stem: f.read_text(encoding='utf-8', errors='replace')
+              for f in md_files if not f.name.startswith('example_')}
+    print(f"Comparing {len(chunks)} chunks for near-duplicates (threshold={threshold})...")
+    pairs = find_near_duplicates(chunks, threshold)
+    if not pairs:
+        print("No near-duplicates found.")
+        return
 
-    return True
+    wasted = 0
+    for similarity, kind, a, b in pairs:
+        size_a, size_b = len(chunks[a].encode('utf-8')), len(chunks[b].encode('utf-8'))
+        label = 'near-identical' if kind == 'jaccard' else 'contained'
+        print(f"  {similarity:.2f}  {label:<14} {a}.md ({size_a} bytes)  ~  {b}.md ({size_b} bytes)")
+        wasted += min(size_a, size_b)
+    print(f"\n{len(pairs)} pairs; ~{wasted / 1024:.0f} KB of duplicated text embedded twice."
+          f" Audit them with: uv run scripts/audit_chunks.py <name>.md")
 
 
 def audit_with_openai(client, model: str, content: str) -> tuple[str, str]:
     """Ask OpenAI to evaluate a chunk. Returns (verdict, reason)."""
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    response = client.chat.completions.create(**audit_request(model, content))
+    return parse_verdict(response.choices[0].message.content.strip())
+
+
+def audit_request(model: str, content: str) -> dict:
+    """chat.completions.create() arguments for one chunk (also the batch request body)."""
+    return {
+        'model': model,
+        'messages': [
             {"role": "system", "content": AUDIT_PROMPT},
             {"role": "user", "content": content},
         ],
-        temperature=1,  # gpt-5-mini only supports default temperature
-    )
-    result = response.choices[0].message.content.strip()
+        'temperature': 1,  # gpt-5-mini only supports default temperature
+    }
+
 
+def parse_verdict(result: str) -> tuple[str, str]:
+    """(verdict, reason) from a VERDICT: JUNK|KEEP | reason reply."""
     # Parse verdict
     match = re.match(r'VERDICT:\s*(JUNK|KEEP)\s*\|\s*(.*)', result, re.IGNORECASE)
     if match:
@@ -217,8 +331,11 @@ def main():
     apply = '--apply' in sys.argv
     audit_all = '--all' in sys.argv
     score_only = '--score-only' in sys.argv
+    duplicates = '--duplicates' in sys.argv
+    batch = '--batch' in sys.argv
     model = 'gpt-5-mini'
     threshold = 0.4
+    dup_threshold = 0.8
 
     if '--model' in sys.argv:
         idx = sys.argv.index('--model')
@@ -228,20 +345,25 @@ def main():
         idx = sys.argv.index('--threshold')
         threshold = float(sys.argv[idx + 1])
 
+    if '--dup-threshold' in sys.argv:
+        idx = sys.argv.index('--dup-threshold')
+        dup_threshold = float(sys.argv[idx + 1])
+
     workers = 4
     if '--workers' in sys.argv:
         idx = sys.argv.index('--workers')
         workers = int(sys.argv[idx + 1])
 
     # Collect target files
-    skip_flags = {'--apply', '--all', '--score-only', '--model', '--threshold', '--force', '--workers'}
+    skip_flags = {'--apply', '--all', '--score-only', '--model', '--threshold', '--force', '--workers',
+                  '--duplicates', '--dup-threshold', '--batch'}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
         if skip_next:
             skip_next = False
             continue
-        if a in ('--model', '--threshold', '--workers'):
+        if a in ('--model', '--threshold', '--workers', '--dup-threshold'):
             skip_next = True
             continue
         if a not in skip_flags:
@@ -269,6 +391,10 @@ def main():
         print(f"No .md files found in {data_dir}")
         sys.exit(0)
 
+    if duplicates:
+        report_duplicates(md_files, dup_threshold)
+        return
+
     # Phase 1: Heuristic scoring
     print(f"Phase 1: Scoring {len(md_files)} chunks with heuristics...")
     candidates = []
@@ -295,7 +421,7 @@ def main():
         print("\nError: OPENAI_API_KEY environment variable not set")
         sys.exit(1)
 
-    client = OpenAI(api_key=api_key)
+    client = LLMGateway(api_key)
     print(f"\nPhase 2: Confirming {len(candidates)} candidates with OpenAI ({model})...")
 
     junk_list = []
@@ -303,36 +429,61 @@ def main():
     results_lock = threading.Lock()
     counter = {'done': 0}
 
-    def audit_one(file_path, content):
+    def audit_one(file_path, content, verdict_reason=None):
         with results_lock:
             counter['done'] += 1
             n = counter['done']
         print(f"  [{n}/{len(candidates)}] {file_path.name} ...", flush=True)
 
-        try:
-            verdict, reason = audit_with_openai(client, model, content)
-
-            with results_lock:
-                if verdict == 'JUNK':
-                    junk_list.append((file_path, reason))
-                    print(f"    JUNK — {reason}")
+        with telemetry.file_context(file_path.name):
+            try:
+                if verdict_reason is not None:
+                    verdict, reason = verdict_reason  # From the batch job
                 else:
-                    keep_list.append((file_path, reason))
-                    print(f"    KEEP — {reason}")
-
-        except Exception as e:
-            with results_lock:
-                keep_list.append((file_path, f"error: {e}"))
-            print(f"    ERROR (keeping) — {e}")
-
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(audit_one, fp, c) for fp, c, _, _ in candidates]
-        for f in as_completed(futures):
-            f.result()
+                    verdict, reason = audit_with_openai(client, model, content)
+
+                with results_lock:
+                    if verdict == 'JUNK':
+                        junk_list.append((file_path, reason))
+                        print(f"    JUNK — {reason}")
+                    else:
+                        keep_list.append((file_path, reason))
+                        print(f"    KEEP — {reason}")
+
+            except Exception as e:
+                with results_lock:
+                    keep_list.append((file_path, f"error: {e}"))
+                print(f"    ERROR (keeping) — {e}")
+
+    jobs = [(fp, c) for fp, c, _, _ in candidates]
+    if batch:
+        by_name = {fp.name: (fp, c) for fp, c, _, _ in candidates}
+        requests = [(fp.name, hashlib.md5(c.encode('utf-8')).hexdigest(), audit_request(model, c))
+                    for fp, c, _, _ in candidates]
+        try:
+            replies, batch_errors = run_batch('audit', requests, api_key)
+        except KeyboardInterrupt:
+            client.close()
+            sys.exit(1)
+        jobs = [(*by_name[name], parse_verdict(response.choices[0].message.content.strip()))
+                for name, response in replies.items()]
+        for name, error in sorted(batch_errors.items()):
+            # Unconfirmed candidates are kept, as with interactive errors
+            keep_list.append((by_name[name][0], f"error: batch request failed: {error}"))
+            print(f"  ERROR (keeping) {name} — {error}")
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(audit_one, *job) for job in jobs]
+            for f in as_completed(futures):
+                f.result()
+    finally:
+        client.close()
 
     # Summary
     print(f"\n{'='*60}")
     print(f"Results: {len(junk_list)} JUNK, {len(keep_list)} KEEP")
+    print(client.summary())
 
     if not junk_list:
         print("Nothing to remove.")
@@ -353,18 +504,18 @@ def main():
     configs_updated = 0
     config_not_found = []
 
+    split_index = build_split_index(config_dir)
+    to_mark = defaultdict(list)  # config_path -> [(split index, reason)]
+
     for file_path, reason in junk_list:
         chunk_name = file_path.stem
         print(f"  Removing: {chunk_name}")
 
-        # 1. Find and update split config
-        config_path, split_idx = find_split_config(chunk_name, config_dir)
+        # 1. Queue the split config update (each config is rewritten once below)
+        config_path, split_idx = split_index.get(chunk_name, (None, None))
         if config_path and split_idx is not None:
-            if mark_split_ignored(config_path, split_idx, reason):
-                configs_updated += 1
-                print(f"    split config: marked ignore in {config_path.name}")
-            else:
-                print(f"    split config: already ignored in {config_path.name}")
+            to_mark[config_path].append((split_idx, reason))
+            print(f"    split config: {config_path.name} entry {split_idx}")
         else:
             config_not_found.append(chunk_name)
             print(f"    split config: NOT FOUND (chunk may be orphaned)")
@@ -384,8 +535,14 @@ def main():
             deleted_md += 1
             print(f"    deleted: {file_path.name}")
 
+    for config_path, entries in sorted(to_mark.items()):
+        changed = mark_splits_ignored(config_path, entries)
+        configs_updated += changed
+        print(f"  {config_path.name}: {changed} entries marked ignore"
+              + (f" ({len(entries) - changed} already ignored)" if changed < len(entries) else ""))
+
     print(f"\n{'='*60}")
-    print(f"Applied: {deleted_md} .md deleted, {deleted_txt} .txt deleted, {configs_updated} configs updated")
+    print(f"Applied: {deleted_md} .md deleted, {deleted_txt} .txt deleted, {configs_updated} config entries updated")
     if config_not_found:
         print(f"Warning: {len(config_not_found)} chunks had no split config entry:")
         for name in config_not_found:
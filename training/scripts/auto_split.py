@@ -15,6 +15,7 @@ Usage:
     uv run scripts/auto_split.py --model gpt-4o       # Use different model
     uv run scripts/auto_split.py --refine             # Refine all configs with oversized chunks
     uv run scripts/auto_split.py --refine config.json # Refine a specific config
+    uv run scripts/auto_split.py --refine --no-local  # Send every oversized chunk to OpenAI
     uv run scripts/auto_split.py --workers 8          # Process 8 files concurrently (default: 4)
 """
 
@@ -28,7 +29,9 @@ import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from openai import OpenAI
+from find_boundaries import presplit_chunk
+from llm_gateway import LLMGateway
+import telemetry
 
 SYSTEM_PROMPT = """\
 You are splitting a Commodore 64 / MOS 6502 reference document into discrete knowledge chunks for a semantic search database.
@@ -147,6 +150,9 @@ Return ONLY valid JSON (no markdown fencing, no commentary):
 # Maximum lines to send in a single API call
 MAX_LINES_PER_CALL = 3000
 
+# Lines shared by consecutive windows of a large document, for context
+WINDOW_OVERLAP = 200
+
 # Chunks larger than this trigger refinement
 MAX_CHUNK_LINES = 120
 
@@ -198,89 +204,124 @@ def split_document(client, model, filename, content, total_lines):
         # Small enough to process in one call
         return _call_openai(client, model, filename, content, 1, total_lines)
 
-    # Large document: process in windows with overlap
-    all_splits = []
-    window_size = MAX_LINES_PER_CALL
-    overlap = 200  # Lines of overlap for context
-
-    # Calculate total windows for progress reporting
-    num_windows = 1
-    pos = 0
-    while pos + window_size < total_lines:
-        pos += window_size - overlap
-        num_windows += 1
-
-    print(f"    Large document ({total_lines} lines), {num_windows} windows needed")
-    window_start = 0
-    window_num = 0
+    # Large document: all windows at once, then stitch the overlaps
+    ranges = _window_ranges(1, total_lines)
+    print(f"    Large document ({total_lines} lines), {len(ranges)} windows needed")
     doc_start_time = time.time()
 
-    while window_start < total_lines:
-        window_num += 1
-        window_end = min(window_start + window_size, total_lines)
-        window_lines = lines[window_start:window_end]
-        window_content = '\n'.join(window_lines)
-        numbered = _number_lines(window_content, window_start + 1)
-
-        context_msg = ""
-        if window_start > 0:
-            context_msg = (
-                f"\n\nNOTE: This is lines {window_start + 1}-{window_end} of {total_lines}. "
-                f"Previous sections have already been split. Start your splits from line {window_start + 1}."
-            )
-
+    requests = []
+    for window_start, window_end in ranges:
+        numbered = _number_lines('\n'.join(lines[window_start - 1:window_end]), window_start)
+        context_msg = (
+            f"\n\nNOTE: This is lines {window_start}-{window_end} of {total_lines}. "
+            f"The document is split in overlapping windows; cover every line shown, "
+            f"from line {window_start} to line {window_end}."
+        )
         user_msg = (
-            f"Split this section of '{filename}' (lines {window_start + 1}-{window_end} "
+            f"Split this section of '{filename}' (lines {window_start}-{window_end} "
             f"of {total_lines} total):{context_msg}\n\n{numbered}"
         )
+        requests.append((window_start, window_end, user_msg))
 
-        print(f"    Window {window_num}/{num_windows}: lines {window_start + 1}-{window_end} ... ", end='', flush=True)
-        call_start = time.time()
+    windows = _dispatch_windows(client, model, SYSTEM_PROMPT, requests, indent='    ')
+    config = {
+        "source_file": filename,
+        "context": _extract_title(content),
+        "splits": stitch_windows(windows),
+    }
+    config, num_fixes = fix_gaps_and_overlaps(
+        config, content.splitlines(keepends=True), client=client, model=model, filename=filename)
 
+    total_elapsed = time.time() - doc_start_time
+    print(f"    All windows done: {len(config['splits'])} total splits"
+          f"{f' ({num_fixes} seam fixes)' if num_fixes else ''} in {_fmt_elapsed(total_elapsed)}")
+    return config
+
+
+def _window_ranges(first, last, window_size=MAX_LINES_PER_CALL, overlap=WINDOW_OVERLAP):
+    """1-indexed inclusive (start, end) windows covering lines first..last,
+    each sharing `overlap` lines with the one before."""
+    ranges = []
+    start = first
+    while True:
+        end = min(start + window_size - 1, last)
+        ranges.append((start, end))
+        if end >= last:
+            return ranges
+        start = end - overlap + 1
+
+
+def _dispatch_windows(client, model, system_prompt, requests, indent):
+    """Send every window's request concurrently (the gateway paces them).
+
+    requests: [(start, end, user_msg)] in document order.
+    Returns [(start, end, splits)] in the same order; splits is [] for a
+    window whose reply could not be parsed.
+    """
+    num_windows = len(requests)
+
+    def run(window_num, window_start, window_end, user_msg):
+        call_start = time.time()
         response = client.chat.completions.create(
             model=model,
             messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_msg},
             ],
         )
-
         elapsed = time.time() - call_start
+        label = f"{indent}Window {window_num}/{num_windows}: lines {window_start}-{window_end}"
         result_text = _strip_json_fencing(response.choices[0].message.content)
-
         try:
-            window_config = json.loads(result_text)
-            window_splits = window_config.get('splits', [])
-
-            new_count = 0
-            for s in window_splits:
-                if s.get('start', 0) >= window_start + 1:
-                    all_splits.append(s)
-                    new_count += 1
-
-            print(f"{new_count} splits ({_fmt_elapsed(elapsed)})")
-            print(f"      [{_fmt_response(response)}]")
-
+            splits = json.loads(result_text).get('splits', [])
         except json.JSONDecodeError as e:
-            print(f"PARSE ERROR ({_fmt_elapsed(elapsed)})")
-            print(f"      {e}")
-
-        # Move to next window (minus overlap)
-        window_start = window_end - overlap
-        if window_end >= total_lines:
-            break
-
-        time.sleep(1)  # Rate limit between windows
-
-    total_elapsed = time.time() - doc_start_time
-    print(f"    All windows done: {len(all_splits)} total splits in {_fmt_elapsed(total_elapsed)}")
-
-    # Build final config
-    return {
-        "source_file": filename,
-        "context": _extract_title(content),
-        "splits": all_splits,
-    }
+            print(f"{label}: PARSE ERROR ({_fmt_elapsed(elapsed)})\n{indent}  {e}")
+            return []
+        print(f"{label}: {len(splits)} splits ({_fmt_elapsed(elapsed)})\n"
+              f"{indent}  [{_fmt_response(response)}]")
+        return splits
+
+    with ThreadPoolExecutor(max_workers=num_windows) as pool:
+        futures = [pool.submit(run, i, ws, we, msg)
+                   for i, (ws, we, msg) in enumerate(requests, 1)]
+        return [(ws, we, f.result()) for (ws, we, _), f in zip(requests, futures)]
+
+
+def stitch_windows(windows):
+    """Merge the splits of overlapping windows into one list, deterministically.
+
+    windows: [(start, end, splits)] in document order. Each overlap is cut
+    at its midpoint: lines before the cut belong to the earlier window,
+    lines after it to the later one, i.e. every line goes to the window it
+    sits farthest from an edge of, where the model saw the most context
+    around it. A window contributes only the splits that start on lines it
+    owns, so each boundary comes from exactly one window. Where a split
+    runs into the next window's territory it is trimmed to the next
+    boundary; remaining gaps and overlaps are left for
+    fix_gaps_and_overlaps().
+    """
+    chosen = []  # (start, window index, split)
+    for k, (window_start, window_end, splits) in enumerate(windows):
+        own_start = window_start if k == 0 else (windows[k - 1][1] + window_start) // 2 + 1
+        own_end = window_end if k == len(windows) - 1 else (window_end + windows[k + 1][0]) // 2
+        for split in splits:
+            start, end = split.get('start'), split.get('end')
+            if not isinstance(start, int) or not isinstance(end, int):
+                continue
+            if own_start <= start <= own_end:
+                # The model cannot see past its window
+                chosen.append((start, k, dict(split, end=min(end, window_end))))
+
+    chosen.sort(key=lambda c: (c[0], c[1]))
+    stitched = []
+    for i, (start, k, split) in enumerate(chosen):
+        if i + 1 < len(chosen):
+            next_start, next_k, _ = chosen[i + 1]
+            if next_k != k and split['end'] >= next_start:
+                split['end'] = next_start - 1
+        if split['end'] >= split['start']:
+            stitched.append(split)
+    return stitched
 
 
 def _call_openai(client, model, filename, content, start_line, end_line):
@@ -380,89 +421,48 @@ def refine_chunk(client, model, filename, lines, split_entry):
     return new_splits
 
 
-def _refine_large_chunk(client, model, system_prompt, _filename, lines,
+def _refine_large_chunk(client, model, system_prompt, filename, lines,
                         start, end, _chunk_name, _chunk_desc):
     """Refine a chunk that's too large for a single API call."""
     line_count = end - start + 1
-    window_size = MAX_LINES_PER_CALL
-    overlap = 200
-
-    # Calculate total windows
-    num_windows = 1
-    pos = start - 1
-    while pos + window_size < end:
-        pos += window_size - overlap
-        num_windows += 1
-
-    print(f"      Large chunk ({line_count} lines), {num_windows} windows needed")
-
-    all_splits = []
-    window_start = start - 1  # 0-indexed
-    window_num = 0
+    ranges = _window_ranges(start, end)
+    print(f"      Large chunk ({line_count} lines), {len(ranges)} windows needed")
     chunk_start_time = time.time()
 
-    while window_start < end:
-        window_num += 1
-        window_end = min(window_start + window_size, end)
-        window_lines = lines[window_start:window_end]
-        window_content = ''.join(window_lines)
-
-        abs_start = window_start + 1  # back to 1-indexed
-        abs_end = window_end
-
-        numbered = _number_lines(window_content, abs_start)
-
+    requests = []
+    for abs_start, abs_end in ranges:
+        numbered = _number_lines(''.join(lines[abs_start - 1:abs_end]), abs_start)
         context_msg = ""
-        if window_start > start - 1:
+        if abs_start > start:
             context_msg = (
                 f"\n\nNOTE: This is lines {abs_start}-{abs_end} of the chunk "
-                f"(lines {start}-{end}). Previous sections already split. "
+                f"(lines {start}-{end}), split in overlapping windows. "
                 f"Start from line {abs_start}."
             )
-
         user_msg = (
             f"Sub-split this section (lines {abs_start}-{abs_end}):"
             f"{context_msg}\n\n{numbered}"
         )
+        requests.append((abs_start, abs_end, user_msg))
 
-        print(f"      Window {window_num}/{num_windows}: lines {abs_start}-{abs_end} ... ", end='', flush=True)
-        call_start = time.time()
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_msg},
-            ],
-        )
-
-        elapsed = time.time() - call_start
-        result_text = _strip_json_fencing(response.choices[0].message.content)
-        try:
-            window_result = json.loads(result_text)
-            new_count = 0
-            for s in window_result.get('splits', []):
-                if s.get('start', 0) >= abs_start:
-                    all_splits.append(s)
-                    new_count += 1
-            print(f"{new_count} splits ({_fmt_elapsed(elapsed)})")
-            print(f"        [{_fmt_response(response)}]")
-        except json.JSONDecodeError as e:
-            print(f"PARSE ERROR ({_fmt_elapsed(elapsed)})")
-            print(f"        {e}")
-
-        window_start = window_end - overlap
-        if window_end >= end:
-            break
-        time.sleep(1)
+    windows = _dispatch_windows(client, model, system_prompt, requests, indent='      ')
+    merged = {'splits': stitch_windows(windows)}
+    merged, num_fixes = fix_gaps_and_overlaps(merged, lines, client=client, model=model,
+                                              filename=filename, span=(start, end))
 
     total_elapsed = time.time() - chunk_start_time
-    print(f"      All windows done: {len(all_splits)} total splits in {_fmt_elapsed(total_elapsed)}")
-    return all_splits
+    print(f"      All windows done: {len(merged['splits'])} total splits"
+          f"{f' ({num_fixes} seam fixes)' if num_fixes else ''} in {_fmt_elapsed(total_elapsed)}")
+    return merged['splits']
 
 
-def refine_config(client, model, config, docs_dir, verbose=True):
+def refine_config(client, model, config, docs_dir, verbose=True, local=True):
     """Find oversized chunks in a config and sub-split them via OpenAI.
+
+    With local=True, chunks with clear section markers (*** routines,
+    numbered sections, ALL-CAPS or underlined headers, $ADDR entries) are
+    cut at those markers without an API call; any piece that is still
+    oversized gets the model on the next pass.
     Returns (updated_config, num_refined) or (config, 0) if nothing to do."""
     source_file = config['source_file']
     raw_path = docs_dir / source_file
@@ -499,6 +499,18 @@ def refine_config(client, model, config, docs_dir, verbose=True):
         if verbose:
             print(f"    Refining '{name}' ({size} lines, {split_entry['start']}-{split_entry['end']})")
 
+        if local:
+            new_splits = presplit_chunk(lines, split_entry, max_lines=MAX_CHUNK_LINES)
+            if new_splits:
+                splits[idx:idx + 1] = new_splits
+                num_refined += 1
+                still_oversized = sum(1 for s in new_splits
+                                      if s['end'] - s['start'] + 1 > MAX_CHUNK_LINES)
+                if verbose:
+                    print(f"      Split locally at section markers into {len(new_splits)} sub-chunks"
+                          + (f" ({still_oversized} still oversized)" if still_oversized else ""))
+                continue
+
         try:
             new_splits = refine_chunk(client, model, source_file, lines, split_entry)
 
@@ -547,8 +559,6 @@ def refine_config(client, model, config, docs_dir, verbose=True):
         except Exception as e:
             print(f"      ERROR refining '{name}': {e}")
 
-        time.sleep(1)  # Rate limit
-
     config['splits'] = splits
     return config, num_refined
 
@@ -724,13 +734,16 @@ def _classify_issues_with_ai(client, model, filename, issues):
         return {}
 
 
-def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None):
+def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None, span=None):
     """Fix gaps and overlaps in split config.
 
     Both gaps and overlaps are classified by AI (with context) to decide:
       ignore / extend_prev / extend_next / new_chunk
     All-blank gaps are auto-ignored without AI.
 
+    span=(first, last) limits the expected coverage to those lines (1-indexed)
+    instead of the whole file, for splits covering one chunk.
+
     Returns (config, num_fixes).
     """
     splits = config.get('splits', [])
@@ -739,6 +752,7 @@ def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None)
 
     splits.sort(key=lambda s: s.get('start', 0))
     total = len(lines)
+    first_line, last_line = span or (1, total)
     num_fixes = 0
     issue_counter = 0
 
@@ -748,7 +762,7 @@ def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None)
     for idx in range(len(splits)):
         s = splits[idx]
         start = s.get('start', 0)
-        expected = 1 if idx == 0 else splits[idx - 1].get('end', 0) + 1
+        expected = first_line if idx == 0 else splits[idx - 1].get('end', 0) + 1
 
         if start > expected:
             # Gap
@@ -780,13 +794,13 @@ def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None)
     # Check trailing gap
     if splits:
         last_end = splits[-1].get('end', 0)
-        if last_end < total:
+        if last_end < last_line:
             issue_counter += 1
             all_issues.append({
                 "id": issue_counter,
                 "type": "gap",
                 "start": last_end + 1,
-                "end": total,
+                "end": last_line,
                 "split_idx": len(splits),  # after last split
                 "prev_split_idx": len(splits) - 1,
                 "next_split_idx": None,
@@ -928,7 +942,7 @@ def fix_gaps_and_overlaps(config, lines, client=None, model=None, filename=None)
     return config, num_fixes
 
 
-def _run_refine(client, model, _config_dir, docs_dir, config_files, workers=1):
+def _run_refine(client, model, _config_dir, docs_dir, config_files, workers=1, local=True):
     """Refine configs: fix gaps/overlaps first, then sub-split oversized chunks.
     Runs iteratively until all chunks are within MAX_CHUNK_LINES."""
     counter = {'refined': 0, 'errors': 0, 'done': 0}
@@ -943,76 +957,77 @@ def _run_refine(client, model, _config_dir, docs_dir, config_files, workers=1):
         print(f"\n[{n}/{total}] Refining: {config_path.name}")
         file_start = time.time()
 
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-
-            raw_path = docs_dir / config['source_file']
-            if not raw_path.exists():
-                print(f"  Warning: Source file not found: {raw_path}")
-                return
-
-            file_content = raw_path.read_text(encoding='utf-8', errors='replace')
-            lines = file_content.splitlines(keepends=True)
-            total_lines = len(lines)
-
-            iteration = 0
-            max_iterations = 5
-            while iteration < max_iterations:
-                iteration += 1
-                if iteration > 1:
-                    print(f"  --- Pass {iteration} ---")
-
-                config, gap_fixes = fix_gaps_and_overlaps(
-                    config, lines, client=client, model=model,
-                    filename=config['source_file'])
-                if gap_fixes:
-                    print(f"  Fixed {gap_fixes} gaps/overlaps")
-
-                config, num_refined = refine_config(client, model, config, docs_dir,
-                                                     verbose=True)
-                if num_refined:
-                    with counter_lock:
-                        counter['refined'] += num_refined
-
-                if gap_fixes == 0 and num_refined == 0:
-                    break
-
-            marked = 0
-            for s in config.get('splits', []):
-                if (not s.get('ignore', False)
-                        and not s.get('no_refine', False)
-                        and (s.get('end', 0) - s.get('start', 0) + 1) > MAX_CHUNK_LINES):
-                    s['no_refine'] = True
-                    marked += 1
-            if marked:
-                print(f"  Marked {marked} chunks as no_refine (cannot split further)")
-
-            norm_fixed = normalize_ignored(config)
-            if norm_fixed:
-                print(f"  Fixed {norm_fixed} entries missing ignore flag")
-
-            validation_errors = validate_config(config, total_lines)
-            if validation_errors:
-                config['warnings'] = validation_errors
-                print(f"  Validation warnings after refine:")
-                for err in validation_errors:
-                    print(f"    - {err}")
-            else:
-                config.pop('warnings', None)
+        with telemetry.file_context(config_path.name):
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+
+                raw_path = docs_dir / config['source_file']
+                if not raw_path.exists():
+                    print(f"  Warning: Source file not found: {raw_path}")
+                    return
+
+                file_content = raw_path.read_text(encoding='utf-8', errors='replace')
+                lines = file_content.splitlines(keepends=True)
+                total_lines = len(lines)
+
+                iteration = 0
+                max_iterations = 5
+                while iteration < max_iterations:
+                    iteration += 1
+                    if iteration > 1:
+                        print(f"  --- Pass {iteration} ---")
+
+                    config, gap_fixes = fix_gaps_and_overlaps(
+                        config, lines, client=client, model=model,
+                        filename=config['source_file'])
+                    if gap_fixes:
+                        print(f"  Fixed {gap_fixes} gaps/overlaps")
+
+                    config, num_refined = refine_config(client, model, config, docs_dir,
+                                                         verbose=True, local=local)
+                    if num_refined:
+                        with counter_lock:
+                            counter['refined'] += num_refined
+
+                    if gap_fixes == 0 and num_refined == 0:
+                        break
+
+                marked = 0
+                for s in config.get('splits', []):
+                    if (not s.get('ignore', False)
+                            and not s.get('no_refine', False)
+                            and (s.get('end', 0) - s.get('start', 0) + 1) > MAX_CHUNK_LINES):
+                        s['no_refine'] = True
+                        marked += 1
+                if marked:
+                    print(f"  Marked {marked} chunks as no_refine (cannot split further)")
+
+                norm_fixed = normalize_ignored(config)
+                if norm_fixed:
+                    print(f"  Fixed {norm_fixed} entries missing ignore flag")
+
+                validation_errors = validate_config(config, total_lines)
+                if validation_errors:
+                    config['warnings'] = validation_errors
+                    print(f"  Validation warnings after refine:")
+                    for err in validation_errors:
+                        print(f"    - {err}")
+                else:
+                    config.pop('warnings', None)
 
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-                f.write('\n')
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=2, ensure_ascii=False)
+                    f.write('\n')
 
-            num_splits = len([s for s in config.get('splits', []) if not s.get('ignore')])
-            file_elapsed = time.time() - file_start
-            print(f"  Result: {num_splits} total chunks in {_fmt_elapsed(file_elapsed)}")
+                num_splits = len([s for s in config.get('splits', []) if not s.get('ignore')])
+                file_elapsed = time.time() - file_start
+                print(f"  Result: {num_splits} total chunks in {_fmt_elapsed(file_elapsed)}")
 
-        except Exception as e:
-            with counter_lock:
-                counter['errors'] += 1
-            print(f"  ERROR: {e}")
+            except Exception as e:
+                with counter_lock:
+                    counter['errors'] += 1
+                print(f"  ERROR: {e}")
 
     if workers > 1:
         print(f"Refining with {workers} workers...")
@@ -1039,6 +1054,7 @@ def main():
     force = '--force' in sys.argv
     process_all = '--all' in sys.argv
     refine_mode = '--refine' in sys.argv
+    local = '--no-local' not in sys.argv
     model = 'gpt-5-mini'
 
     if '--model' in sys.argv:
@@ -1051,7 +1067,7 @@ def main():
         workers = int(sys.argv[idx + 1])
 
     # Collect positional args
-    skip_flags = {'--force', '--all', '--model', '--refine', '--workers'}
+    skip_flags = {'--force', '--all', '--model', '--refine', '--workers', '--no-local'}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
@@ -1070,7 +1086,9 @@ def main():
         print("Error: OPENAI_API_KEY environment variable not set")
         sys.exit(1)
 
-    client = OpenAI(api_key=api_key)
+    # Shared rate limiter: windows and workers are paced by the account's
+    # RPM/TPM limits instead of fixed sleeps
+    client = LLMGateway(api_key)
 
     # --- REFINE MODE ---
     if refine_mode:
@@ -1113,9 +1131,12 @@ def main():
 
             print(f"Found {len(config_files)} configs to refine")
 
-        refined, errors = _run_refine(client, model, config_dir, docs_dir, config_files, workers=workers)
+        refined, errors = _run_refine(client, model, config_dir, docs_dir, config_files,
+                                      workers=workers, local=local)
         print(f"\n{'='*50}")
         print(f"Refined {refined} oversized chunks, {errors} errors")
+        print(client.summary())
+        client.close()
         sys.exit(0)
 
     # --- NORMAL GENERATE MODE ---
@@ -1175,52 +1196,53 @@ def main():
         print(f"\n[{n}/{len(doc_files)}] Processing: {doc_path.name}")
         file_start = time.time()
 
-        try:
-            content = doc_path.read_text(encoding='utf-8', errors='replace')
-            total_lines = len(content.splitlines())
-            print(f"    {total_lines} lines")
-
-            config = split_document(client, model, doc_path.name, content, total_lines)
-
-            config['source_md5'] = md5_content(content)
+        with telemetry.file_context(doc_path.name):
+            try:
+                content = doc_path.read_text(encoding='utf-8', errors='replace')
+                total_lines = len(content.splitlines())
+                print(f"    {total_lines} lines")
 
-            norm_fixed = normalize_ignored(config)
-            if norm_fixed:
-                print(f"    Fixed {norm_fixed} entries missing ignore flag")
+                config = split_document(client, model, doc_path.name, content, total_lines)
 
-            validation_errors = validate_config(config, total_lines)
-            if validation_errors:
-                config['warnings'] = validation_errors
-                print(f"    Validation warnings:")
-                for err in validation_errors:
-                    print(f"      - {err}")
-            else:
-                config.pop('warnings', None)
-
-            config_path = config_dir / f"{doc_path.stem}.json"
-            with open(config_path, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=2, ensure_ascii=False)
-                f.write('\n')
+                config['source_md5'] = md5_content(content)
 
-            num_splits = len([s for s in config.get('splits', []) if not s.get('ignore')])
-            num_ignored = len([s for s in config.get('splits', []) if s.get('ignore')])
-            file_elapsed = time.time() - file_start
-            print(f"    Created: {config_path.name} ({num_splits} chunks, {num_ignored} ignored) in {_fmt_elapsed(file_elapsed)}")
+                norm_fixed = normalize_ignored(config)
+                if norm_fixed:
+                    print(f"    Fixed {norm_fixed} entries missing ignore flag")
 
-            with counter_lock:
-                counter['processed'] += 1
-                has_oversized = any(
-                    not s.get('ignore', False)
-                    and (s.get('end', 0) - s.get('start', 0) + 1) > MAX_CHUNK_LINES
-                    for s in config.get('splits', [])
-                )
-                if has_oversized:
-                    configs_to_refine.append(config_path)
-
-        except Exception as e:
-            with counter_lock:
-                counter['errors'] += 1
-            print(f"    ERROR: {e}")
+                validation_errors = validate_config(config, total_lines)
+                if validation_errors:
+                    config['warnings'] = validation_errors
+                    print(f"    Validation warnings:")
+                    for err in validation_errors:
+                        print(f"      - {err}")
+                else:
+                    config.pop('warnings', None)
+
+                config_path = config_dir / f"{doc_path.stem}.json"
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=2, ensure_ascii=False)
+                    f.write('\n')
+
+                num_splits = len([s for s in config.get('splits', []) if not s.get('ignore')])
+                num_ignored = len([s for s in config.get('splits', []) if s.get('ignore')])
+                file_elapsed = time.time() - file_start
+                print(f"    Created: {config_path.name} ({num_splits} chunks, {num_ignored} ignored) in {_fmt_elapsed(file_elapsed)}")
+
+                with counter_lock:
+                    counter['processed'] += 1
+                    has_oversized = any(
+                        not s.get('ignore', False)
+                        and (s.get('end', 0) - s.get('start', 0) + 1) > MAX_CHUNK_LINES
+                        for s in config.get('splits', [])
+                    )
+                    if has_oversized:
+                        configs_to_refine.append(config_path)
+
+            except Exception as e:
+                with counter_lock:
+                    counter['errors'] += 1
+                print(f"    ERROR: {e}")
 
     if workers > 1:
         print(f"Processing with {workers} workers...")
@@ -1238,7 +1260,8 @@ def main():
         print(f"\n{'='*50}")
         print(f"Auto-refining {len(configs_to_refine)} configs with oversized chunks...")
         refined_total, refine_errors = _run_refine(client, model, config_dir,
-                                                    docs_dir, configs_to_refine, workers=workers)
+                                                    docs_dir, configs_to_refine, workers=workers,
+                                                    local=local)
         counter['errors'] += refine_errors
 
     # Summary
@@ -1248,6 +1271,8 @@ def main():
     if refined_total:
         print(f"Auto-refined: {refined_total} oversized chunks")
     print(f"Total time: {_fmt_elapsed(total_run_time)}")
+    print(client.summary())
+    client.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,218 @@
+"""
+OpenAI Batch API runner for the bulk LLM stages (--batch).
+
+A full rebuild does not need interactive latency. Instead of crawling
+thousands of chunks through a thread pool, run_batch() writes every request
+to one JSONL file, uploads it, submits it as a single batch job (24h window,
+half the per-token price, its own much larger rate limits), polls until it
+finishes and hands back one parsed ChatCompletion per request. The calling
+script then applies each reply through the same code path, and the same
+MD5 cache records, as an interactive run.
+
+Job state lives in training/batches/<stage>.json from submission until the
+results are collected, so an interrupted run (Ctrl-C, a closed laptop)
+resumes polling the same job on the next --batch run rather than paying for
+it twice. Each request carries the MD5 of its input at submission time; a
+reply is only returned if that input is still current, so results for
+files that changed while the job ran are dropped and resubmitted. Requests
+the resumed job did not cover, or that failed in it, go out as a new job.
+
+The batch endpoints are plain OpenAI API calls, so OPENAI_BASE_URL can point
+them at fake_services.py, which implements /v1/files and /v1/batches with
+files kept on disk — a full --batch run then works offline.
+
+Polling interval is POLL_SECONDS (30s; BATCH_POLL_SECONDS overrides it, e.g.
+0.5 against fake_services).
+
+Each reply (and each failed request) is recorded as a telemetry span of
+kind batch, so telemetry.py report counts it at batch pricing.
+
+Usage (from a pipeline script):
+    replies, errors = run_batch("clean", [(key, md5, create_kwargs), ...], api_key)
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from llm_gateway import model_price
+from pipeline_cache import atomic_write_json
+import telemetry
+
+if TYPE_CHECKING:  # openai is imported on use (see llm_gateway)
+    from openai import OpenAI
+
+BATCH_DIR = Path(__file__).parent.parent / "batches"
+POLL_SECONDS = float(os.environ.get("BATCH_POLL_SECONDS") or 30)
+BATCH_DISCOUNT = 0.5   # Batch API price relative to interactive
+ENDPOINT = "/v1/chat/completions"
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+def _submit(client: "OpenAI", stage: str, requests: list[tuple[str, str, dict]]) -> dict:
+    """Write the request JSONL, upload it and create the batch. Returns the job state."""
+    BATCH_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    input_path = BATCH_DIR / f"{stage}-{stamp}-input.jsonl"
+    mapping = {}
+    with open(input_path, "w", encoding="utf-8") as f:
+        for i, (key, md5, body) in enumerate(requests):
+            custom_id = f"{stage}-{i}"
+            mapping[custom_id] = [key, md5]
+            f.write(json.dumps({"custom_id": custom_id, "method": "POST",
+                                "url": ENDPOINT, "body": body}, ensure_ascii=False) + "\n")
+
+    with open(input_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=uploaded.id, endpoint=ENDPOINT,
+                                  completion_window="24h", metadata={"stage": stage})
+    state = {"batch_id": batch.id, "input": input_path.name,
+             "submitted": time.time(), "requests": mapping}
+    atomic_write_json(BATCH_DIR / f"{stage}.json", state)
+    size_mb = input_path.stat().st_size / 1024 / 1024
+    print(f"Batch {batch.id}: submitted {len(requests)} requests ({size_mb:.1f} MB, {input_path.name})")
+    return state
+
+
+def _wait(client: "OpenAI", batch_id: str, poll_seconds: float):
+    """Poll a batch until it reaches a terminal status. Returns the batch object."""
+    last = None
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = (batch.status, counts.completed, counts.failed) if counts else (batch.status,)
+        if progress != last:
+            done = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+            print(f"Batch {batch_id}: {batch.status}{done}", flush=True)
+            last = progress
+        if batch.status in TERMINAL:
+            return batch
+        time.sleep(poll_seconds)
+
+
+def _collect(client: "OpenAI", stage: str, state: dict, poll_seconds: float) -> tuple[dict, dict]:
+    """Wait for a submitted job and parse its output.
+
+    Returns ({custom_id: ChatCompletion}, {custom_id: error message}). The
+    job's state file is removed once its results have been read.
+    """
+    from openai.types.chat import ChatCompletion
+
+    batch_id = state["batch_id"]
+    try:
+        batch = _wait(client, batch_id, poll_seconds)
+    except KeyboardInterrupt:
+        print(f"\nBatch {batch_id} is still running; rerun with --batch to collect it.")
+        raise
+
+    replies, errors = {}, {}
+    for file_id, kind in ((batch.output_file_id, "output"), (batch.error_file_id, "errors")):
+        if not file_id:
+            continue
+        text = client.files.content(file_id).text
+        (BATCH_DIR / f"{stage}-{batch_id}-{kind}.jsonl").write_text(text, encoding="utf-8")
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            custom_id = entry.get("custom_id")
+            response = entry.get("response") or {}
+            if response.get("status_code") == 200 and not entry.get("error"):
+                replies[custom_id] = ChatCompletion.model_validate(response["body"])
+            else:
+                error = entry.get("error") or (response.get("body") or {}).get("error") or response
+                errors[custom_id] = str(error.get("message", error) if isinstance(error, dict) else error)
+
+    for custom_id in state["requests"]:
+        if custom_id not in replies and custom_id not in errors:
+            errors[custom_id] = f"no result (batch {batch.status})"
+    (BATCH_DIR / f"{stage}.json").unlink(missing_ok=True)
+    return replies, errors
+
+
+def batch_usage(replies: dict) -> tuple[int, int, float | None]:
+    """(prompt tokens, completion tokens, USD at batch pricing or None) of batch replies."""
+    prompt = completion = 0
+    cost = None
+    for response in replies.values():
+        usage = response.usage
+        if usage is None:
+            continue
+        prompt += usage.prompt_tokens
+        completion += usage.completion_tokens
+        price = model_price(response.model or "")
+        if price is not None:
+            cost = (cost or 0.0) + BATCH_DISCOUNT * (
+                usage.prompt_tokens * price[0] + usage.completion_tokens * price[1]) / 1e6
+    return prompt, completion, cost
+
+
+def _usage_line(replies: dict) -> str:
+    prompt, completion, cost = batch_usage(replies)
+    line = (f"Batch API: {len(replies)} replies, {prompt + completion:,} tokens"
+            f" ({prompt:,} in, {completion:,} out)")
+    if cost is not None:
+        line += f", ~${cost:.2f} at batch pricing"
+    return line
+
+
+def run_batch(stage: str, requests: list[tuple[str, str, dict]], api_key: str | None,
+              poll_seconds: float = POLL_SECONDS) -> tuple[dict, dict]:
+    """Run chat requests through the Batch API.
+
+    requests: (key, input_md5, chat.completions.create kwargs) per item.
+    Returns ({key: ChatCompletion}, {key: error message}) for items whose
+    input md5 still matches; replies for stale inputs are discarded.
+    """
+    from openai import OpenAI
+
+    client = OpenAI(api_key=api_key)
+    current = {key: md5 for key, md5, _ in requests}
+    replies, errors = {}, {}
+    timing = {}  # key -> (submitted, turnaround) of the job that answered it
+
+    def merge(state, batch_replies, batch_errors):
+        stale = 0
+        collected = time.time()
+        for custom_id, (key, md5) in state["requests"].items():
+            if current.get(key) != md5:
+                stale += 1  # up to date already, or changed since submission
+                continue
+            if custom_id in batch_replies:
+                replies[key] = batch_replies[custom_id]
+                errors.pop(key, None)
+            else:
+                errors[key] = batch_errors.get(custom_id, "no result")
+            timing[key] = (state["submitted"], collected - state["submitted"])
+        if stale:
+            print(f"Batch {state['batch_id']}: {stale} replies skipped (input changed or already applied)")
+
+    try:
+        state_path = BATCH_DIR / f"{stage}.json"
+        if state_path.exists():
+            state = json.loads(state_path.read_text())
+            age = (time.time() - state["submitted"]) / 60
+            print(f"Resuming batch {state['batch_id']} ({len(state['requests'])} requests,"
+                  f" submitted {age:.0f} min ago)")
+            merge(state, *_collect(client, stage, state, poll_seconds))
+
+        remaining = [r for r in requests if r[0] not in replies]
+        if remaining:
+            state = _submit(client, stage, remaining)
+            merge(state, *_collect(client, stage, state, poll_seconds))
+    finally:
+        client.close()
+
+    for key, reply in replies.items():
+        usage = reply.usage
+        started, latency = timing[key]
+        telemetry.record("batch", file=key, model=reply.model, started=started, latency=latency,
+                         prompt_tokens=usage.prompt_tokens if usage else None,
+                         completion_tokens=usage.completion_tokens if usage else None)
+    for key in errors:
+        started, latency = timing[key]
+        telemetry.record("batch", file=key, status="error", started=started, latency=latency)
+    print(_usage_line(replies))
+    return replies, errors
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["blake3", "ijson", "openai", "requests"]
+# ///
+"""
+Stream static-analysis blocks.json into the knowledge base collection.
+
+static-analysis/ decomposes a binary into blocks.json: every code block
+(subroutine, irq_handler, fragment) with its disassembly and call edges,
+and every classified data region with its detector candidates. For a
+large disassembly project that file runs to many megabytes. import_qdrant
+--blocks ingests it into the same collection as training/data/, one point
+per code or data block (unknown regions are skipped), without loading it:
+
+  - iter_blocks() yields one block at a time: via ijson when it is
+    installed, else with json's raw_decode over a sliding read buffer
+    (_JsonStream), which holds one block plus a read chunk.
+  - A first pass collects only the (address, block) pairs of the code
+    blocks' data references, so data blocks can list who reads them.
+  - Blocks are embedded in BATCH_SIZE batches by a bounded worker window
+    (embedding store first, like data/ chunks) and upserted as they finish,
+    so memory stays flat however many blocks the file has.
+
+Each point's payload has the block's address interval (addr_ranges, so
+address tags in a query find the code at that address), labels and the
+hardware registers it touches as tags, its block type and reachability,
+and its edges: callers and callees (calledBy / callsOut addresses), data
+and hardware references, and for data blocks the blocks that reference
+them. Points are partitioned per binary: payload "binary" (a tenant keyword
+index) and point IDs from "<binary>/<block id>". Re-ingesting a binary
+tags its points with a new ingest_run and then deletes the ones left from
+the previous run; import_cache.json remembers the file's MD5 and path
+under "blocks:<binary>" so an unchanged file is skipped, and --cache-gc
+keeps the stored vectors of every recorded blocks.json (it skips the GC
+if one of those files is gone: re-run --blocks for it or --drop-binary).
+
+--force and --blue-green rebuild the collection from data/ and then
+reingest_binaries() imports every recorded binary again (its vectors replay
+from the store); a binary whose blocks.json is gone is reported instead,
+for a manual --blocks run.
+
+    uv run training/scripts/import_qdrant.py --blocks path/to/blocks.json            # binary = source name
+    uv run training/scripts/import_qdrant.py --blocks blocks.json --binary game --dry-run
+    uv run training/scripts/import_qdrant.py --drop-binary game                     # remove its points
+    python3 training/scripts/blocks_ingest.py path/to/blocks.json                   # parse only: block stats
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import resource
+import sys
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CODE_TYPES = ("subroutine", "irq_handler", "fragment")
+BLOCK_TYPES = CODE_TYPES + ("data",)  # "unknown" regions are not ingested
+MAX_EMBED_LINES = 60   # disassembly lines in the embed text (the payload keeps all)
+MAX_EDGES_SHOWN = 24   # addresses listed per edge kind in the document
+READ_CHUNK = 1 << 16
+CACHE_PREFIX = "blocks:"  # import_cache.json: "blocks:<binary>" -> {"md5", "path"} of its blocks.json
+
+
+class _JsonStream:
+    """Incremental reader for a JSON document too big to load: values are
+    decoded one at a time from a buffer refilled as they are consumed."""
+
+    def __init__(self, f, chunk: int = READ_CHUNK):
+        self.f = f
+        self.chunk = chunk
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _more(self) -> bool:
+        if self.eof:
+            return False
+        # Read at least as much as is pending, so a value bigger than the
+        # chunk is re-decoded a logarithmic number of times, not linear
+        data = self.f.read(max(self.chunk, len(self.buf) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ("" at the end)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"blocks.json: expected {char!r}, found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._more():
+                    continue
+                raise
+            if end == len(self.buf) and self._more():
+                continue  # a number at the buffer's end may go on in the next chunk
+            self.pos = end
+            return value
+
+    def items(self):
+        """Yield the elements of the array that starts here."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"blocks.json: expected ',' or ']' in array, found {separator!r}")
+
+    def seek(self, key: str) -> bool:
+        """Position at the value of a top-level key, skipping (streaming) the ones before it."""
+        self.expect("{")
+        while self.peek() not in ("}", ""):
+            name = self.value()
+            self.expect(":")
+            if name == key:
+                return True
+            if self.peek() == "[":
+                for _ in self.items():
+                    pass
+            else:
+                self.value()
+            if self.peek() == ",":
+                self.pos += 1
+        return False
+
+
+def read_metadata(path: Path) -> dict:
+    """The metadata object of a blocks.json (it comes first, so this reads little)."""
+    if ijson is not None:
+        with open(path, "rb") as f:
+            return next(ijson.items(f, "metadata", use_float=True), {})
+    with open(path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        return stream.value() if stream.seek("metadata") else {}
+
+
+def iter_blocks(path: Path):
+    """Yield the blocks of a blocks.json one at a time."""
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, "blocks.item", use_float=True)
+        return
+    with open(path, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        if stream.seek("blocks"):
+            yield from stream.items()
+
+
+def _addr(value) -> int:
+    """Addresses are ints in blocks, "0x..." strings in metadata."""
+    return int(value, 0) if isinstance(value, str) else int(value)
+
+
+def _hex(address: int) -> str:
+    return f"${address:04X}"
+
+
+def binary_name(path: Path, metadata: dict) -> str:
+    """Partition name: the analysed file's stem (metadata.source), else the directory's name."""
+    source = Path(metadata.get("source") or "").stem.lstrip(".")
+    name = source or path.resolve().parent.name
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name) or "binary"
+
+
+def collect_data_refs(path: Path) -> tuple[list[int], list[str]]:
+    """(sorted addresses, block ids): every data reference made by a code block."""
+    refs = []
+    for block in iter_blocks(path):
+        if block.get("type") in CODE_TYPES:
+            refs.extend((_addr(a), block["id"]) for a in block.get("dataRefs", []))
+    refs.sort()
+    return [a for a, _ in refs], [b for _, b in refs]
+
+
+def referenced_by(data_refs: tuple[list[int], list[str]], start: int, end: int) -> list[str]:
+    """Code blocks with a data reference into [start, end)."""
+    addresses, blocks = data_refs
+    lo, hi = bisect.bisect_left(addresses, start), bisect.bisect_left(addresses, end)
+    return sorted(set(blocks[lo:hi]))
+
+
+def _edge_line(label: str, addresses: list[int]) -> str:
+    shown = ", ".join(_hex(a) for a in addresses[:MAX_EDGES_SHOWN])
+    more = f" (+{len(addresses) - MAX_EDGES_SHOWN} more)" if len(addresses) > MAX_EDGES_SHOWN else ""
+    return f"- {label}: {shown}{more}"
+
+
+def block_item(block: dict, binary: str, data_refs: tuple[list[int], list[str]]) -> dict:
+    """Embed text, payload document and metadata for one block (cf. import_qdrant.prepare_item)."""
+    start, end = _addr(block["address"]), _addr(block["endAddress"])
+    block_type = block["type"]
+    labels = block.get("labels", [])
+    name = labels[0] if labels else block["id"]
+    callers = sorted({_addr(a) for a in block.get("calledBy", [])})
+    callees = sorted({_addr(a) for a in block.get("callsOut", [])})
+    reads = sorted({_addr(a) for a in block.get("dataRefs", [])})
+    hardware = sorted({_addr(a) for a in block.get("hardwareRefs", [])})
+    readers = referenced_by(data_refs, start, end) if block_type == "data" else []
+
+    title = f"{binary}: {name} ({block_type} at {_hex(start)}-{_hex(end - 1)})"
+    header = [f"# {title}", "",
+              f"- Block: {block['id']} ({block_type}, {block.get('reachability', 'unknown')}, {end - start} bytes)"]
+    if labels:
+        header.append(f"- Labels: {', '.join(labels)}")
+    if block.get("parentBlock"):
+        header.append(f"- Part {block.get('subBlockIndex', 0) + 1} of {block.get('subBlockCount', '?')}"
+                      f" of {block['parentBlock']}")
+    for label, addresses in (("Called from", callers), ("Calls", callees),
+                             ("Reads data at", reads), ("Hardware registers", hardware)):
+        if addresses:
+            header.append(_edge_line(label, addresses))
+    if readers:
+        header.append(f"- Referenced by: {', '.join(readers[:MAX_EDGES_SHOWN])}"
+                      f"{f' (+{len(readers) - MAX_EDGES_SHOWN} more)' if len(readers) > MAX_EDGES_SHOWN else ''}")
+
+    body = []
+    if block.get("comments"):
+        body += ["", "## Comments", ""] + [f"- {c}" for c in block["comments"]]
+    if block.get("annotations"):
+        body += ["", "## Annotations", ""] + [f"- {k}: {v}" for k, v in block["annotations"].items()]
+    candidates = block.get("candidates") or []
+    best = block.get("bestCandidate")
+    if best is not None and 0 <= best < len(candidates):
+        c = candidates[best]
+        kind = f"{c.get('type')} / {c['subtype']}" if c.get("subtype") else c.get("type")
+        body += ["", "## Data", "", f"- {kind} (detector {c.get('detector')}, confidence {c.get('confidence')})"]
+        if c.get("comment"):
+            body.append(f"- {c['comment']}")
+    disassembly = [f"{_hex(_addr(i['address']))}  {i['mnemonic'].upper()} {i.get('operand') or ''}".rstrip()
+                   + (f"  ; {i['label']}" if i.get("label") else "")
+                   for i in block.get("instructions", [])]
+
+    document = "\n".join(header + body)
+    embed_text = document
+    if disassembly:
+        document += "\n\n## Disassembly\n\n```asm\n" + "\n".join(disassembly) + "\n```\n"
+        shown = disassembly[:MAX_EMBED_LINES]
+        if len(disassembly) > MAX_EMBED_LINES:
+            shown.append(f"; ... {len(disassembly) - MAX_EMBED_LINES} more instructions")
+        embed_text += "\n\n## Disassembly\n\n" + "\n".join(shown)
+
+    tags = sorted(set(labels) | {_hex(a) for a in hardware})
+    metadata = {
+        "type": "block",
+        "binary": binary,
+        "block_id": block["id"],
+        "block_type": block_type,
+        "reachability": block.get("reachability"),
+        "title": title,
+        "addr_ranges": [{"start": start, "end": end - 1}],
+        "callers": callers,
+        "callees": callees,
+        "data_refs": reads,
+        "hardware_refs": hardware,
+    }
+    if tags:
+        metadata["tags"] = tags
+    if readers:
+        metadata["referenced_by"] = readers
+    if block.get("parentBlock"):
+        metadata["parent_block"] = block["parentBlock"]
+    return {
+        "filename": f"{binary}/{block['id']}",
+        "embed_text": embed_text,
+        "embed_hash": hashlib.md5(embed_text.encode()).hexdigest(),
+        "full_content": document,
+        "metadata": metadata,
+    }
+
+
+def iter_items(path: Path, binary: str, data_refs: tuple[list[int], list[str]]):
+    for block in iter_blocks(path):
+        if block.get("type") in BLOCK_TYPES:
+            yield block_item(block, binary, data_refs)
+
+
+def block_embed_hashes(path: Path, binary: str) -> set[str]:
+    """Embed hashes of a blocks.json's points: the stored vectors it uses."""
+    return {item["embed_hash"] for item in iter_items(path, binary, collect_data_refs(path))}
+
+
+def ingested_binaries(cache: dict) -> dict[str, dict]:
+    """binary -> {"md5", "path"} for the binaries recorded in import_cache.json
+    (path is None for entries written before paths were recorded)."""
+    return {key[len(CACHE_PREFIX):]: entry if isinstance(entry, dict) else {"md5": entry, "path": None}
+            for key, entry in cache.items() if key.startswith(CACHE_PREFIX)}
+
+
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak if sys.platform == "darwin" else peak * 1024) / 1024 / 1024
+
+
+def _binary_filter(binary: str, keep_run: str | None = None) -> dict:
+    flt = {"must": [{"key": "binary", "match": {"value": binary}}]}
+    if keep_run:
+        flt["must_not"] = [{"key": "ingest_run", "match": {"value": keep_run}}]
+    return flt
+
+
+def drop_binary(binary: str):
+    """Delete every point of a binary and forget its import_cache entry."""
+    import import_qdrant as q
+    target = q.qdrant_get_aliases().get(q.COLLECTION_NAME, q.COLLECTION_NAME)
+    r = q._qdrant.post(f"{q.QDRANT_URL}/collections/{target}/points/delete",
+                       json={"filter": _binary_filter(binary)})
+    r.raise_for_status()
+    cache = q.load_cache()
+    if cache.pop(CACHE_PREFIX + binary, None) is not None:
+        q.save_cache(cache)
+    print(f"Deleted the points of binary '{binary}' from '{target}'")
+
+
+def ingest_blocks(path: Path, binary: str | None = None, workers: int = 4,
+                  dry_run: bool = False, force: bool = False):
+    """Stream one blocks.json into the live collection (see module docstring)."""
+    import import_qdrant as q
+    from embedding_store import EmbeddingStore
+    from file_digests import FileDigests
+    from llm_gateway import LLMGateway
+
+    path = Path(path)
+    if not path.is_file():
+        print(f"Error: {path} not found")
+        sys.exit(1)
+    binary = binary or binary_name(path, read_metadata(path))
+    digests = FileDigests()
+    file_md5 = digests.md5(path)
+    digests.save()
+    cache_key = CACHE_PREFIX + binary
+    if not force and not dry_run and ingested_binaries(q.load_cache()).get(binary, {}).get("md5") == file_md5:
+        print(f"{path} ({binary}) unchanged since its last import — nothing to do")
+        return
+
+    start = time.time()
+    data_refs = collect_data_refs(path)
+    if dry_run:
+        counts = Counter(block.get("type") for block in iter_blocks(path))
+        ingested = sum(counts[t] for t in BLOCK_TYPES)
+        print(f"{path}: binary '{binary}', {sum(counts.values())} blocks"
+              f" ({', '.join(f'{n} {t}' for t, n in sorted(counts.items()))});"
+              f" {ingested} would be imported, {len(data_refs[0])} data references")
+        return
+
+    aliases = q.qdrant_get_aliases()
+    target = aliases.get(q.COLLECTION_NAME, q.COLLECTION_NAME)
+    if not q.qdrant_collection_exists(target):
+        q.qdrant_create_collection(target)
+    dims, _ = q.qdrant_vector_config(target)
+    # Tenant index: Qdrant co-locates each binary's points, and filters on it are cheap
+    r = q._qdrant.put(f"{q.QDRANT_URL}/collections/{target}/index",
+                      json={"field_name": "binary", "field_schema": {"type": "keyword", "is_tenant": True}})
+    r.raise_for_status()
+
+    store = EmbeddingStore()
+    api_key = os.environ.get("OPENAI_API_KEY")
+    client = LLMGateway(api_key) if api_key else None
+    run_id = time.strftime("%Y%m%d_%H%M%S")
+    counter = Counter()
+
+    def upsert(batch: list[dict], embeddings: list[list[float]]):
+        q.qdrant_upsert_points([{
+            "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, item["filename"])),
+            "vector": q.reduce_dims(embedding, dims),
+            "payload": {"document": item["full_content"], "filename": item["filename"],
+                        "ingest_run": run_id, **item["metadata"]},
+        } for item, embedding in zip(batch, embeddings)], target)
+        counter["blocks"] += len(batch)
+        counter["batches"] += 1
+        if counter["batches"] % 25 == 0:
+            print(f"  {counter['blocks']} blocks imported ({_peak_rss_mb():.0f} MB peak RSS)")
+
+    print(f"Importing {path} as binary '{binary}' into '{target}' ({dims}d) with {workers} workers...")
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in _batched(iter_items(path, binary, data_refs), q.BATCH_SIZE):
+                pending.append((batch, pool.submit(q.embed_batch_cached, client, store, batch)))
+                # Bounded window: at most 2 * workers batches in flight
+                while len(pending) >= workers * 2:
+                    done_batch, future = pending.popleft()
+                    embeddings, api_count = future.result()
+                    counter["api"] += api_count
+                    upsert(done_batch, embeddings)
+            while pending:
+                done_batch, future = pending.popleft()
+                embeddings, api_count = future.result()
+                counter["api"] += api_count
+                upsert(done_batch, embeddings)
+    finally:
+        store.close()
+        if client:
+            client.close()
+
+    # Points the previous import of this binary had and this one didn't
+    r = q._qdrant.post(f"{q.QDRANT_URL}/collections/{target}/points/delete",
+                       json={"filter": _binary_filter(binary, keep_run=run_id)})
+    r.raise_for_status()
+    cache = q.load_cache()
+    cache[cache_key] = {"md5": file_md5, "path": str(path.resolve())}
+    q.save_cache(cache)
+
+    print(f"\nImported {counter['blocks']} blocks of '{binary}' in {q._fmt_elapsed(time.time() - start)}"
+          f" ({counter['api']} embeddings requested from OpenAI, {counter['blocks'] - counter['api']} from store,"
+          f" {_peak_rss_mb():.0f} MB peak RSS)")
+    if client:
+        print(f"  {client.summary()}")
+
+
+def reingest_binaries(binaries: dict[str, dict], workers: int = 4):
+    """Import binaries (ingested_binaries() of the cache before a rebuild)
+    into the rebuilt collection."""
+    if binaries:
+        print(f"\nRe-importing {len(binaries)} binaries dropped by the rebuild: {', '.join(sorted(binaries))}")
+    for binary, entry in sorted(binaries.items()):
+        if not entry["path"] or not Path(entry["path"]).is_file():
+            print(f"Warning: the blocks.json of '{binary}' ({entry['path'] or 'path not recorded'}) is gone"
+                  f" — re-run --blocks for it")
+            continue
+        ingest_blocks(Path(entry["path"]), binary, workers)
+
+
+def main():
+    paths = [Path(a) for a in sys.argv[1:] if not a.startswith("-")]
+    if not paths:
+        print(__doc__)
+        sys.exit(1)
+    for path in paths:
+        start = time.perf_counter()
+        binary = binary_name(path, read_metadata(path))
+        data_refs = collect_data_refs(path)
+        counts = Counter()
+        chars = 0
+        for item in iter_items(path, binary, data_refs):
+            counts[item["metadata"]["block_type"]] += 1
+            chars += len(item["embed_text"])
+        total = sum(counts.values())
+        print(f"{path}: binary '{binary}', {total} blocks to import"
+              f" ({', '.join(f'{n} {t}' for t, n in sorted(counts.items()))}),"
+              f" {chars // max(total, 1)} embed chars per block;"
+              f" parsed in {time.perf_counter() - start:.2f}s"
+              f" ({'ijson' if ijson else 'stdlib stream'}), {_peak_rss_mb():.0f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
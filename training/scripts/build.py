@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["blake3", "openai", "requests"]
+# ///
+"""
+Incremental build driver for the training pipeline.
+
+Runs the pipeline stages as a dependency graph instead of by hand:
+
+    documents/*.txt ──→ auto_split ──→ split_config/*.json
+    documents/*.txt + split_config/*.json ──→ split ──→ split/*.txt
+    split/*.txt ──→ clean ──→ data/*.md
+    examples/*.asm ──→ document ──→ data/example_*.md
+    data/*.md ──→ import ──→ Qdrant points
+
+A stage runs only when the content hash of its input and output files
+differs from the last successful run (recorded in training/build_state.json);
+otherwise it is skipped without starting the script. Stages whose
+dependencies are done run concurrently (split/clean alongside document).
+Inside a stage the scripts' own MD5 caches keep the work per-file, so
+editing one split entry rewrites one chunk, re-cleans it and re-embeds one
+point.
+
+File hashes come from the shared stat-keyed memo (file_digests.py, keyed
+by size, mtime_ns and inode), so an up-to-date build only stats files, and
+the stage scripts reuse the hashes it took.
+
+Each stage script runs with `uv run` (so its PEP 723 dependencies are
+resolved, as when it is run by hand) when uv is on PATH, else with this
+interpreter, which then needs every stage's dependencies installed.
+
+Usage:
+    uv run training/scripts/build.py                 # Build whatever is stale
+    uv run training/scripts/build.py --dry-run       # Show which stages would run and why
+    uv run training/scripts/build.py --jobs 1        # Run stages one at a time (default: 2)
+    uv run training/scripts/build.py --force         # Run every stage, passing --force through
+    uv run training/scripts/build.py --no-import     # Stop before the Qdrant import
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from file_digests import FileDigests
+from pipeline_cache import atomic_write_json
+
+SCRIPT_DIR = Path(__file__).parent
+PROJECT_ROOT = SCRIPT_DIR.parent
+STATE_FILE = PROJECT_ROOT / 'build_state.json'
+
+
+class Stage:
+    """One pipeline step: a script, the stages it waits for, and the files it
+    reads and writes (glob patterns relative to training/)."""
+
+    def __init__(self, name, script, deps=(), inputs=(), outputs=(), exclude=(),
+                 args=None, force_flag=True):
+        self.name = name
+        self.script = script
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.exclude = list(exclude)
+        self.args = args  # callable returning extra argv, or None when there's nothing to do
+        self.force_flag = force_flag
+
+    def files(self):
+        """Every existing file matched by inputs/outputs, minus exclusions."""
+        excluded = set()
+        for pattern in self.exclude:
+            excluded.update(PROJECT_ROOT.glob(pattern))
+        found = set()
+        for pattern in self.inputs + self.outputs:
+            found.update(p for p in PROJECT_ROOT.glob(pattern) if p.is_file())
+        return sorted(found - excluded)
+
+
+def _unconfigured_documents():
+    """Documents without a split config: the only ones auto_split should see."""
+    config_dir = PROJECT_ROOT / 'split_config'
+    docs = [d.name for d in sorted((PROJECT_ROOT / 'documents').glob('*.txt'))
+            if not (config_dir / f"{d.stem}.json").exists()]
+    return docs or None
+
+
+STAGES = [
+    Stage('auto_split', 'auto_split.py',
+          inputs=['documents/*.txt'], outputs=['split_config/*.json'],
+          args=_unconfigured_documents, force_flag=False),
+    Stage('split', 'split_training.py', deps=['auto_split'],
+          inputs=['documents/*.txt', 'split_config/*.json'], outputs=['split/*.txt'],
+          force_flag=False),
+    Stage('clean', 'clean_chunks.py', deps=['split'],
+          inputs=['split/*.txt'], outputs=['data/*.md'], exclude=['data/example_*.md']),
+    Stage('document', 'document_examples.py',
+          inputs=['examples/**/*.asm'], outputs=['data/example_*.md']),
+    Stage('import', 'import_qdrant.py', deps=['clean', 'document'],
+          inputs=['data/*.md']),
+]
+
+
+def stage_digest(digests: FileDigests, stage: Stage) -> tuple[str, int]:
+    """Combined hash over a stage's files. Returns (digest, file_count)."""
+    h = hashlib.md5()
+    files = stage.files()
+    for path in files:
+        h.update(f"{path.relative_to(PROJECT_ROOT)}\0{digests.md5(path)}\n".encode('utf-8'))
+    return h.hexdigest(), len(files)
+
+
+def _fmt_elapsed(seconds):
+    """Format elapsed seconds as a human-readable string."""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes = int(seconds) // 60
+    secs = seconds - minutes * 60
+    return f"{minutes}m {secs:.0f}s"
+
+
+def run_script(stage: Stage, argv: list[str]) -> int:
+    """Run a stage's script, prefixing its output lines with the stage name."""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    uv = shutil.which('uv')
+    runner = [uv, 'run', '--quiet'] if uv else [sys.executable]
+    proc = subprocess.Popen(
+        [*runner, str(SCRIPT_DIR / stage.script), *argv],
+        cwd=PROJECT_ROOT.parent, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+    )
+    for line in proc.stdout:
+        print(f"[{stage.name}] {line.rstrip()}", flush=True)
+    return proc.wait()
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv
+    force = '--force' in sys.argv
+    no_import = '--no-import' in sys.argv
+
+    jobs = 2
+    if '--jobs' in sys.argv:
+        idx = sys.argv.index('--jobs')
+        jobs = max(1, int(sys.argv[idx + 1]))
+
+    stages = [s for s in STAGES if not (no_import and s.name == 'import')]
+    names = {s.name for s in stages}
+    for s in stages:
+        s.deps = [d for d in s.deps if d in names]
+
+    state = {}
+    if STATE_FILE.exists():
+        state = json.loads(STATE_FILE.read_text())
+    stamps = state.setdefault('stages', {})
+    state.pop('files', None)  # per-file hashes moved to file_digests.json
+    digests = FileDigests()
+    state_lock = threading.Lock()
+
+    report = {}  # name -> (status, elapsed, detail)
+
+    def run_stage(stage: Stage):
+        """Decide whether the stage is stale, run it if so. Returns (status, elapsed, detail)."""
+        start = time.time()
+        argv = []
+        if stage.args is not None:
+            # The stage decides staleness itself (e.g. documents without a config)
+            extra = stage.args()
+            if extra is None:
+                return 'up to date', time.time() - start, 'nothing to do'
+            argv.extend(extra)
+            reason = f"{len(extra)} new inputs"
+        else:
+            before, count = stage_digest(digests, stage)
+            previous = stamps.get(stage.name, {}).get('digest')
+            upstream = [d for d in stage.deps if report[d][0] == 'would run']
+            if not force and before == previous and not upstream:
+                return 'up to date', time.time() - start, f"{count} files unchanged"
+            if force:
+                reason = 'forced'
+            elif before != previous:
+                reason = 'first run' if previous is None else f"inputs changed ({count} files tracked)"
+            else:
+                reason = f"after {', '.join(upstream)}"
+
+        if dry_run:
+            return 'would run', 0.0, reason
+
+        if force and stage.force_flag:
+            argv.append('--force')
+        print(f"[{stage.name}] running {' '.join([stage.script, *argv])} ({reason})", flush=True)
+        code = run_script(stage, argv)
+        elapsed = time.time() - start
+        if code != 0:
+            return 'failed', elapsed, f"exit code {code}"
+
+        # Stamp with the post-run hash so the stage's own outputs count as current
+        after, _ = stage_digest(digests, stage)
+        with state_lock:
+            stamps[stage.name] = {'digest': after, 'finished': time.time(), 'elapsed': round(elapsed, 2)}
+            atomic_write_json(STATE_FILE, state)
+        digests.save()
+        return 'ran', elapsed, reason
+
+    build_start = time.time()
+    pending = {s.name: s for s in stages}
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(report.get(d, ('',))[0] in ('failed', 'blocked') for d in stage.deps):
+                    report[name] = ('blocked', 0.0, 'dependency failed')
+                    del pending[name]
+                elif all(d in report for d in stage.deps) and len(running) < jobs:
+                    running[pool.submit(run_stage, stage)] = name
+                    del pending[name]
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                report[running.pop(future)] = future.result()
+
+    digests.save()
+
+    total = time.time() - build_start
+    print(f"\n{'='*50}")
+    print(f"{'Stage':<12} {'Status':<12} {'Time':>8}  Detail")
+    for s in stages:
+        status, elapsed, detail = report[s.name]
+        print(f"{s.name:<12} {status:<12} {_fmt_elapsed(elapsed):>8}  {detail}")
+    stage_sum = sum(r[1] for r in report.values())
+    print(f"Total: {_fmt_elapsed(total)} wall, {_fmt_elapsed(stage_sum)} in stages"
+          f" ({digests.hashed} files hashed, jobs={jobs})")
+    if dry_run:
+        print("(dry run - nothing was executed)")
+
+    if any(r[0] in ('failed', 'blocked') for r in report.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
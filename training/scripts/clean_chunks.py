@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 # /// script
-# dependencies = ["openai"]
+# dependencies = ["blake3", "openai"]
 # ///
 """
 Clean training chunks using OpenAI API.
 
 Reads raw .txt chunks from training/split/, sends each to OpenAI for
 cleaning and reformatting as Markdown, writes results to training/data/.
-Tracks MD5 hashes in parsed_sources.json to skip unchanged files.
+Tracks MD5 hashes in parsed_sources.json to skip unchanged files; chunk
+hashes come from split_manifest.json (written by split_training.py) when a
+chunk's size and mtime show it hasn't been touched since, else from the
+stat-keyed file digests (file_digests.py), so only changed chunks are read.
 
 Usage:
     uv run scripts/clean_chunks.py                  # Process all chunks
@@ -18,18 +21,43 @@ Usage:
     uv run scripts/clean_chunks.py --workers 8          # Process 8 chunks concurrently (default: 4)
     uv run scripts/clean_chunks.py --shrink              # Shrink .md files in training/data/ over 6KB
     uv run scripts/clean_chunks.py --shrink --threshold 4096  # Custom size threshold
+    uv run scripts/clean_chunks.py --pack               # Pack small chunks into shared requests
+    uv run scripts/clean_chunks.py --pack --token-budget 12000
+    uv run scripts/clean_chunks.py --batch --force      # Full rebuild as one Batch API job
+    uv run scripts/clean_chunks.py --no-prefetch        # Don't inline predicted references
+
+Packed mode (see request_packing.py) sends several chunks per request as a
+JSON array. A slot that comes back malformed, or asks for a NEED_REFERENCE
+follow-up, is retried as a normal single request.
+
+Batch mode (see batch_runner.py) submits every stale chunk as one Batch API
+job, waits for it and applies the replies through the same cache records.
+A NEED_REFERENCE reply gets only its follow-up turn as an interactive
+request (the batch reply and the referenced chunk appended to the first
+round); any other unusable reply is redone from scratch.
+
+Reference prefetch (see reference_plan.py): chunks that are expected to
+answer NEED_REFERENCE (they did last time, or a declared reference
+continues them) get the referenced chunk inlined in their first request,
+as if the follow-up had already happened. Referenced chunks are cleaned
+first, and a neighbour whose cleaned .md is up to date is inlined in that
+form rather than as raw text. Prefetched chunks are never packed.
 """
 
-import hashlib
 import json
 import os
 import sys
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from openai import OpenAI
+from batch_runner import batch_usage, run_batch
+from file_digests import FileDigests
+from llm_gateway import LLMGateway
+from pipeline_cache import PipelineCache
+from reference_plan import load_reference_graph, order_by_references, plan_prefetch
+from request_packing import DEFAULT_BUDGET, ModeReport, plan_packs, request_pack
+import telemetry
 
 def _fmt_response(response):
     """Format a one-line summary of an OpenAI API response."""
@@ -177,63 +205,165 @@ Rules:
 """
 
 
-def md5_file(path):
-    """Compute MD5 hash of a file's contents."""
-    return hashlib.md5(path.read_bytes()).hexdigest()
+def load_split_manifest(manifest_path):
+    """Chunk md5s recorded by split_training.py, keyed by chunk filename."""
+    if manifest_path.exists():
+        try:
+            return json.loads(manifest_path.read_text()).get('chunks', {})
+        except json.JSONDecodeError:
+            pass
+    return {}
 
 
-def load_cache(cache_path):
-    """Load the parsed_sources.json cache."""
-    if cache_path.exists():
-        with open(cache_path, 'r') as f:
-            return json.load(f)
-    return {"chunks": {}, "examples": {}}
+def _manifest_md5(chunk_path, manifest):
+    """The split manifest's md5 for a chunk whose size and mtime still match
+    what split_training.py wrote, else None."""
+    entry = manifest.get(chunk_path.name)
+    if entry:
+        st = chunk_path.stat()
+        if st.st_size == entry['size'] and st.st_mtime_ns == entry['mtime_ns']:
+            return entry['md5']
+    return None
 
 
-def save_cache(cache_path, cache):
-    """Save the parsed_sources.json cache."""
-    with open(cache_path, 'w') as f:
-        json.dump(cache, f, indent=2)
-        f.write('\n')
+def chunk_md5(chunk_path, manifest, digests):
+    """MD5 of a chunk: from the split manifest, else from the file digests."""
+    return _manifest_md5(chunk_path, manifest) or digests.md5(chunk_path)
 
 
-def clean_chunk(client, model, chunk_content, split_dir):
-    """Send a chunk to OpenAI for cleaning. Returns (cleaned_markdown, ref_name, response_info).
+def chunk_md5s(chunk_paths, manifest, digests):
+    """MD5s of many chunks, in order. Returns (md5s, from_manifest)."""
+    md5s = [_manifest_md5(cp, manifest) for cp in chunk_paths]
+    rest = [i for i, md5 in enumerate(md5s) if md5 is None]
+    for i, md5 in zip(rest, digests.md5_many([chunk_paths[i] for i in rest])):
+        md5s[i] = md5
+    return md5s, len(chunk_paths) - len(rest)
+
+
+REF_SENTINEL = 'NEED_REFERENCE:'
+
+
+def reference_message(ref_name, ref_content):
+    """User message answering a NEED_REFERENCE request."""
+    return {
+        "role": "user",
+        "content": (
+            f"Here is the referenced chunk '{ref_name}':\n\n{ref_content}\n\n"
+            f"Now produce the cleaned markdown for the original chunk."
+        ),
+    }
 
-    If GPT responds with NEED_REFERENCE: chunk_name, loads that chunk
-    from split_dir and sends a follow-up message with the reference content.
+
+def clean_messages(chunk_content, reference=None):
+    """First-round messages for cleaning one chunk.
+
+    reference is (name, content) of a prefetched neighbour: it is sent as
+    the NEED_REFERENCE exchange the model would otherwise ask for.
     """
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": chunk_content},
     ]
+    if reference is not None:
+        ref_name, ref_content = reference
+        messages.append({"role": "assistant", "content": f"{REF_SENTINEL} {ref_name}"})
+        messages.append(reference_message(ref_name, ref_content))
+    return messages
+
+
+class StrippedWriter:
+    """Write streamed text to a file as result.strip() would leave it:
+    leading whitespace is dropped, trailing whitespace held back until
+    more text follows it."""
+
+    def __init__(self, out):
+        self.out = out
+        self.started = False
+        self.pending = ''
+
+    def write(self, text):
+        if not self.started:
+            text = text.lstrip()
+            if not text:
+                return
+            self.started = True
+        text = self.pending + text
+        body = text.rstrip()
+        self.out.write(body)
+        self.pending = text[len(body):]
+
+
+def stream_reply(client, model, messages, out=None):
+    """Stream one completion. Returns (result, ref_name, stream).
+
+    The first characters decide what the reply is: a NEED_REFERENCE reply
+    is cut off as soon as its name line is complete (ref_name is set);
+    anything else is written to out as it arrives.
+    """
+    writer = StrippedWriter(out) if out is not None else None
+    decided = is_ref = False
+    with client.chat.completions.stream(model=model, messages=messages) as stream:
+        for delta in stream:
+            if not decided:
+                head = stream.text.lstrip()
+                if len(head) < len(REF_SENTINEL) and REF_SENTINEL.startswith(head):
+                    continue  # Could still be the sentinel
+                decided = True
+                is_ref = head.startswith(REF_SENTINEL)
+                delta = stream.text  # Flush what was held back
+            if is_ref:
+                if '\n' in stream.text.lstrip()[len(REF_SENTINEL):].lstrip():
+                    break  # Name line complete: the rest is not needed
+            elif writer:
+                writer.write(delta)
+        if not decided and writer:
+            writer.write(stream.text)  # Reply shorter than the sentinel
+
+    result = stream.text.strip()
+    if is_ref:
+        ref_name = requested_reference(result)
+        return f"{REF_SENTINEL} {ref_name}", ref_name, stream
+    return result, None, stream
+
+
+def requested_reference(result):
+    """The chunk name a NEED_REFERENCE reply asks for, or None for any other reply."""
+    if not result.startswith(REF_SENTINEL):
+        return None
+    return result[len(REF_SENTINEL):].strip().split('\n', 1)[0].strip()
+
+
+def clean_chunk(client, model, chunk_content, split_dir, out=None, reference=None, first_reply=None):
+    """Send a chunk to OpenAI for cleaning. Returns (cleaned_markdown, ref_name, response_info).
 
-    response = client.chat.completions.create(
-        model=model, messages=messages,
-    )
-    result = response.choices[0].message.content.strip()
+    The reply is streamed, and written to out (an open text file) as it
+    arrives. If GPT responds with NEED_REFERENCE: chunk_name, that is
+    spotted from the first tokens: the stream is dropped, the chunk is
+    loaded from split_dir and a follow-up message with the reference
+    content is sent straight away. ref_name is only set for such a
+    follow-up; reference (name, content) is inlined up front instead.
+    first_reply is a NEED_REFERENCE reply the first round already got (from
+    a batch job): only the follow-up is sent.
+    """
+    messages = clean_messages(chunk_content, reference)
+
+    if first_reply is not None:
+        ref_name = requested_reference(first_reply)
+        result, stream = f"{REF_SENTINEL} {ref_name}", None
+    else:
+        result, ref_name, stream = stream_reply(client, model, messages, out)
 
     # Check if GPT requested a reference
-    if result.startswith('NEED_REFERENCE:'):
-        ref_name = result.split(':', 1)[1].strip()
+    if ref_name is not None:
         ref_path = split_dir / f"{ref_name}.txt"
 
         if ref_path.exists():
             ref_content = ref_path.read_text(encoding='utf-8', errors='replace')
             messages.append({"role": "assistant", "content": result})
-            messages.append({
-                "role": "user",
-                "content": (
-                    f"Here is the referenced chunk '{ref_name}':\n\n{ref_content}\n\n"
-                    f"Now produce the cleaned markdown for the original chunk."
-                ),
-            })
+            messages.append(reference_message(ref_name, ref_content))
 
-            response = client.chat.completions.create(
-                model=model, messages=messages,
-            )
-            result = response.choices[0].message.content.strip()
-            return result, ref_name, _fmt_response(response)
+            result, _, stream = stream_reply(client, model, messages, out)
+            return result, ref_name, _fmt_response(stream)
         else:
             # Reference not found, ask GPT to proceed without it
             messages.append({"role": "assistant", "content": result})
@@ -245,13 +375,15 @@ def clean_chunk(client, model, chunk_content, split_dir):
                 ),
             })
 
-            response = client.chat.completions.create(
-                model=model, messages=messages,
-            )
-            result = response.choices[0].message.content.strip()
-            return result, None, _fmt_response(response)
+            result, _, stream = stream_reply(client, model, messages, out)
+            return result, None, _fmt_response(stream)
+
+    return result, None, _fmt_response(stream)
+
 
-    return result, None, _fmt_response(response)
+def valid_cleaned(result):
+    """A packed slot must be a finished chunk (reference requests go single)."""
+    return result.startswith('# ')
 
 
 def shrink_file(client, model, file_path, dry_run=False):
@@ -333,9 +465,6 @@ def run_shrink(data_dir, client, model, threshold, dry_run):
 
             processed += 1
 
-            if i < len(non_example):
-                time.sleep(0.5)
-
         except Exception as e:
             errors += 1
             print(f" ERROR: {e}")
@@ -354,13 +483,18 @@ def main():
     split_dir = project_root / 'split'
     data_dir = project_root / 'data'
     cache_path = project_root / 'parsed_sources.json'
+    manifest_path = project_root / 'split_manifest.json'
 
     # Parse arguments
     force = '--force' in sys.argv
     dry_run = '--dry-run' in sys.argv
     shrink = '--shrink' in sys.argv
+    pack = '--pack' in sys.argv
+    batch = '--batch' in sys.argv
+    prefetch_refs = '--no-prefetch' not in sys.argv
     model = 'gpt-5-mini'
     threshold = 6144  # 6KB default
+    budget = DEFAULT_BUDGET
 
     if '--model' in sys.argv:
         idx = sys.argv.index('--model')
@@ -375,30 +509,41 @@ def main():
         idx = sys.argv.index('--workers')
         workers = int(sys.argv[idx + 1])
 
+    if '--token-budget' in sys.argv:
+        idx = sys.argv.index('--token-budget')
+        budget = int(sys.argv[idx + 1])
+
     # Shrink mode: operate on training/data/*.md directly
     if shrink:
         api_key = os.environ.get('OPENAI_API_KEY')
         if not api_key and not dry_run:
             print("Error: OPENAI_API_KEY environment variable not set")
             sys.exit(1)
-        client = OpenAI(api_key=api_key) if not dry_run else None
-        run_shrink(data_dir, client, model, threshold, dry_run)
+        client = LLMGateway(api_key) if not dry_run else None
+        try:
+            run_shrink(data_dir, client, model, threshold, dry_run)
+        finally:
+            if client:
+                print(client.summary())
+                client.close()
         return
 
     # Collect target files
-    skip_flags = {'--force', '--dry-run', '--model', '--shrink', '--threshold', '--workers'}
+    skip_flags = {'--force', '--dry-run', '--model', '--shrink', '--threshold', '--workers',
+                  '--pack', '--token-budget', '--batch', '--no-prefetch'}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
         if skip_next:
             skip_next = False
             continue
-        if a in ('--model', '--threshold', '--workers'):
+        if a in ('--model', '--threshold', '--workers', '--token-budget'):
             skip_next = True
             continue
         if a not in skip_flags:
             args.append(a)
 
+    digests = FileDigests()
     if args:
         chunk_files = []
         for a in args:
@@ -412,7 +557,7 @@ def main():
         if not chunk_files:
             sys.exit(1)
     else:
-        chunk_files = sorted(split_dir.glob('*.txt'))
+        chunk_files = digests.walk(split_dir, '*.txt')
 
     if not chunk_files:
         print("No chunks found in training/split/")
@@ -421,10 +566,9 @@ def main():
     # Ensure output dir exists
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load cache
-    cache = load_cache(cache_path)
-    if 'chunks' not in cache:
-        cache['chunks'] = {}
+    # Load cache (snapshot + journal of per-file updates)
+    cache = PipelineCache(cache_path)
+    chunks_cache = cache.section('chunks')
 
     # Check API key
     api_key = os.environ.get('OPENAI_API_KEY')
@@ -432,88 +576,222 @@ def main():
         print("Error: OPENAI_API_KEY environment variable not set")
         sys.exit(1)
 
-    client = None
-    if not dry_run:
-        client = OpenAI(api_key=api_key)
+    if pack and batch:
+        print("Error: --pack and --batch are separate modes; pick one")
+        sys.exit(1)
 
     # Filter to chunks that need processing
     to_process = []
     skipped = 0
     total = len(chunk_files)
+    manifest = load_split_manifest(manifest_path)
+    md5s, from_manifest = chunk_md5s(chunk_files, manifest, digests)
+    digests.save()
 
-    for chunk_path in chunk_files:
+    for chunk_path, current_md5 in zip(chunk_files, md5s):
         name = chunk_path.name
-        current_md5 = md5_file(chunk_path)
-
-        cached = cache['chunks'].get(name)
+        cached = chunks_cache.get(name)
         if cached and cached.get('source_md5') == current_md5 and not force:
             output_path = data_dir / cached['output']
             if output_path.exists():
                 skipped += 1
+                telemetry.record_cache(True, name, 'parsed_sources')
                 continue
 
+        telemetry.record_cache(False, name, 'parsed_sources')
         to_process.append((chunk_path, current_md5))
 
+    print(f"Chunk hashes: {from_manifest} from split manifest, {total - from_manifest} from file digests"
+          f" ({digests.hashed} files read)")
+
+    # Predict NEED_REFERENCE round trips: inline those references up front
+    prefetch = {}
+    if prefetch_refs and to_process:
+        graph = load_reference_graph(project_root / 'split_config')
+        history = {n: entry['ref'] for n, entry in chunks_cache.items() if entry.get('ref')}
+        names = [cp.name for cp, _ in to_process]
+        prefetch = plan_prefetch(names, graph, history, split_dir)
+        by_name = {cp.name: (cp, md5) for cp, md5 in to_process}
+        to_process = [by_name[n] for n in order_by_references(names, graph, prefetch)]
+        if prefetch:
+            print(f"Reference prefetch: {len(prefetch)} chunks get a referenced chunk in their first request")
+
     if dry_run:
         for i, (chunk_path, _md5) in enumerate(to_process, 1):
-            cached = cache['chunks'].get(chunk_path.name)
+            cached = chunks_cache.get(chunk_path.name)
             reason = "forced" if force else ("changed" if cached else "new")
+            if chunk_path.name in prefetch:
+                reason += f", prefetch {prefetch[chunk_path.name][0]}"
             print(f"  [{i}/{len(to_process)}] Would process: {chunk_path.name} ({reason})")
         print(f"\n{'='*50}")
         print(f"Chunks: {len(to_process)} to process, {skipped} skipped (of {total} total)")
         print("(dry run - no files were modified)")
         return
 
+    if not to_process:
+        cache.close()
+        print(f"\n{'='*50}")
+        print(f"Chunks: 0 processed, {skipped} skipped, 0 errors (of {total} total)")
+        return
+
+    # Shared rate limiter: workers run at the account's RPM/TPM limits
+    client = LLMGateway(api_key)
+
     # Worker function for thread pool
     cache_lock = threading.Lock()
-    counter = {'processed': 0, 'errors': 0, 'refs': 0, 'done': 0}
+    counter = {'processed': 0, 'errors': 0, 'refs': 0, 'done': 0, 'prefetched': 0, 'prefetch_missed': 0}
+    stale = {cp.name for cp, _ in to_process}
+    finished = set()
 
-    def process_one(chunk_path, current_md5):
+    def load_reference(ref_name):
+        """(name, content) to inline for a prefetched reference: its cleaned
+        markdown when that is up to date, else the raw split chunk."""
+        ref_path = split_dir / f"{ref_name}.txt"
+        cached = chunks_cache.get(ref_path.name)
+        with cache_lock:
+            settled = ref_path.name not in stale or ref_path.name in finished
+        if cached and settled:
+            cleaned_path = data_dir / cached['output']
+            if cleaned_path.exists() and cached.get('source_md5') == chunk_md5(ref_path, manifest, digests):
+                return ref_name, cleaned_path.read_text(encoding='utf-8', errors='replace')
+        return ref_name, ref_path.read_text(encoding='utf-8', errors='replace')
+
+    report = ModeReport('packed' if pack else ('batch' if batch else 'single'), budget if pack else None)
+
+    def process_one(chunk_path, current_md5, reply=None):
+        """Clean one chunk; reply is (result, resp_info) when a packed or batch
+        request already answered it. A NEED_REFERENCE reply gets its follow-up
+        interactively; anything else unusable is redone from scratch."""
         name = chunk_path.name
         output_name = chunk_path.stem + '.md'
         output_path = data_dir / output_name
+        inlined = prefetch[name][0] if name in prefetch else None
 
         with cache_lock:
             counter['done'] += 1
             n = counter['done']
         print(f"  [{n}/{len(to_process)}] Processing: {name} ...", flush=True)
 
-        try:
-            chunk_content = chunk_path.read_text(encoding='utf-8', errors='replace')
-            result, ref_used, resp_info = clean_chunk(client, model, chunk_content, split_dir)
-
-            output_path.write_text(result, encoding='utf-8')
-
-            with cache_lock:
-                cache['chunks'][name] = {
+        with telemetry.file_context(name):
+            try:
+                if reply is not None and valid_cleaned(reply[0]):
+                    result, resp_info = reply
+                    ref_used = None
+                    output_path.write_text(result, encoding='utf-8')
+                else:
+                    # Stream into a hidden partial file, renamed into place once complete
+                    chunk_content = chunk_path.read_text(encoding='utf-8', errors='replace')
+                    reference = load_reference(inlined) if inlined else None
+                    first_reply = reply[0] if reply is not None and requested_reference(reply[0]) else None
+                    partial = output_path.with_name(f".{output_name}.partial")
+                    try:
+                        with open(partial, 'w', encoding='utf-8') as out:
+                            result, ref_used, resp_info = clean_chunk(client, model, chunk_content,
+                                                                      split_dir, out, reference, first_reply)
+                        os.replace(partial, output_path)
+                    finally:
+                        partial.unlink(missing_ok=True)
+
+                entry = {
                     'source_md5': current_md5,
                     'output': output_name,
                 }
-                save_cache(cache_path, cache)
-                counter['processed'] += 1
+                # Prefetched next time: only a reference the model asked for. An inline
+                # from history answered that same request in advance, so it stays; a
+                # continuation guess is never recorded as if the model had asked
                 if ref_used:
-                    counter['refs'] += 1
-
-            ref_msg = f" (ref: {ref_used})" if ref_used else ""
-            print(f"    done -> {output_name}{ref_msg} [{resp_info}]")
-
-        except Exception as e:
-            with cache_lock:
-                counter['errors'] += 1
-            print(f"    ERROR {name}: {e}")
+                    entry['ref'] = ref_used
+                elif inlined and prefetch[name][1] == 'history':
+                    entry['ref'] = inlined
+                cache.record('chunks', name, entry)
+                with cache_lock:
+                    counter['processed'] += 1
+                    finished.add(name)
+                    if ref_used:
+                        counter['refs'] += 1
+                    if inlined:
+                        counter['prefetched'] += 1
+                        counter['prefetch_missed'] += bool(ref_used)
+
+                ref_msg = f" (ref: {ref_used})" if ref_used else ""
+                if inlined:
+                    ref_msg += f" (prefetched: {inlined})"
+                print(f"    done -> {output_name}{ref_msg} [{resp_info}]")
+
+            except Exception as e:
+                with cache_lock:
+                    counter['errors'] += 1
+                print(f"    ERROR {name}: {e}")
+
+    def process_pack(pack_items):
+        """One packed request; malformed slots fall back to process_one's own request."""
+        with telemetry.file_context(f"{pack_items[0][0]} (+{len(pack_items) - 1} packed)"):
+            try:
+                outputs, response = request_pack(client, model, SYSTEM_PROMPT, pack_items,
+                                                 validate=valid_cleaned)
+                info = f"packed x{len(pack_items)}, {_fmt_response(response)}"
+            except Exception as e:
+                print(f"    packed request failed ({e}); retrying its {len(pack_items)} chunks singly")
+                outputs = {}
+            report.count(packs=1, packed_items=len(pack_items), retried=len(pack_items) - len(outputs))
+            for name, _ in pack_items:
+                cp, md5 = by_name[name]
+                process_one(cp, md5, (outputs[name], info) if name in outputs else None)
+
+    by_name = {cp.name: (cp, md5) for cp, md5 in to_process}
+    jobs = [(process_one, cp, md5) for cp, md5 in to_process]
+    if pack:
+        # Prefetched chunks go singly: a pack slot has no room for the reference exchange
+        packs, singles = plan_packs(
+            [(cp.name, cp.read_text(encoding='utf-8', errors='replace'))
+             for cp, _ in to_process if cp.name not in prefetch], budget)
+        singles += [(cp.name, None) for cp, _ in to_process if cp.name in prefetch]
+        print(f"Packing {len(to_process) - len(singles)} chunks into {len(packs)} requests"
+              f" (budget {budget:,} tokens), {len(singles)} sent singly")
+        jobs = [(process_pack, p) for p in packs] + [(process_one, *by_name[name]) for name, _ in singles]
+    elif batch:
+        requests = [(cp.name, md5, {'model': model, 'messages': clean_messages(
+                        cp.read_text(encoding='utf-8', errors='replace'),
+                        load_reference(prefetch[cp.name][0]) if cp.name in prefetch else None)})
+                    for cp, md5 in to_process]
+        try:
+            replies, batch_errors = run_batch('clean', requests, api_key)
+            report.count_batch(len(replies) + len(batch_errors), batch_usage(replies)[2])
+        except KeyboardInterrupt:
+            cache.close()
+            client.close()
+            sys.exit(1)
+        for name, error in sorted(batch_errors.items()):
+            print(f"    ERROR {name}: batch request failed: {error}")
+        counter['errors'] += len(batch_errors)
+        jobs = [(process_one, *by_name[name],
+                 (response.choices[0].message.content.strip(), f"batch, {_fmt_response(response)}"))
+                for name, response in replies.items()]
 
     # Run with thread pool
     print(f"Processing {len(to_process)} chunks with {workers} workers...")
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(process_one, cp, md5) for cp, md5 in to_process]
-        for f in as_completed(futures):
-            f.result()  # propagate unexpected exceptions
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(*job) for job in jobs]
+            for f in as_completed(futures):
+                f.result()  # propagate unexpected exceptions
+    finally:
+        cache.close()
+        client.close()
 
     # Summary
     print(f"\n{'='*50}")
     print(f"Chunks: {counter['processed']} processed, {skipped} skipped, {counter['errors']} errors (of {total} total)")
     if counter['refs']:
         print(f"References fetched: {counter['refs']} (extra API calls for self-containment)")
+    if counter['prefetched']:
+        print(f"References prefetched: {counter['prefetched']} inlined in the first request"
+              f" ({counter['prefetch_missed']} still asked for another)")
+    for line in report.lines(len(to_process), client):
+        print(line)
+    print(client.summary())
+    if counter['errors']:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # /// script
-# dependencies = ["openai"]
+# dependencies = ["blake3", "openai"]
 # ///
 """
 Document C64 assembly examples using OpenAI API.
@@ -17,19 +17,36 @@ Usage:
     uv run scripts/document_examples.py --dry-run             # Show what would be processed
     uv run scripts/document_examples.py --register            # Register existing files in cache (no AI)
     uv run scripts/document_examples.py --workers 8            # Process 8 files concurrently (default: 4)
+    uv run scripts/document_examples.py --batch --force        # Full rebuild as one Batch API job
+    uv run scripts/document_examples.py --no-project-context   # Document project files in isolation
+
+Batch mode (see batch_runner.py) submits every stale example as one Batch
+API job and applies the replies through the same cache records.
+
+Project context: files of a MULTI_FILE_PROJECTS project get a summary of
+the whole project (include graph, symbols, macros, labels; parsed locally
+by asm_project.py) appended to their system prompt, so labels and symbols
+from the project's other files are named consistently and the shared
+symbol/include files are not re-explained in every header. The summary is
+cached in parsed_sources.json ("projects", keyed by a hash of all of the
+project's files), and a project's files are queued together so they are
+documented in parallel on the same prompt prefix. A changed summary does
+not by itself make unchanged files stale; use --force for that.
 """
 
-import hashlib
-import json
 import os
 import re
 import sys
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from openai import OpenAI
+from asm_project import project_md5, project_summary
+from batch_runner import run_batch
+from file_digests import FileDigests
+from llm_gateway import LLMGateway
+from pipeline_cache import PipelineCache
+import telemetry
 
 def _fmt_response(response):
     """Format a one-line summary of an OpenAI API response."""
@@ -80,6 +97,18 @@ Focus on register behavior and programming patterns, not visual appearance.>
 - Do NOT include author names in the title
 """
 
+PROJECT_CONTEXT = """
+## Project context
+
+This file is one of several source files of the project summarised below
+(parsed from all of its files). Use the project's own names for labels,
+symbols and macros defined in other files, and name the file they come
+from. Do not re-document other files' routines or register definitions
+beyond how this file uses them.
+
+{summary}
+"""
+
 MULTI_FILE_PROJECTS = {
     'celso_christmas_demo': 'Christmas demo with falling snow sprites, dual bitmap screens, scrolling text, and SID music',
     'c64lib_chipset': 'KickAssembler library with register definitions and macros for VIC-II, CIA, SID, and MOS 6510',
@@ -88,24 +117,26 @@ MULTI_FILE_PROJECTS = {
 }
 
 
-def md5_file(path):
-    """Compute MD5 hash of a file's contents."""
-    return hashlib.md5(path.read_bytes()).hexdigest()
-
+def project_of(asm_path, project_root):
+    """MULTI_FILE_PROJECTS directory a file belongs to, or None."""
+    parts = asm_path.relative_to(project_root / 'examples').parts
+    if len(parts) > 1 and parts[0] in MULTI_FILE_PROJECTS:
+        return parts[0]
+    return None
 
-def load_cache(cache_path):
-    """Load the parsed_sources.json cache."""
-    if cache_path.exists():
-        with open(cache_path, 'r') as f:
-            return json.load(f)
-    return {"chunks": {}, "examples": {}}
 
+def cached_project_summary(cache, dir_name, examples_dir):
+    """Summary of a multi-file project, rebuilt only when one of its files changed.
 
-def save_cache(cache_path, cache):
-    """Save the parsed_sources.json cache."""
-    with open(cache_path, 'w') as f:
-        json.dump(cache, f, indent=2)
-        f.write('\n')
+    Returns (summary, rebuilt)."""
+    project_dir = examples_dir / dir_name
+    current_md5 = project_md5(project_dir)
+    cached = cache.section('projects').get(dir_name)
+    if cached and cached.get('md5') == current_md5:
+        return cached['summary'], False
+    summary = project_summary(project_dir, MULTI_FILE_PROJECTS[dir_name])
+    cache.record('projects', dir_name, {'md5': current_md5, 'summary': summary})
+    return summary, True
 
 
 def derive_output_name(header_text, asm_path, project_root):
@@ -123,12 +154,9 @@ def derive_output_name(header_text, asm_path, project_root):
     name = re.sub(r'\s+', '_', name.strip()).lower()
 
     # Check if it's a multi-file project
-    rel = asm_path.relative_to(project_root / 'examples')
-    parts = rel.parts
-    if len(parts) > 1:
-        dir_name = parts[0]
-        if dir_name in MULTI_FILE_PROJECTS:
-            name = f"{dir_name}_{name}"
+    dir_name = project_of(asm_path, project_root)
+    if dir_name:
+        name = f"{dir_name}_{name}"
 
     return f"example_{name}.md"
 
@@ -227,35 +255,44 @@ def format_markdown(header, source_code):
     return f"{header}\n\n## Source Code\n```asm\n{source_code}\n```\n"
 
 
-def document_example(client, model, source_code, asm_path, project_root):
+def document_example(client, model, source_code, asm_path, project_root, project_summary=None):
     """Send source code to OpenAI for analysis. Returns documented version."""
-    # Build context about multi-file projects
-    rel = asm_path.relative_to(project_root / 'examples')
-    parts = rel.parts
-    extra_context = ""
-    if len(parts) > 1:
-        dir_name = parts[0]
-        if dir_name in MULTI_FILE_PROJECTS:
-            desc = MULTI_FILE_PROJECTS[dir_name]
-            extra_context = (
-                f"\n\nThis file is part of multi-file project '{dir_name}': {desc}. "
-                f"Add this line after the title:\n"
-                f"**Project:** {dir_name} - {desc}\n"
-            )
-
-    user_msg = f"Analyze this C64 assembly source file ({asm_path.name}):{extra_context}\n\n{source_code}"
-
     response = client.chat.completions.create(
         model=model,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_msg},
-        ],
+        messages=example_messages(source_code, asm_path, project_root, project_summary),
     )
 
     return response.choices[0].message.content, _fmt_response(response)
 
 
+def example_messages(source_code, asm_path, project_root, project_summary=None):
+    """Messages asking for the markdown header of one example.
+
+    project_summary (asm_project.py) goes at the end of the system prompt,
+    so every file of a project shares the same prompt prefix.
+    """
+    # Build context about multi-file projects
+    dir_name = project_of(asm_path, project_root)
+    extra_context = ""
+    if dir_name:
+        desc = MULTI_FILE_PROJECTS[dir_name]
+        extra_context = (
+            f"\n\nThis file is part of multi-file project '{dir_name}': {desc}. "
+            f"Add this line after the title:\n"
+            f"**Project:** {dir_name} - {desc}\n"
+        )
+
+    user_msg = f"Analyze this C64 assembly source file ({asm_path.name}):{extra_context}\n\n{source_code}"
+
+    system = SYSTEM_PROMPT
+    if project_summary:
+        system += PROJECT_CONTEXT.format(summary=project_summary)
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user_msg},
+    ]
+
+
 def main():
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
@@ -267,6 +304,8 @@ def main():
     force = '--force' in sys.argv
     dry_run = '--dry-run' in sys.argv
     register = '--register' in sys.argv
+    batch = '--batch' in sys.argv
+    use_project_context = '--no-project-context' not in sys.argv
     model = 'gpt-5-mini'
 
     if '--model' in sys.argv:
@@ -279,7 +318,8 @@ def main():
         workers = int(sys.argv[idx + 1])
 
     # Collect target files
-    skip_flags = {'--force', '--dry-run', '--register', '--model', '--workers'}
+    skip_flags = {'--force', '--dry-run', '--register', '--model', '--workers', '--batch',
+                  '--no-project-context'}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
@@ -292,6 +332,7 @@ def main():
         if a not in skip_flags:
             args.append(a)
 
+    digests = FileDigests()
     if args:
         asm_files = []
         for a in args:
@@ -305,7 +346,7 @@ def main():
         if not asm_files:
             sys.exit(1)
     else:
-        asm_files = sorted(examples_dir.rglob('*.asm'))
+        asm_files = digests.walk(examples_dir, '*.asm', recursive=True)
 
     if not asm_files:
         print("No .asm files found in examples/")
@@ -314,10 +355,9 @@ def main():
     # Ensure output dir exists
     data_dir.mkdir(parents=True, exist_ok=True)
 
-    # Load cache
-    cache = load_cache(cache_path)
-    if 'examples' not in cache:
-        cache['examples'] = {}
+    # Load cache (snapshot + journal of per-file updates)
+    cache = PipelineCache(cache_path)
+    examples_cache = cache.section('examples')
 
     # Check API key
     api_key = os.environ.get('OPENAI_API_KEY')
@@ -325,35 +365,32 @@ def main():
         print("Error: OPENAI_API_KEY environment variable not set")
         sys.exit(1)
 
-    client = None
-    if not dry_run and not register:
-        client = OpenAI(api_key=api_key)
-
     # Filter to files that need processing
     to_process = []
     skipped = 0
     total = len(asm_files)
 
-    for asm_path in asm_files:
+    for asm_path, current_md5 in zip(asm_files, digests.md5_many(asm_files)):
         try:
             cache_key = str(asm_path.relative_to(project_root))
         except ValueError:
             cache_key = str(asm_path)
 
-        current_md5 = md5_file(asm_path)
-
-        cached = cache['examples'].get(cache_key)
+        cached = examples_cache.get(cache_key)
         if cached and cached.get('source_md5') == current_md5 and not force:
             output_path = data_dir / cached['output']
             if output_path.exists():
                 skipped += 1
+                telemetry.record_cache(True, cache_key, 'parsed_sources')
                 continue
 
+        telemetry.record_cache(False, cache_key, 'parsed_sources')
         to_process.append((asm_path, cache_key, current_md5))
+    digests.save()
 
     if dry_run:
         for i, (asm_path, cache_key, _) in enumerate(to_process, 1):
-            cached = cache['examples'].get(cache_key)
+            cached = examples_cache.get(cache_key)
             reason = "forced" if force else ("changed" if cached else "new")
             print(f"  [{i}/{len(to_process)}] Would process: {cache_key} ({reason})")
         print(f"\n{'='*50}")
@@ -374,63 +411,115 @@ def main():
             output_path = data_dir / output_name
             output_path.write_text(format_markdown(header_md, clean_source), encoding='utf-8')
 
-            cache['examples'][cache_key] = {
+            cache.record('examples', cache_key, {
                 'source_md5': current_md5,
                 'output': output_name,
-            }
-            save_cache(cache_path, cache)
+            })
             print(f"  [{i}/{len(to_process)}] Registered: {cache_key} -> {output_name}")
 
+        cache.close()
         print(f"\n{'='*50}")
         print(f"Examples: {len(to_process)} registered, {skipped} skipped (of {total} total)")
         print("(register mode - files copied as-is, no AI processing)")
         return
 
+    if not to_process:
+        cache.close()
+        print(f"\n{'='*50}")
+        print(f"Examples: 0 processed, {skipped} skipped, 0 errors (of {total} total)")
+        return
+
+    client = LLMGateway(api_key)
+
+    # One shared summary per multi-file project; queue each project's files together
+    summaries = {}
+    if use_project_context:
+        for dir_name in sorted({project_of(ap, project_root) for ap, _, _ in to_process} - {None}):
+            summaries[dir_name], rebuilt = cached_project_summary(cache, dir_name, examples_dir)
+            files = sum(1 for ap, _, _ in to_process if project_of(ap, project_root) == dir_name)
+            print(f"Project context: {dir_name} ({len(summaries[dir_name])} chars,"
+                  f" {'rebuilt' if rebuilt else 'cached'}) for {files} files")
+        to_process.sort(key=lambda item: project_of(item[0], project_root) or '\uffff')
+
+    def summary_for(asm_path):
+        return summaries.get(project_of(asm_path, project_root))
+
     # Worker function for thread pool
     cache_lock = threading.Lock()
     counter = {'processed': 0, 'errors': 0, 'done': 0}
 
-    def process_one(asm_path, cache_key, current_md5):
+    def process_one(asm_path, cache_key, current_md5, reply=None):
+        """Document one example; reply is (header, resp_info) from a batch job."""
         with cache_lock:
             counter['done'] += 1
             n = counter['done']
         print(f"  [{n}/{len(to_process)}] Processing: {cache_key} ...", flush=True)
 
-        try:
-            raw_text = asm_path.read_text(encoding='utf-8', errors='replace')
-            _, clean_source = strip_comment_header(raw_text)
-            if not clean_source:
-                clean_source = raw_text
-            header, resp_info = document_example(client, model, raw_text, asm_path, project_root)
-
-            output_name = derive_output_name(header, asm_path, project_root)
-            output_path = data_dir / output_name
-            output_path.write_text(format_markdown(header, clean_source), encoding='utf-8')
-
-            with cache_lock:
-                cache['examples'][cache_key] = {
+        with telemetry.file_context(cache_key):
+            try:
+                raw_text = asm_path.read_text(encoding='utf-8', errors='replace')
+                _, clean_source = strip_comment_header(raw_text)
+                if not clean_source:
+                    clean_source = raw_text
+                if reply is not None:
+                    header, resp_info = reply
+                else:
+                    header, resp_info = document_example(client, model, raw_text, asm_path, project_root,
+                                                         summary_for(asm_path))
+
+                output_name = derive_output_name(header, asm_path, project_root)
+                output_path = data_dir / output_name
+                output_path.write_text(format_markdown(header, clean_source), encoding='utf-8')
+
+                cache.record('examples', cache_key, {
                     'source_md5': current_md5,
                     'output': output_name,
-                }
-                save_cache(cache_path, cache)
-                counter['processed'] += 1
-
-            print(f"    done -> {output_name} [{resp_info}]")
-
-        except Exception as e:
-            with cache_lock:
-                counter['errors'] += 1
-            print(f"    ERROR {cache_key}: {e}")
-
-    print(f"Processing {len(to_process)} examples with {workers} workers...")
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(process_one, ap, ck, md5) for ap, ck, md5 in to_process]
-        for f in as_completed(futures):
-            f.result()
+                })
+                with cache_lock:
+                    counter['processed'] += 1
+
+                print(f"    done -> {output_name} [{resp_info}]")
+
+            except Exception as e:
+                with cache_lock:
+                    counter['errors'] += 1
+                print(f"    ERROR {cache_key}: {e}")
+
+    jobs = [(ap, ck, md5) for ap, ck, md5 in to_process]
+    if batch:
+        by_key = {ck: (ap, ck, md5) for ap, ck, md5 in to_process}
+        requests = [(ck, md5, {'model': model, 'messages': example_messages(
+                        ap.read_text(encoding='utf-8', errors='replace'), ap, project_root,
+                        summary_for(ap))})
+                    for ap, ck, md5 in to_process]
+        try:
+            replies, batch_errors = run_batch('document', requests, api_key)
+        except KeyboardInterrupt:
+            cache.close()
+            client.close()
+            sys.exit(1)
+        for key, error in sorted(batch_errors.items()):
+            print(f"    ERROR {key}: batch request failed: {error}")
+        counter['errors'] += len(batch_errors)
+        jobs = [(*by_key[key], (response.choices[0].message.content, f"batch, {_fmt_response(response)}"))
+                for key, response in replies.items()]
+
+    print(f"Processing {len(jobs)} examples with {workers} workers...")
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_one, *job) for job in jobs]
+            for f in as_completed(futures):
+                f.result()
+    finally:
+        cache.close()
+        client.close()
 
     # Summary
     print(f"\n{'='*50}")
     print(f"Examples: {counter['processed']} processed, {skipped} skipped, {counter['errors']} errors (of {total} total)")
+    print(client.summary())
+    if counter['errors']:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
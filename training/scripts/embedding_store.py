@@ -0,0 +1,174 @@
+"""
+Content-addressed on-disk store of embedding vectors.
+
+Vectors are keyed by (model, dimensions, md5(embed_text)) so they survive
+--force rebuilds, collection recreation and cache resets: re-importing text
+that has been embedded before costs no API calls. Backed by SQLite (WAL
+mode) with vectors stored as packed float32 blobs.
+
+Each row tracks when it was last read, so the store can be trimmed
+least-recently-used first, and garbage-collected against the set of texts
+that still exist in training/data/.
+
+Used by import_qdrant.py (--cache-stats, --cache-gc, --cache-max-mb).
+"""
+
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).parent.parent / "embedding_cache.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    model     TEXT    NOT NULL,
+    dims      INTEGER NOT NULL,
+    text_md5  TEXT    NOT NULL,
+    vector    BLOB    NOT NULL,
+    created   REAL    NOT NULL,
+    last_used REAL    NOT NULL,
+    PRIMARY KEY (model, dims, text_md5)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS vectors_last_used ON vectors (last_used);
+"""
+
+# SQLite's default limit on bound parameters per statement is 999
+_CHUNK = 500
+
+
+def pack_vector(vector: list[float]) -> bytes:
+    return array('f', vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> list[float]:
+    vec = array('f')
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingStore:
+    """Thread-safe embedding cache. One instance per process."""
+
+    def __init__(self, path: Path = DEFAULT_PATH):
+        self.path = Path(path)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def get_many(self, model: str, dims: int, text_hashes: list[str]) -> dict[str, list[float]]:
+        """Look up vectors by text hash. Returns {text_md5: vector} for hits only."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(text_hashes), _CHUNK):
+                chunk = text_hashes[i:i + _CHUNK]
+                marks = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_md5, vector FROM vectors "
+                    f"WHERE model = ? AND dims = ? AND text_md5 IN ({marks})",
+                    [model, dims, *chunk],
+                ).fetchall()
+                for text_md5, blob in rows:
+                    found[text_md5] = unpack_vector(blob)
+                if rows:
+                    hit_marks = ','.join('?' * len(rows))
+                    self._conn.execute(
+                        f"UPDATE vectors SET last_used = ? "
+                        f"WHERE model = ? AND dims = ? AND text_md5 IN ({hit_marks})",
+                        [now, model, dims, *[r[0] for r in rows]],
+                    )
+        return found
+
+    def contains_many(self, model: str, dims: int, text_hashes: list[str]) -> set[str]:
+        """Return the subset of text hashes that have a stored vector (no LRU touch)."""
+        present = set()
+        with self._lock:
+            for i in range(0, len(text_hashes), _CHUNK):
+                chunk = text_hashes[i:i + _CHUNK]
+                marks = ','.join('?' * len(chunk))
+                present.update(r[0] for r in self._conn.execute(
+                    f"SELECT text_md5 FROM vectors "
+                    f"WHERE model = ? AND dims = ? AND text_md5 IN ({marks})",
+                    [model, dims, *chunk],
+                ))
+        return present
+
+    def put_many(self, model: str, dims: int, entries: list[tuple[str, list[float]]]):
+        """Store (text_md5, vector) pairs, replacing any existing entry."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?, ?, ?, ?, ?)",
+                [(model, dims, h, pack_vector(v), now, now) for h, v in entries],
+            )
+            self._conn.execute("COMMIT")
+
+    def stats(self) -> list[dict]:
+        """Per (model, dims) counts and stored vector bytes."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model, dims, COUNT(*), SUM(LENGTH(vector)), MIN(last_used) "
+                "FROM vectors GROUP BY model, dims ORDER BY model, dims"
+            ).fetchall()
+        return [
+            {"model": m, "dims": d, "count": n, "bytes": b or 0, "oldest_use": t}
+            for m, d, n, b, t in rows
+        ]
+
+    def file_size(self) -> int:
+        """On-disk size of the database including its WAL."""
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            p = self.path.with_name(self.path.name + suffix)
+            if p.exists():
+                total += p.stat().st_size
+        return total
+
+    def gc(self, live_hashes: set[str], max_bytes: int | None = None) -> tuple[int, int]:
+        """Drop vectors whose text no longer exists, then trim LRU to max_bytes.
+
+        Returns (orphans_removed, lru_removed).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS live (text_md5 TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM live")
+            self._conn.executemany("INSERT OR IGNORE INTO live VALUES (?)",
+                                   [(h,) for h in live_hashes])
+            orphans = self._conn.execute(
+                "DELETE FROM vectors WHERE text_md5 NOT IN (SELECT text_md5 FROM live)"
+            ).rowcount
+
+            lru = 0
+            if max_bytes is not None:
+                total = self._conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM vectors").fetchone()[0]
+                if total > max_bytes:
+                    doomed = []
+                    for model, dims, text_md5, size in self._conn.execute(
+                            "SELECT model, dims, text_md5, LENGTH(vector) FROM vectors "
+                            "ORDER BY last_used ASC"):
+                        if total <= max_bytes:
+                            break
+                        doomed.append((model, dims, text_md5))
+                        total -= size
+                    self._conn.executemany(
+                        "DELETE FROM vectors WHERE model = ? AND dims = ? AND text_md5 = ?",
+                        doomed)
+                    lru = len(doomed)
+            self._conn.execute("COMMIT")
+
+        if orphans or lru:
+            with self._lock:
+                self._conn.execute("VACUUM")
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return orphans, lru
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # /// script
-# dependencies = ["openai"]
+# dependencies = ["blake3", "openai"]
 # ///
 """
 Enrich cleaned training chunks with ## Labels and ## Mnemonics sections,
@@ -19,10 +19,16 @@ Usage:
     uv run scripts/enrich_chunks.py --workers 8         # Concurrency (default 4)
     uv run scripts/enrich_chunks.py --model gpt-4o      # Use different model
     uv run scripts/enrich_chunks.py some_chunk.md       # Process specific file(s)
+    uv run scripts/enrich_chunks.py --pack              # Pack small chunks into shared requests
+    uv run scripts/enrich_chunks.py --pack --token-budget 12000
+    uv run scripts/enrich_chunks.py --batch --force     # Full rebuild as one Batch API job
+
+Packed mode (see request_packing.py) sends several chunks per request as a
+JSON array; any slot whose directives come back malformed is retried on its own.
+Batch mode (see batch_runner.py) submits every stale chunk as one Batch API
+job and applies the replies through the same cache records.
 """
 
-import hashlib
-import json
 import os
 import re
 import sys
@@ -30,7 +36,13 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from openai import OpenAI
+from batch_runner import batch_usage, run_batch
+from file_digests import FileDigests
+from llm_gateway import LLMGateway
+from md_sections import parse_sections
+from pipeline_cache import PipelineCache
+from request_packing import DEFAULT_BUDGET, ModeReport, plan_packs, request_pack
+import telemetry
 
 
 # ---------------------------------------------------------------------------
@@ -161,13 +173,7 @@ NONE
 
 def remove_section(content: str, heading: str) -> str:
     """Remove a markdown section (## heading + content until next ## or EOF)."""
-    pattern = re.compile(
-        r'(^|\n)(## ' + re.escape(heading) + r'\s*\n)'   # heading line
-        r'(.*?)'                                           # content
-        r'(?=\n## |\Z)',                                   # until next ## or EOF
-        re.DOTALL
-    )
-    result = pattern.sub('', content)
+    result = parse_sections(content).without(heading)
     # Clean up double blank lines left behind
     result = re.sub(r'\n{3,}', '\n\n', result)
     return result.strip() + '\n'
@@ -201,17 +207,39 @@ def enrich_with_openai(client, model: str, content: str) -> dict:
         mnemonics_section: str | None
         response_info: str (token usage)
     """
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
+    response = client.chat.completions.create(**enrich_request(model, content))
+    result = response.choices[0].message.content.strip()
+    return parse_enrichment(result, _fmt_response(response))
+
+
+def enrich_request(model: str, content: str) -> dict:
+    """chat.completions.create() arguments for one chunk (also the batch request body)."""
+    return {
+        'model': model,
+        'messages': [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": content},
         ],
-        temperature=1,
-    )
-    result = response.choices[0].message.content.strip()
-    resp_info = _fmt_response(response)
+        'temperature': 1,
+    }
+
+
+DIRECTIVE_PREFIXES = ('REMOVE_SOURCE_CODE:', 'REMOVE_KEY_REGISTERS:', '## Labels', '## Mnemonics', '- ')
 
+
+def valid_directives(result: str) -> bool:
+    """True if every line of a reply is NONE or a directive the parser knows.
+
+    Packed slots failing this are retried as single requests.
+    """
+    lines = [l.strip() for l in result.split('\n') if l.strip()]
+    if lines == ['NONE']:
+        return True
+    return bool(lines) and all(l.startswith(DIRECTIVE_PREFIXES) for l in lines)
+
+
+def parse_enrichment(result: str, resp_info: str) -> dict:
+    """Parse a directive reply into the dict described in enrich_with_openai()."""
     parsed = {
         'remove_source_code': None,
         'remove_key_registers': None,
@@ -256,23 +284,6 @@ def enrich_with_openai(client, model: str, content: str) -> dict:
 # Cache helpers
 # ---------------------------------------------------------------------------
 
-def load_cache(cache_path: Path) -> dict:
-    if cache_path.exists():
-        with open(cache_path) as f:
-            return json.load(f)
-    return {}
-
-
-def save_cache(cache_path: Path, cache: dict):
-    with open(cache_path, 'w') as f:
-        json.dump(cache, f, indent=2)
-        f.write('\n')
-
-
-def file_md5(path: Path) -> str:
-    return hashlib.md5(path.read_bytes()).hexdigest()
-
-
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
@@ -286,8 +297,11 @@ def main():
     # Parse arguments
     dry_run = '--dry-run' in sys.argv
     force = '--force' in sys.argv
+    pack = '--pack' in sys.argv
+    batch = '--batch' in sys.argv
     model = 'gpt-5-mini'
     workers = 4
+    budget = DEFAULT_BUDGET
 
     if '--model' in sys.argv:
         idx = sys.argv.index('--model')
@@ -297,20 +311,25 @@ def main():
         idx = sys.argv.index('--workers')
         workers = int(sys.argv[idx + 1])
 
+    if '--token-budget' in sys.argv:
+        idx = sys.argv.index('--token-budget')
+        budget = int(sys.argv[idx + 1])
+
     # Collect target files
-    skip_flags = {'--dry-run', '--force', '--model', '--workers'}
+    skip_flags = {'--dry-run', '--force', '--model', '--workers', '--pack', '--token-budget', '--batch'}
     args = []
     skip_next = False
     for a in sys.argv[1:]:
         if skip_next:
             skip_next = False
             continue
-        if a in ('--model', '--workers'):
+        if a in ('--model', '--workers', '--token-budget'):
             skip_next = True
             continue
         if a not in skip_flags:
             args.append(a)
 
+    digests = FileDigests()
     if args:
         md_files = []
         for a in args:
@@ -324,29 +343,31 @@ def main():
         if not md_files:
             sys.exit(1)
     else:
-        md_files = sorted(data_dir.glob('*.md'))
+        md_files = digests.walk(data_dir, '*.md')
 
     if not md_files:
         print(f"No .md files found in {data_dir}")
         sys.exit(0)
 
-    # Load cache
-    cache = load_cache(cache_path)
-    enrichments = cache.get('enrichments', {})
+    # Load cache (snapshot + journal of per-file updates)
+    cache = PipelineCache(cache_path)
+    enrichments = cache.section('enrichments')
 
     # Filter to files needing processing
     to_process = []
     skipped = 0
-    for f in md_files:
-        md5 = file_md5(f)
+    for f, md5 in zip(md_files, digests.md5_many(md_files)):
         cached = enrichments.get(f.name, {})
 
         if not force and cached.get('source_md5') == md5:
             skipped += 1
+            telemetry.record_cache(True, f.name, 'parsed_sources')
             continue
 
+        telemetry.record_cache(False, f.name, 'parsed_sources')
         to_process.append((f, md5))
 
+    digests.save()
     print(f"Enrichment: {len(to_process)} to process, {skipped} cached/skipped")
     if not to_process:
         print("Nothing to do.")
@@ -361,7 +382,12 @@ def main():
         print("Error: OPENAI_API_KEY environment variable not set")
         sys.exit(1)
 
-    client = OpenAI(api_key=api_key)
+    if pack and batch:
+        print("Error: --pack and --batch are separate modes; pick one")
+        sys.exit(1)
+
+    client = LLMGateway(api_key)
+    report = ModeReport('packed' if pack else ('batch' if batch else 'single'), budget if pack else None)
     print(f"Processing {len(to_process)} chunks with OpenAI ({model}, {workers} workers)...\n")
 
     # Counters and lock
@@ -371,82 +397,131 @@ def main():
         'sections_removed': 0, 'labels_added': 0, 'mnemonics_added': 0,
     }
 
-    def process_one(file_path: Path, current_md5: str):
+    def process_one(file_path: Path, current_md5: str, parsed: dict | None = None):
         with cache_lock:
             counter['done'] += 1
             n = counter['done']
         print(f"  [{n}/{len(to_process)}] {file_path.name} ...", flush=True)
 
-        try:
-            content = file_path.read_text(encoding='utf-8', errors='replace')
-            original = content
-
-            # Send to OpenAI
-            parsed = enrich_with_openai(client, model, content)
+        with telemetry.file_context(file_path.name):
+            try:
+                content = file_path.read_text(encoding='utf-8', errors='replace')
+                original = content
 
-            # Apply changes
-            changes = []
+                # Send to OpenAI (packed mode already has the reply)
+                if parsed is None:
+                    parsed = enrich_with_openai(client, model, content)
 
-            if parsed['remove_source_code']:
-                content = remove_section(content, 'Source Code')
-                changes.append('rm Source Code')
+                # Apply changes
+                changes = []
 
-            if parsed['remove_key_registers']:
-                content = remove_section(content, 'Key Registers')
-                changes.append('rm Key Registers')
+                if parsed['remove_source_code']:
+                    content = remove_section(content, 'Source Code')
+                    changes.append('rm Source Code')
 
-            new_sections = []
-            if parsed['labels_section']:
-                new_sections.append(parsed['labels_section'])
-                changes.append('+ Labels')
+                if parsed['remove_key_registers']:
+                    content = remove_section(content, 'Key Registers')
+                    changes.append('rm Key Registers')
 
-            if parsed['mnemonics_section']:
-                new_sections.append(parsed['mnemonics_section'])
-                changes.append('+ Mnemonics')
+                new_sections = []
+                if parsed['labels_section']:
+                    new_sections.append(parsed['labels_section'])
+                    changes.append('+ Labels')
 
-            if new_sections:
-                content = append_sections(content, '\n\n'.join(new_sections))
+                if parsed['mnemonics_section']:
+                    new_sections.append(parsed['mnemonics_section'])
+                    changes.append('+ Mnemonics')
 
-            if content != original:
-                if not dry_run:
-                    file_path.write_text(content, encoding='utf-8')
+                if new_sections:
+                    content = append_sections(content, '\n\n'.join(new_sections))
 
-                with cache_lock:
-                    counter['modified'] += 1
-                    if parsed['remove_source_code'] or parsed['remove_key_registers']:
-                        counter['sections_removed'] += 1
-                    if parsed['labels_section']:
-                        counter['labels_added'] += 1
-                    if parsed['mnemonics_section']:
-                        counter['mnemonics_added'] += 1
+                if content != original:
+                    if not dry_run:
+                        file_path.write_text(content, encoding='utf-8')
+
+                    with cache_lock:
+                        counter['modified'] += 1
+                        if parsed['remove_source_code'] or parsed['remove_key_registers']:
+                            counter['sections_removed'] += 1
+                        if parsed['labels_section']:
+                            counter['labels_added'] += 1
+                        if parsed['mnemonics_section']:
+                            counter['mnemonics_added'] += 1
                     # Update cache with NEW md5 (post-modification)
                     if not dry_run:
-                        new_md5 = file_md5(file_path)
-                        enrichments[file_path.name] = {'source_md5': new_md5}
-                        cache['enrichments'] = enrichments
-                        save_cache(cache_path, cache)
+                        cache.record('enrichments', file_path.name, {'source_md5': digests.md5(file_path)})
 
-                change_str = ', '.join(changes)
-                print(f"    MODIFIED ({change_str}) [{parsed['response_info']}]")
-            else:
-                with cache_lock:
-                    counter['no_change'] += 1
+                    change_str = ', '.join(changes)
+                    print(f"    MODIFIED ({change_str}) [{parsed['response_info']}]")
+                else:
+                    with cache_lock:
+                        counter['no_change'] += 1
                     # Cache original md5 to skip next time
                     if not dry_run:
-                        enrichments[file_path.name] = {'source_md5': current_md5}
-                        cache['enrichments'] = enrichments
-                        save_cache(cache_path, cache)
-                print(f"    no change [{parsed['response_info']}]")
+                        cache.record('enrichments', file_path.name, {'source_md5': current_md5})
+                    print(f"    no change [{parsed['response_info']}]")
 
-        except Exception as e:
-            with cache_lock:
-                counter['errors'] += 1
-            print(f"    ERROR: {e}")
-
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(process_one, fp, md5) for fp, md5 in to_process]
-        for f in as_completed(futures):
-            f.result()
+            except Exception as e:
+                with cache_lock:
+                    counter['errors'] += 1
+                print(f"    ERROR: {e}")
+
+    def process_pack(pack_items: list[tuple[str, str]]):
+        """One packed request; malformed slots fall back to process_one's own request."""
+        with telemetry.file_context(f"{pack_items[0][0]} (+{len(pack_items) - 1} packed)"):
+            try:
+                outputs, response = request_pack(client, model, SYSTEM_PROMPT, pack_items,
+                                                 validate=valid_directives, temperature=1)
+                info = f"packed x{len(pack_items)}, {_fmt_response(response)}"
+            except Exception as e:
+                print(f"  packed request failed ({e}); retrying its {len(pack_items)} chunks singly")
+                outputs = {}
+            report.count(packs=1, packed_items=len(pack_items), retried=len(pack_items) - len(outputs))
+            for name, _ in pack_items:
+                fp, md5 = by_name[name]
+                if name in outputs:
+                    process_one(fp, md5, parse_enrichment(outputs[name], info))
+                else:
+                    process_one(fp, md5)
+
+    by_name = {fp.name: (fp, md5) for fp, md5 in to_process}
+    jobs = [(process_one, fp, md5) for fp, md5 in to_process]
+    if pack:
+        packs, singles = plan_packs(
+            [(fp.name, fp.read_text(encoding='utf-8', errors='replace')) for fp, _ in to_process], budget)
+        print(f"Packing {len(to_process) - len(singles)} chunks into {len(packs)} requests"
+              f" (budget {budget:,} tokens), {len(singles)} sent singly\n")
+        jobs = [(process_pack, p) for p in packs] + [(process_one, *by_name[name]) for name, _ in singles]
+    elif batch:
+        requests = [(fp.name, md5, enrich_request(model, fp.read_text(encoding='utf-8', errors='replace')))
+                    for fp, md5 in to_process]
+        try:
+            replies, batch_errors = run_batch('enrich', requests, api_key)
+            report.count_batch(len(replies) + len(batch_errors), batch_usage(replies)[2])
+        except KeyboardInterrupt:
+            cache.close()
+            client.close()
+            sys.exit(1)
+        for name, error in sorted(batch_errors.items()):
+            print(f"  ERROR {name}: batch request failed: {error}")
+        counter['errors'] += len(batch_errors)
+        jobs = []
+        for name, response in replies.items():
+            result = response.choices[0].message.content.strip()
+            # Malformed directives: process_one asks again interactively
+            parsed = (parse_enrichment(result, f"batch, {_fmt_response(response)}")
+                      if valid_directives(result) else None)
+            jobs.append((process_one, *by_name[name], parsed))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(*job) for job in jobs]
+            for f in as_completed(futures):
+                f.result()
+    finally:
+        cache.close()
+        digests.save()
+        client.close()
 
     # Summary
     print(f"\n{'='*60}")
@@ -454,6 +529,9 @@ def main():
     print(f"  Sections removed: {counter['sections_removed']}")
     print(f"  Labels added: {counter['labels_added']}")
     print(f"  Mnemonics added: {counter['mnemonics_added']}")
+    for line in report.lines(len(to_process), client):
+        print(f"  {line}")
+    print(f"  {client.summary()}")
     if dry_run:
         print("\n(dry run — no files were modified)")
 
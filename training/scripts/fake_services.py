@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI embeddings / chat completions APIs and the
+Qdrant REST API.
+
+Serves both on one port so the import pipeline can be run and benchmarked
+without Docker, network access or an API key. Embeddings are deterministic
+pseudo-random vectors derived from the input text, chat replies echo the
+prompt as a markdown chunk, and Qdrant collections are held in memory
+(exact cosine /points/search and /points/search/groups, with filters, for
+retrieval benchmarks). Latency and rate limiting are configurable so
+pipelining and 429 backoff can be exercised.
+
+Usage:
+    python3 training/scripts/fake_services.py                          # Listen on :8999
+    python3 training/scripts/fake_services.py --port 9000
+    python3 training/scripts/fake_services.py --embed-latency 0.4      # Seconds per embeddings call
+    python3 training/scripts/fake_services.py --qdrant-latency 0.02    # Seconds per Qdrant call
+    python3 training/scripts/fake_services.py --chat-latency 1.0       # Seconds per chat completion
+    python3 training/scripts/fake_services.py --rpm 120                # 429 above 120 OpenAI req/min
+                                                                       # (and report it in x-ratelimit-limit-requests;
+                                                                       # else REPORTED_RPM / REPORTED_TPM are reported)
+    python3 training/scripts/fake_services.py --batch-latency 5        # Seconds before a batch job completes
+    python3 training/scripts/fake_services.py --batch-dir /tmp/batches # Where uploaded/output files live
+
+Then point the importer at it:
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:8999/v1 \\
+    QDRANT_URL=http://localhost:8999 \\
+        uv run training/scripts/import_qdrant.py --force --workers 8
+
+The Batch API is covered too (/v1/files upload and content, /v1/batches
+create and retrieve): uploaded files and batch output are plain JSONL files
+in --batch-dir (a temp dir by default), each request answered as a chat
+completion would be, so batch_runner.py can be exercised end to end.
+
+GET /_stats returns request counts per endpoint; POST /_stats/reset clears them.
+"""
+
+import hashlib
+import json
+import re
+import sys
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import numpy as np
+except ImportError:  # searches fall back to pure Python
+    np = None
+
+# Limits reported in x-ratelimit-limit-* headers when none are enforced
+# (a high usage tier), so LLMGateway sizes its buckets as against the real API
+REPORTED_RPM = 10_000
+REPORTED_TPM = 10_000_000
+
+
+def fake_embedding(text: str, dimensions: int) -> list[float]:
+    """Deterministic pseudo-embedding: same text always gives the same vector."""
+    raw = hashlib.shake_256(text.encode('utf-8')).digest(dimensions)
+    return [(b - 127.5) / 127.5 for b in raw]
+
+
+NUMBERED_LINE = re.compile(r'^\s*(\d+)\| ', re.MULTILINE)
+
+
+def fake_splits(user: str, size: int = 80) -> str:
+    """Split-config reply for auto_split: one split per `size` numbered lines."""
+    numbers = [int(n) for n in NUMBERED_LINE.findall(user)]
+    if not numbers:
+        return json.dumps({'splits': []})
+    first, last = min(numbers), max(numbers)
+    splits = []
+    for start in range(first, last + 1, size):
+        end = min(start + size - 1, last)
+        splits.append({'start': start, 'end': end, 'name': f"fake_lines_{start}_{end}",
+                       'description': f"Fake split of lines {start}-{end}", 'references': []})
+    return json.dumps({'splits': splits})
+
+
+def fake_completion(messages: list[dict]) -> str:
+    """Deterministic chat reply: the last user message reformatted as a chunk.
+
+    Good enough for the pipeline scripts to parse and write something; the
+    text is not meant to be meaningful. Requests for a JSON split config
+    (auto_split) get evenly sized splits over the numbered lines,
+    gap/overlap classification gets an empty decision list, directive-style
+    prompts (enrich_chunks, add_key_registers) get NONE, and packed requests
+    (request_packing.py) get one such reply per slot.
+    """
+    user = next((str(m.get('content', '')) for m in reversed(messages)
+                 if m.get('role') == 'user'), '')
+    system = next((str(m.get('content', '')) for m in messages if m.get('role') == 'system'), '')
+    if '"results"' in system and user.startswith('['):
+        slots = json.loads(user)
+        inner_system = system.split('\n\n## Packed request format')[0]
+        return json.dumps({'results': [
+            {'id': slot['id'], 'output': fake_completion([{'role': 'system', 'content': inner_system},
+                                                          {'role': 'user', 'content': slot['content']}])}
+            for slot in slots]})
+    if 'REMOVE_SOURCE_CODE' in system or 'respond with exactly: NONE' in system:
+        return 'NONE'
+    if '"issues"' in user:
+        return json.dumps({'issues': []})
+    if '"splits"' in system:
+        return fake_splits(user)
+    lines = [l for l in user.splitlines() if l.strip()]
+    title = lines[0].lstrip('# ').strip() if lines else 'Fake chunk'
+    body = '\n'.join(lines[1:40])
+    return f"# {title}\n\n**Summary:** fake completion.\n\n{body}\n"
+
+
+def match_condition(point: dict, cond: dict) -> bool:
+    """Evaluate a single Qdrant condition (field match/range, nested or has_id) against a point."""
+    if 'has_id' in cond:
+        return str(point.get('id')) in {str(i) for i in cond['has_id']}
+    if 'nested' in cond:
+        # Every condition must hold for one element of the array (Qdrant nested semantics)
+        items = point.get('payload', {}).get(cond['nested']['key']) or []
+        return any(match_filter({'payload': item}, cond['nested']['filter']) for item in items)
+    value = point.get('payload', {}).get(cond.get('key'))
+    values = value if isinstance(value, list) else [value]
+    match = cond.get('match')
+    if match is not None:
+        if 'value' in match:
+            return match['value'] in values
+        if 'any' in match:
+            return any(v in values for v in match['any'])
+        return False
+    rng = cond.get('range')
+    if rng is not None:
+        nums = [v for v in values if isinstance(v, (int, float))]
+        return any(
+            ('gte' not in rng or v >= rng['gte']) and ('lte' not in rng or v <= rng['lte'])
+            and ('gt' not in rng or v > rng['gt']) and ('lt' not in rng or v < rng['lt'])
+            for v in nums
+        )
+    return False
+
+
+def unit(vector: list[float]) -> list[float]:
+    """L2-normalised copy; Qdrant normalises Cosine vectors on upsert."""
+    norm = sum(x * x for x in vector) ** 0.5 or 1.0
+    return [x / norm for x in vector]
+
+
+def search_points(coll: dict, vector: list[float], limit: int, flt: dict | None) -> list[tuple[float, dict]]:
+    """Exact cosine search: (score, point) best first.
+
+    With numpy, the collection's vectors are kept as one matrix until the
+    next write ('matrix' is cleared by upserts and deletes).
+    """
+    points = list(coll['points'].values())
+    query = unit(vector)
+    if np is not None:
+        if coll.get('matrix') is None:
+            coll['matrix'] = (points, np.asarray([p['vector'] for p in points], dtype=np.float32))
+        points, matrix = coll['matrix']
+        scores = (matrix @ np.asarray(query, dtype=np.float32)).tolist() if points else []
+    else:
+        scores = [sum(a * b for a, b in zip(p['vector'], query)) for p in points]
+    ranked = sorted(((score, p) for score, p in zip(scores, points) if match_filter(p, flt)),
+                    key=lambda sp: -sp[0])
+    return ranked[:limit]
+
+
+def match_filter(point: dict, flt: dict | None) -> bool:
+    """Evaluate a Qdrant filter (must / should / must_not) against a point."""
+    if not flt:
+        return True
+    must = flt.get('must', [])
+    should = flt.get('should', [])
+    must_not = flt.get('must_not', [])
+
+    def check(c):
+        return match_filter(point, c) if any(k in c for k in ('must', 'should', 'must_not')) \
+            else match_condition(point, c)
+
+    if not all(check(c) for c in must):
+        return False
+    if should and not any(check(c) for c in should):
+        return False
+    return not any(check(c) for c in must_not)
+
+
+class FakeState:
+    """Shared server state: collections, request counters, rate window."""
+
+    def __init__(self, embed_latency: float, qdrant_latency: float, rpm: int,
+                 chat_latency: float = 0.5, batch_latency: float = 0.0,
+                 batch_dir: Path | None = None):
+        self.embed_latency = embed_latency
+        self.chat_latency = chat_latency
+        self.qdrant_latency = qdrant_latency
+        self.rpm = rpm
+        self.batch_latency = batch_latency
+        self.batch_dir = batch_dir or Path(tempfile.mkdtemp(prefix='fake_batches_'))
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+        self.batches: dict[str, dict] = {}
+        self.collections: dict[str, dict] = {}
+        self.aliases: dict[str, str] = {}
+        self.stats: Counter = Counter()
+        self.recent_embeds: deque = deque()
+        self.lock = threading.Lock()
+
+    def limit_headers(self) -> dict:
+        """x-ratelimit-* headers as the real API sends them on every reply."""
+        return {'x-ratelimit-limit-requests': str(self.rpm or REPORTED_RPM),
+                'x-ratelimit-limit-tokens': str(REPORTED_TPM)}
+
+    def rate_limited(self) -> bool:
+        """Sliding one-minute window over embedding requests."""
+        if not self.rpm:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            while self.recent_embeds and now - self.recent_embeds[0] > 60:
+                self.recent_embeds.popleft()
+            if len(self.recent_embeds) >= self.rpm:
+                return True
+            self.recent_embeds.append(now)
+            return False
+
+
+def chat_response(body: dict, serial: int) -> dict:
+    """A chat.completion object answering one request body."""
+    messages = body.get('messages', [])
+    prompt = ''.join(str(m.get('content', '')) for m in messages)
+    text = fake_completion(messages)
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(text) // 4 + 1
+    return {
+        'id': f"chatcmpl-fake{serial}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'fake'),
+        'choices': [{'index': 0, 'finish_reason': 'stop',
+                     'message': {'role': 'assistant', 'content': text}}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                  'total_tokens': prompt_tokens + completion_tokens},
+    }
+
+
+def file_object(path: Path, purpose: str) -> dict:
+    return {'id': path.stem, 'object': 'file', 'bytes': path.stat().st_size,
+            'created_at': int(path.stat().st_mtime), 'filename': path.name,
+            'purpose': purpose, 'status': 'processed'}
+
+
+def run_fake_batch(state: 'FakeState', batch_id: str, input_file_id: str) -> tuple[str, int, int]:
+    """Answer every line of a batch input file. Returns (output_file_id, completed, failed)."""
+    input_path = state.batch_dir / f"{input_file_id}.jsonl"
+    output_id = f"file-{batch_id}-output"
+    completed = failed = 0
+    with open(input_path, encoding='utf-8') as src, \
+            open(state.batch_dir / f"{output_id}.jsonl", 'w', encoding='utf-8') as out:
+        for i, line in enumerate(src):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            entry = {'id': f"batch_req_{batch_id}_{i}", 'custom_id': request.get('custom_id'),
+                     'response': None, 'error': None}
+            if request.get('url') == '/v1/chat/completions':
+                entry['response'] = {'status_code': 200, 'request_id': f"req_{i}",
+                                     'body': chat_response(request.get('body', {}), i)}
+                completed += 1
+            else:
+                entry['error'] = {'code': 'invalid_url', 'message': f"Unsupported url {request.get('url')}"}
+                failed += 1
+            out.write(json.dumps(entry) + '\n')
+    return output_id, completed, failed
+
+
+class Handler(BaseHTTPRequestHandler):
+    state: FakeState = None  # set in main()
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send(self, status: int, body: dict, headers: dict | None = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str = 'application/octet-stream'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, response: dict, headers: dict):
+        """Send a chat completion as server-sent chunk events, 16 characters at a time."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.close_connection = True
+        text = response['choices'][0]['message']['content']
+        base = {k: response[k] for k in ('id', 'created', 'model')}
+        base['object'] = 'chat.completion.chunk'
+        try:
+            for i in range(0, len(text), 16):
+                chunk = dict(base, choices=[{'index': 0, 'delta': {'content': text[i:i + 16]},
+                                             'finish_reason': None}])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                time.sleep(0.002)
+            done = dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+            usage = dict(base, choices=[], usage=response['usage'])
+            self.wfile.write(f"data: {json.dumps(done)}\n\ndata: {json.dumps(usage)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.stats['chat_stream_aborted'] += 1
+
+    def _multipart(self) -> dict[str, bytes]:
+        """Fields of a multipart/form-data body (file uploads)."""
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length)
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=HTTP).parsebytes(header + raw)
+        return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                for part in message.iter_parts()}
+
+    def _batch_object(self, batch: dict) -> dict:
+        ready = time.monotonic() >= batch['ready_at']
+        counts = batch['counts'] if ready else {'total': batch['counts']['total'], 'completed': 0, 'failed': 0}
+        return {
+            'id': batch['id'], 'object': 'batch', 'endpoint': batch['endpoint'],
+            'input_file_id': batch['input_file_id'], 'completion_window': '24h',
+            'status': 'completed' if ready else 'in_progress',
+            'output_file_id': batch['output_file_id'] if ready else None,
+            'error_file_id': None, 'created_at': batch['created_at'],
+            'request_counts': counts, 'metadata': batch['metadata'],
+        }
+
+    def _ok(self, result=True):
+        self._send(200, {'result': result, 'status': 'ok', 'time': 0.0})
+
+    def _route(self, method: str):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        state = self.state
+
+        if path in ('/_stats', '/_stats/reset'):
+            if method == 'GET':
+                return self._send(200, dict(state.stats))
+            state.stats.clear()
+            return self._ok()
+
+        if path.endswith('/embeddings') and method == 'POST':
+            state.stats['embeddings'] += 1
+            body = self._body()
+            if state.rate_limited():
+                state.stats['embeddings_429'] += 1
+                return self._send(429, {'error': {'message': 'Rate limit reached',
+                                                  'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                                  {'Retry-After': '1'})
+            time.sleep(state.embed_latency)
+            texts = body.get('input', [])
+            if isinstance(texts, str):
+                texts = [texts]
+            dims = body.get('dimensions') or 3072
+            tokens = sum(len(t) // 4 + 1 for t in texts)
+            return self._send(200, {
+                'object': 'list',
+                'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(t, dims)}
+                         for i, t in enumerate(texts)],
+                'model': body.get('model', 'fake'),
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+            }, state.limit_headers())
+
+        if path == '/aliases' and method == 'GET':
+            state.stats['GET /aliases'] += 1
+            with state.lock:
+                return self._ok({'aliases': [{'alias_name': a, 'collection_name': c}
+                                             for a, c in state.aliases.items()]})
+
+        if path.endswith('/chat/completions') and method == 'POST':
+            state.stats['chat'] += 1
+            body = self._body()
+            if state.rate_limited():
+                state.stats['chat_429'] += 1
+                return self._send(429, {'error': {'message': 'Rate limit reached',
+                                                  'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                                  {'Retry-After': '1'})
+            time.sleep(state.chat_latency)
+            response = chat_response(body, state.stats['chat'])
+            if body.get('stream'):
+                state.stats['chat_streamed'] += 1
+                return self._send_stream(response, state.limit_headers())
+            return self._send(200, response, state.limit_headers())
+
+        if path.endswith('/v1/files') and method == 'POST':
+            state.stats['files'] += 1
+            fields = self._multipart()
+            file_path = state.batch_dir / f"file-{state.stats['files']:06d}.jsonl"
+            file_path.write_bytes(fields.get('file') or b'')
+            return self._send(200, file_object(file_path, (fields.get('purpose') or b'batch').decode()))
+
+        match = re.search(r'/v1/files/([\w-]+)/content$', path)
+        if match and method == 'GET':
+            file_path = state.batch_dir / f"{match.group(1)}.jsonl"
+            if not file_path.exists():
+                return self._send(404, {'error': {'message': f"No such file: {match.group(1)}"}})
+            return self._send_bytes(200, file_path.read_bytes())
+
+        if path.endswith('/v1/batches') and method == 'POST':
+            state.stats['batches'] += 1
+            body = self._body()
+            batch_id = f"batch_fake{state.stats['batches']:04d}"
+            output_id, completed, failed = run_fake_batch(state, batch_id, body['input_file_id'])
+            batch = {'id': batch_id, 'endpoint': body.get('endpoint'),
+                     'input_file_id': body['input_file_id'], 'output_file_id': output_id,
+                     'created_at': int(time.time()), 'metadata': body.get('metadata'),
+                     'ready_at': time.monotonic() + state.batch_latency,
+                     'counts': {'total': completed + failed, 'completed': completed, 'failed': failed}}
+            with state.lock:
+                state.batches[batch_id] = batch
+            return self._send(200, self._batch_object(batch))
+
+        match = re.search(r'/v1/batches/([\w-]+)$', path)
+        if match and method == 'GET':
+            state.stats['batch_polls'] += 1
+            batch = state.batches.get(match.group(1))
+            if batch is None:
+                return self._send(404, {'error': {'message': f"No such batch: {match.group(1)}"}})
+            return self._send(200, self._batch_object(batch))
+
+        if not path.startswith('/collections'):
+            return self._send(404, {'status': {'error': f'Not found: {path}'}})
+
+        time.sleep(state.qdrant_latency)
+        parts = path.split('/')[2:]  # after "/collections"
+        route = '/collections' + ('/{name}' if parts else '') + ''.join('/' + p for p in parts[1:])
+        state.stats[f"{method} {route}"] += 1
+
+        with state.lock:
+            if not parts:
+                return self._ok({'collections': [{'name': n} for n in state.collections]})
+
+            if parts == ['aliases'] and method == 'POST':
+                for action in self._body().get('actions', []):
+                    if 'delete_alias' in action:
+                        state.aliases.pop(action['delete_alias']['alias_name'], None)
+                    elif 'create_alias' in action:
+                        spec = action['create_alias']
+                        if spec['collection_name'] not in state.collections:
+                            return self._send(404, {'status': {'error': 'Collection not found'}})
+                        if spec['alias_name'] in state.collections:
+                            return self._send(409, {'status': {'error': 'Name is taken by a collection'}})
+                        state.aliases[spec['alias_name']] = spec['collection_name']
+                return self._ok()
+
+            name = parts[0]
+            sub = '/'.join(parts[1:])
+            if name in state.aliases and (sub or method == 'GET'):
+                name = state.aliases[name]
+            coll = state.collections.get(name)
+
+            if not sub:
+                if method == 'GET':
+                    if coll is None:
+                        return self._send(404, {'status': {'error': f'Collection `{name}` not found'}})
+                    params = {k: v for k, v in coll['config'].items() if k != 'quantization_config'}
+                    return self._ok({'status': 'green', 'points_count': len(coll['points']),
+                                     'config': {'params': params,
+                                                'quantization_config': coll['config'].get('quantization_config')}})
+                if method == 'PUT':
+                    if name in state.aliases:
+                        return self._send(409, {'status': {'error': 'Name is taken by an alias'}})
+                    state.collections[name] = {'config': self._body(), 'points': {}, 'indexes': {}}
+                    return self._ok()
+                if method == 'DELETE':
+                    existed = state.collections.pop(name, None) is not None
+                    state.aliases = {a: c for a, c in state.aliases.items() if c != name}
+                    return self._ok(existed)
+
+            if coll is None:
+                return self._send(404, {'status': {'error': f'Collection `{name}` not found'}})
+
+            if sub == 'index' and method == 'PUT':
+                body = self._body()
+                coll['indexes'][body.get('field_name')] = body.get('field_schema')
+                return self._ok({'status': 'acknowledged'})
+
+            if sub == 'points' and method == 'PUT':
+                for p in self._body().get('points', []):
+                    coll['points'][str(p['id'])] = {**p, 'vector': unit(p['vector'])}
+                coll['matrix'] = None
+                return self._ok({'status': 'acknowledged'})
+
+            if sub == 'points/search' and method == 'POST':
+                body = self._body()
+                hits = search_points(coll, body['vector'], body.get('limit', 10), body.get('filter'))
+                return self._ok([{'id': p['id'], 'version': 0, 'score': score,
+                                  'payload': p.get('payload', {}) if body.get('with_payload') else None}
+                                 for score, p in hits])
+
+            if sub == 'points/search/groups' and method == 'POST':
+                body = self._body()
+                key, size = body['group_by'], body.get('group_size', 1)
+                groups = {}
+                for score, p in search_points(coll, body['vector'], len(coll['points']), body.get('filter')):
+                    value = p.get('payload', {}).get(key)
+                    if value is None or (value not in groups and len(groups) >= body.get('limit', 10)):
+                        continue
+                    hits = groups.setdefault(value, [])
+                    if len(hits) < size:
+                        hits.append({'id': p['id'], 'version': 0, 'score': score,
+                                     'payload': p.get('payload', {}) if body.get('with_payload') else None})
+                result = [{'id': value, 'hits': hits} for value, hits in groups.items()]
+                lookup = body.get('with_lookup')
+                if lookup:
+                    name = lookup if isinstance(lookup, str) else lookup['collection']
+                    other = state.collections.get(state.aliases.get(name, name), {'points': {}})
+                    for group in result:
+                        point = other['points'].get(str(group['id']))
+                        if point is not None:
+                            group['lookup'] = {'id': point['id'], 'payload': point.get('payload', {})}
+                return self._ok({'groups': result})
+
+            if sub == 'points/delete' and method == 'POST':
+                body = self._body()
+                if 'points' in body:
+                    for pid in body['points']:
+                        coll['points'].pop(str(pid), None)
+                else:
+                    doomed = [pid for pid, p in coll['points'].items()
+                              if match_filter(p, body.get('filter'))]
+                    for pid in doomed:
+                        del coll['points'][pid]
+                coll['matrix'] = None
+                return self._ok({'status': 'acknowledged'})
+
+        return self._send(404, {'status': {'error': f'Unsupported: {method} {path}'}})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+def main():
+    port = 8999
+    embed_latency = 0.3
+    qdrant_latency = 0.01
+    rpm = 0
+    chat_latency = 0.5
+
+    if '--port' in sys.argv:
+        port = int(sys.argv[sys.argv.index('--port') + 1])
+    if '--embed-latency' in sys.argv:
+        embed_latency = float(sys.argv[sys.argv.index('--embed-latency') + 1])
+    if '--qdrant-latency' in sys.argv:
+        qdrant_latency = float(sys.argv[sys.argv.index('--qdrant-latency') + 1])
+    if '--rpm' in sys.argv:
+        rpm = int(sys.argv[sys.argv.index('--rpm') + 1])
+    if '--chat-latency' in sys.argv:
+        chat_latency = float(sys.argv[sys.argv.index('--chat-latency') + 1])
+    batch_latency = 0.0
+    if '--batch-latency' in sys.argv:
+        batch_latency = float(sys.argv[sys.argv.index('--batch-latency') + 1])
+    batch_dir = None
+    if '--batch-dir' in sys.argv:
+        batch_dir = Path(sys.argv[sys.argv.index('--batch-dir') + 1])
+
+    Handler.state = FakeState(embed_latency, qdrant_latency, rpm, chat_latency, batch_latency, batch_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    server.daemon_threads = True
+    print(f"Fake OpenAI + Qdrant listening on http://127.0.0.1:{port}"
+          f" (embed {embed_latency}s, chat {chat_latency}s, qdrant {qdrant_latency}s"
+          f"{f', {rpm} rpm' if rpm else ''})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Stat-first change detection for the pipeline's input files.
+
+clean_chunks, enrich_chunks, document_examples and import_qdrant each used to
+read and MD5 every file in split/, data/ or examples/ on every run (about
+40 MB of reads) only to find nothing had changed. FileDigests keeps, per
+file, the stat tuple it last saw next to the file's content digests:
+
+    training/file_digests.json
+    {"version": 1, "algorithm": "blake3",
+     "files": {"split/foo.txt": [size, mtime_ns, inode, digest, md5], ...}}
+
+and only reads a file when (size, mtime_ns, inode) differ. A changed stat
+with an unchanged digest (touch, git checkout) just updates the stat. The
+digest is BLAKE3 when the blake3 package is installed, else xxhash's
+xxh3_128, else hashlib's blake2b. The MD5 is still kept, and recomputed only
+when the digest changes, because it is the key of every existing cache
+(parsed_sources.json source_md5, import_cache.json, the split manifest and
+the batch jobs); switching those to a new hash would re-run every paid stage.
+
+walk() lists a directory tree with one thread per subdirectory, stats the
+files in parallel and prunes memo entries of files that are gone;
+md5_many() hashes whatever changed in parallel (hashlib and blake3 release
+the GIL on large buffers). save() merges into the file on disk under an
+advisory lock, so stages that build.py runs concurrently keep each other's
+entries.
+
+Usage:
+    digests = FileDigests()
+    files = digests.walk(split_dir, '*.txt')
+    md5s = digests.md5_many(files)          # mostly from the memo
+    digests.save()
+    python3 training/scripts/file_digests.py            # memo stats
+"""
+
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from pipeline_cache import atomic_write_json
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    from blake3 import blake3 as _new_digest
+    ALGORITHM = 'blake3'
+except ImportError:
+    try:
+        from xxhash import xxh3_128 as _new_digest
+        ALGORITHM = 'xxh3_128'
+    except ImportError:
+        def _new_digest():
+            return hashlib.blake2b(digest_size=16)
+        ALGORITHM = 'blake2b'
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_PATH = PROJECT_ROOT / 'file_digests.json'
+VERSION = 1
+WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+
+def _stat_key(st: os.stat_result) -> list[int]:
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+class FileDigests:
+    """Content digests and MD5s of files under root, memoised by stat. Thread-safe."""
+
+    def __init__(self, path: Path = DEFAULT_PATH, root: Path = PROJECT_ROOT):
+        self.path = Path(path)
+        self.root = Path(root)
+        self._prefix = str(self.root) + os.sep
+        self.lock_path = self.path.with_name('.' + self.path.name + '.lock')
+        self.memo = self._load()
+        self.dirty = set()     # relpaths to write back
+        self.removed = set()   # relpaths pruned by walk()
+        self.hashed = 0        # files read and hashed
+        self._stats = {}       # relpath -> stat result from walk(), until looked up
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _load(self) -> dict:
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, json.JSONDecodeError):
+            return {}
+        if data.get('version') != VERSION:
+            return {}
+        files = data.get('files', {})
+        if data.get('algorithm') != ALGORITHM:
+            # Digests from another algorithm can't be compared; the MD5s can
+            # still be reused for unchanged stats
+            for entry in files.values():
+                entry[3] = None
+        return files
+
+    def _rel(self, path) -> str:
+        path = str(path)
+        if path.startswith(self._prefix):
+            path = path[len(self._prefix):]
+        return path.replace(os.sep, '/')
+
+    def walk(self, top: Path, pattern: str = '*', recursive: bool = False,
+             workers: int = WORKERS) -> list[Path]:
+        """Sorted files under top whose name matches pattern (in subdirectories
+        too if recursive), with each directory level listed and stat'd in parallel.
+
+        Memo entries for matching files under top that no longer exist are dropped.
+        """
+        top = Path(top)
+        if not top.is_dir():
+            return []
+
+        def scan(directory):
+            prefix = self._rel(directory) + '/'
+            files, subdirs = [], []
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir():
+                        subdirs.append(directory / entry.name)
+                    elif fnmatch.fnmatchcase(entry.name, pattern) and entry.is_file():
+                        files.append((prefix + entry.name, directory, entry.name, entry.stat()))
+            return files, subdirs
+
+        found = []
+        pending = [top]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending:
+                results = list(pool.map(scan, pending)) if len(pending) > 1 else [scan(pending[0])]
+                pending = []
+                for files, subdirs in results:
+                    found.extend(files)
+                    if recursive:
+                        pending.extend(subdirs)
+
+        found.sort()
+        with self._lock:
+            for rel, _, _, st in found:
+                self._stats[rel] = st
+            live = self._stats.keys()
+            prefix = self._rel(top) + '/'
+            for rel in list(self.memo):
+                if rel not in live and rel.startswith(prefix):
+                    name = rel[len(prefix):]
+                    if (recursive or '/' not in name) and fnmatch.fnmatchcase(name.rsplit('/', 1)[-1], pattern):
+                        del self.memo[rel]
+                        self.removed.add(rel)
+        return [directory / name for _, directory, name, _ in found]
+
+    def _lookup(self, path: Path) -> list:
+        """[size, mtime_ns, inode, digest, md5] for path, hashing only if its stat changed."""
+        rel = self._rel(path)
+        st = self._stats.pop(rel, None) or os.stat(path)
+        key = _stat_key(st)
+        with self._lock:
+            entry = self.memo.get(rel)
+            if entry and entry[:3] == key:
+                return entry
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = _new_digest()
+        digest.update(data)
+        digest = digest.hexdigest()
+        unchanged = entry is not None and entry[3] == digest
+        md5 = entry[4] if unchanged else hashlib.md5(data).hexdigest()
+        entry = key + [digest, md5]
+        with self._lock:
+            self.memo[rel] = entry
+            self.dirty.add(rel)
+            self.hashed += 1
+        return entry
+
+    def md5(self, path: Path) -> str:
+        """MD5 of the file's bytes (the pipeline's cache key)."""
+        return self._lookup(path)[4]
+
+    def digest(self, path: Path) -> str:
+        """Fast content digest (ALGORITHM) of the file's bytes."""
+        return self._lookup(path)[3]
+
+    def md5_many(self, paths: list[Path], workers: int = WORKERS) -> list[str]:
+        """MD5s of many files, in order; the ones that need hashing are read in parallel."""
+        result, changed = [], []
+        for i, path in enumerate(paths):
+            rel = self._rel(path)
+            st = self._stats.pop(rel, None) or os.stat(path)
+            entry = self.memo.get(rel)
+            if entry and entry[:3] == _stat_key(st):
+                result.append(entry[4])
+            else:
+                self._stats[rel] = st
+                result.append(None)
+                changed.append(i)
+        if changed:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, md5 in zip(changed, pool.map(self.md5, [paths[i] for i in changed])):
+                    result[i] = md5
+        return result
+
+    def save(self):
+        """Merge this run's entries into the memo file on disk."""
+        with self._lock:
+            if not self.dirty and not self.removed:
+                return
+            with self._file_lock():
+                on_disk = self._load()
+                for rel in self.removed:
+                    on_disk.pop(rel, None)
+                for rel in self.dirty:
+                    if rel in self.memo:
+                        on_disk[rel] = self.memo[rel]
+                atomic_write_json(self.path, {'version': VERSION, 'algorithm': ALGORITHM,
+                                              'files': on_disk}, indent=None)
+            self.dirty.clear()
+            self.removed.clear()
+
+
+def main():
+    digests = FileDigests()
+    if not digests.memo:
+        print(f"No file digests recorded yet ({digests.path})")
+        return
+    by_dir = {}
+    for rel in digests.memo:
+        top = rel.split('/', 1)[0] if '/' in rel else '.'
+        by_dir[top] = by_dir.get(top, 0) + 1
+    print(f"{digests.path}: {len(digests.memo)} files ({ALGORITHM})")
+    for top, count in sorted(by_dir.items()):
+        print(f"  {top + '/':<20} {count}")
+    if '--verify' in sys.argv:
+        # Re-hash everything and report stale stat matches (e.g. mtime-preserving edits)
+        stale = 0
+        for rel, entry in list(digests.memo.items()):
+            path = digests.root / rel
+            if path.exists() and hashlib.md5(path.read_bytes()).hexdigest() != entry[4]:
+                stale += 1
+                print(f"  stale: {rel}")
+        print(f"Verified: {stale} stale entries")
+
+
+if __name__ == '__main__':
+    main()
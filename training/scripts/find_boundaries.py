@@ -10,6 +10,10 @@ the source document at those line ranges for natural break points:
 - Topic transitions
 
 Outputs a report of suggested split points for each oversized chunk.
+
+presplit_chunk() turns the unambiguous markers into an actual sub-split,
+so auto_split.py --refine only has to ask OpenAI about chunks that have
+none.
 """
 
 import json
@@ -93,6 +97,121 @@ def find_blank_clusters(lines, start, end, min_gap=2):
     return clusters
 
 
+def _is_blank_line(lines, lineno):
+    return lineno < 1 or not lines[lineno - 1].strip()
+
+
+def find_strong_boundaries(lines, start, end):
+    """Section starts within a range that are safe to cut at without judgement.
+
+    Keeps the find_section_headers() hits that mark a new topic in these
+    documents: *** routine markers, chapters, .LIB files, and numbered
+    sections, unindented ALL-CAPS headers and $ADDR labels that follow a
+    blank line. An underline (---/===) marks the title line above it.
+    Blank-line clusters and indented caps (table headers) are left to the
+    model. Returns sorted [(lineno, kind, text)], lineno being where the
+    new section starts.
+    """
+    found = {}
+    for lineno, kind, text in find_section_headers(lines, start, end):
+        line = lines[lineno - 1]
+        after_blank = _is_blank_line(lines, lineno - 1)
+        if kind in ('***', 'CHAP', 'LIB'):
+            found.setdefault(lineno, (kind, text))
+        elif kind in ('NUM', 'ADDR') and after_blank:
+            found.setdefault(lineno, (kind, text))
+        elif kind == 'CAPS' and after_blank and len(line) - len(line.lstrip()) <= 2:
+            found.setdefault(lineno, (kind, text))
+        elif kind == 'SEP' and not _is_blank_line(lines, lineno - 1):
+            title = lines[lineno - 2].strip()
+            # An underlined title, roughly as long as its underline
+            if abs(len(title) - len(line.strip())) <= 3 and _is_blank_line(lines, lineno - 2):
+                found[lineno - 1] = ('TITLE', title[:60])
+    return sorted((n, k, t) for n, (k, t) in found.items() if start < n <= end)
+
+
+def _slug(text):
+    text = re.sub(r'^[\s*]*(\d+(\.\d+)+)\s+', '', text)  # drop section numbers
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')[:30].strip('_')
+
+
+def presplit_chunk(lines, split_entry, max_lines=120, min_lines=25):
+    """Sub-split a chunk at its strong boundaries, without an API call.
+
+    Sections between boundaries are packed in order; a piece is closed
+    once it reaches min_lines, or when the next section would push it
+    over max_lines. A single section longer than max_lines stays as one
+    (still oversized) piece for the model to handle. Returns the new
+    split entries, or None if the chunk has no usable boundaries.
+    """
+    start, end = split_entry['start'], split_entry['end']
+    boundaries = find_strong_boundaries(lines, start, end)
+    if not boundaries:
+        return None
+
+    # Sections: (first line, header text or None for the preamble)
+    sections = []
+    if boundaries[0][0] > start:
+        sections.append((start, None))
+    sections.extend((lineno, text) for lineno, _, text in boundaries)
+
+    pieces = []  # [first line, last line, [header texts]]
+    for i, (first, text) in enumerate(sections):
+        last = sections[i + 1][0] - 1 if i + 1 < len(sections) else end
+        size = last - first + 1
+        if pieces:
+            current = pieces[-1]
+            current_size = current[1] - current[0] + 1
+            if current_size < min_lines and current_size + size <= max_lines:
+                current[1] = last
+                if text:
+                    current[2].append(text)
+                continue
+        pieces.append([first, last, [text] if text else []])
+
+    # A short tail joins the piece before it (if that one is oversized
+    # anyway, the model gets the tail as context)
+    if len(pieces) > 1 and pieces[-1][1] - pieces[-1][0] + 1 < min_lines \
+            and (pieces[-1][1] - pieces[-2][0] + 1 <= max_lines
+                 or pieces[-2][1] - pieces[-2][0] + 1 > max_lines):
+        tail = pieces.pop()
+        pieces[-1][1] = tail[1]
+        pieces[-1][2].extend(tail[2])
+
+    if len(pieces) < 2:
+        return None
+
+    parent = split_entry.get('name', 'chunk')
+    parent_desc = split_entry.get('description', parent)
+    names = set()
+    result = []
+    for first, last, headers in pieces:
+        slug = _slug(headers[0]) if headers else 'intro'
+        if len(headers) > 1:
+            slug = f"{slug}_to_{_slug(headers[-1])}"
+        name = (f"{parent}_{slug}" if slug else f"{parent}_{first}")[:90].rstrip('_')
+        base, n = name, 2
+        while name in names:
+            name = f"{base}_{n}"
+            n += 1
+        names.add(name)
+        covered = '; '.join(headers) if headers else 'introduction'
+        result.append({
+            'start': first, 'end': last, 'name': name,
+            'description': f"{parent_desc} -- {covered}"[:400],
+        })
+
+    # Link each piece to its neighbours, as the model would
+    for i, entry in enumerate(result):
+        refs = []
+        for j in (i - 1, i + 1):
+            if 0 <= j < len(result):
+                refs.append({'chunk': result[j]['name'],
+                             'topic': result[j]['description'].split(' -- ', 1)[-1][:80]})
+        entry['references'] = refs
+    return result
+
+
 def analyze_config(config_path, raw_dir, max_lines=80):
     """Analyze a config file and report oversized chunks with potential boundaries."""
     with open(config_path, 'r', encoding='utf-8') as f:
@@ -146,6 +265,13 @@ def analyze_config(config_path, raw_dir, max_lines=80):
         ideal_chunks = max(2, chunk_lines // 65)
         print(f"    Suggested: ~{ideal_chunks} sub-chunks of ~{chunk_lines // ideal_chunks} lines")
 
+        local = presplit_chunk(lines, s, max_lines=max(max_lines, 120))
+        if local:
+            sizes = [p['end'] - p['start'] + 1 for p in local]
+            print(f"    Local pre-split: {len(local)} pieces ({min(sizes)}-{max(sizes)} lines)")
+        else:
+            print("    Local pre-split: no strong boundaries (needs OpenAI)")
+
 
 def main():
     script_dir = Path(__file__).parent
@@ -17,17 +17,24 @@ Usage:
     uv run scripts/fix_incomplete.py --model gpt-4o            # Use different model (no search)
     uv run scripts/fix_incomplete.py --force                   # Include false-positive files too
     uv run scripts/fix_incomplete.py --workers 8                # Process 8 files concurrently (default: 4)
+
+Replies are streamed. A ## heading outside the allowed set (see _ALLOWED_H2)
+stops the stream as soon as its line arrives and the request is retried
+with a reminder, rather than paying for a full reply that _fix_headings()
+would have to repair; the final attempt runs to completion and is repaired
+as before.
 """
 
 import os
 import re
 import sys
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from openai import OpenAI
+from llm_gateway import LLMGateway
+from md_sections import parse_sections
+import telemetry
 
 
 def _fmt_response(response):
@@ -96,21 +103,17 @@ _FALSE_POSITIVE_PATTERNS = re.compile(
 
 def strip_incomplete_section(md_content):
     """Remove ## Incomplete section (and trailing blank lines) from markdown content."""
-    marker = '## Incomplete'
-    idx = md_content.find(marker)
-    if idx == -1:
+    sec = parse_sections(md_content).find('Incomplete')
+    if sec is None:
         return md_content
 
-    after = md_content[idx + len(marker):]
-    next_heading = re.search(r'^## ', after, re.MULTILINE)
-    if next_heading:
+    before = md_content[:sec.start].rstrip('\n')
+    if sec.end < len(md_content):
         # Keep everything before ## Incomplete + everything from next heading onward
-        rest = after[next_heading.start():]
-        before = md_content[:idx].rstrip('\n')
-        return before + '\n\n' + rest
+        return before + '\n\n' + md_content[sec.end:]
     else:
         # ## Incomplete was the last section — just trim it
-        return md_content[:idx].rstrip('\n') + '\n'
+        return before + '\n'
 
 
 def find_incomplete_files(data_dir):
@@ -121,18 +124,13 @@ def find_incomplete_files(data_dir):
     results = []
     for md_path in sorted(data_dir.glob('*.md')):
         content = md_path.read_text(encoding='utf-8', errors='replace')
-        marker = '## Incomplete'
-        idx = content.find(marker)
-        if idx == -1:
+        sections = parse_sections(content)
+        sec = sections.find('Incomplete')
+        if sec is None:
             continue
 
-        # Extract text from ## Incomplete to next ## heading or EOF
-        after = content[idx + len(marker):]
-        next_heading = re.search(r'^## ', after, re.MULTILINE)
-        if next_heading:
-            incomplete_text = after[:next_heading.start()].strip()
-        else:
-            incomplete_text = after.strip()
+        # Text from ## Incomplete to next ## heading or EOF
+        incomplete_text = sections.body(sec).strip()
 
         # Check if false positive
         is_fp = bool(_FALSE_POSITIVE_PATTERNS.search(incomplete_text))
@@ -203,8 +201,26 @@ def fix_chunk(client, model, md_content, incomplete_text=''):
             'search_context_size': 'high',
         }
 
-    response = client.chat.completions.create(**kwargs)
-    result = response.choices[0].message.content.strip()
+    aborted = []
+    for attempt in range(MAX_HEADING_RETRIES + 1):
+        watch = HeadingWatch()
+        bad_heading = None
+        with client.chat.completions.stream(**kwargs) as stream:
+            for delta in stream:
+                # The last attempt runs to the end; _fix_headings() repairs it
+                if attempt < MAX_HEADING_RETRIES:
+                    bad_heading = watch.feed(delta)
+                    if bad_heading:
+                        break
+        if bad_heading is None:
+            break
+        aborted.append(bad_heading)
+        kwargs['messages'] = messages + [{"role": "user", "content": (
+            f"Your previous attempt was stopped because it used the heading '{bad_heading}'. "
+            f"The ONLY allowed ## headings are: {', '.join(sorted(_ALLOWED_H2))}. "
+            f"Write any other heading as a bold line. Output the complete fixed Markdown again."
+        )}]
+    result = stream.text.strip()
 
     # Strip markdown wrapper if model wrapped output in ```markdown ... ```
     if result.startswith('```markdown') or result.startswith('```md'):
@@ -214,10 +230,42 @@ def fix_chunk(client, model, md_content, incomplete_text=''):
             result = result[:-3].rstrip()
 
     result = _fix_headings(result)
-    return result, _fmt_response(response)
+    info = _fmt_response(stream)
+    if aborted:
+        info += f", {len(aborted)} early abort(s) on {', '.join(aborted)}"
+    return result, info
 
 
 _ALLOWED_H2 = {'## Source Code', '## Key Registers', '## Incomplete', '## References'}
+MAX_HEADING_RETRIES = 2  # early aborts before letting a reply finish
+
+
+class HeadingWatch:
+    """Spot a disallowed ## heading in streamed text as soon as its line is complete.
+
+    Fenced code blocks are skipped, and so is a ```markdown wrapper fence
+    on the first line.
+    """
+
+    def __init__(self):
+        self.buf = ''
+        self.in_code = False
+        self.first = True
+
+    def feed(self, delta):
+        """Add streamed text. Returns the first disallowed heading line, or None."""
+        self.buf += delta
+        while '\n' in self.buf:
+            line, self.buf = self.buf.split('\n', 1)
+            if self.first:
+                self.first = False
+                if line.startswith('```markdown') or line.startswith('```md'):
+                    continue
+            if line.strip().startswith('```'):
+                self.in_code = not self.in_code
+            elif not self.in_code and line.startswith('## ') and line.strip() not in _ALLOWED_H2:
+                return line.strip()
+        return None
 
 
 def _fix_headings(md):
@@ -409,7 +457,7 @@ def main():
 
     client = None
     if not dry_run:
-        client = OpenAI(api_key=api_key)
+        client = LLMGateway(api_key)
 
     total = len(all_incomplete)
     print(f"Processing {total} incomplete file(s) with model={model}")
@@ -439,40 +487,45 @@ def main():
             n = counter['done']
         print(f"  [{n}/{total}] Fixing: {name} ...", flush=True)
 
-        try:
-            md_content = file_path.read_text(encoding='utf-8', errors='replace')
-            result, resp_info = fix_chunk(client, model, md_content, incomplete_text)
+        with telemetry.file_context(name):
+            try:
+                md_content = file_path.read_text(encoding='utf-8', errors='replace')
+                result, resp_info = fix_chunk(client, model, md_content, incomplete_text)
 
-            if not result.startswith('#'):
-                print(f"    WARNING {name}: result doesn't start with # heading, skipping write")
-                with counter_lock:
-                    counter['errors'] += 1
-                return
+                if not result.startswith('#'):
+                    print(f"    WARNING {name}: result doesn't start with # heading, skipping write")
+                    with counter_lock:
+                        counter['errors'] += 1
+                    return
 
-            file_path.write_text(result, encoding='utf-8')
+                file_path.write_text(result, encoding='utf-8')
 
-            still_incomplete = '## Incomplete' in result
-            status = "partially fixed" if still_incomplete else "fully fixed"
-            print(f"    done -> {name} ({status}) [{resp_info}]")
+                still_incomplete = '## Incomplete' in result
+                status = "partially fixed" if still_incomplete else "fully fixed"
+                print(f"    done -> {name} ({status}) [{resp_info}]")
 
-            with counter_lock:
-                counter['processed'] += 1
+                with counter_lock:
+                    counter['processed'] += 1
 
-        except Exception as e:
-            with counter_lock:
-                counter['errors'] += 1
-            print(f"    ERROR {name}: {e}")
+            except Exception as e:
+                with counter_lock:
+                    counter['errors'] += 1
+                print(f"    ERROR {name}: {e}")
 
     print(f"Using {workers} workers...")
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(process_one, fp, txt)
-                   for fp, txt, _ in all_incomplete]
-        for f in as_completed(futures):
-            f.result()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_one, fp, txt)
+                       for fp, txt, _ in all_incomplete]
+            for f in as_completed(futures):
+                f.result()
+    finally:
+        client.close()
 
     # Summary
     print(f"\n{'='*50}")
     print(f"Fixed: {counter['processed']} processed, {counter['errors']} errors (of {total} total)")
+    print(client.summary())
 
 
 if __name__ == '__main__':
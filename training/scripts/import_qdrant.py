@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # /// script
-# dependencies = ["openai", "requests"]
+# dependencies = ["blake3", "ijson", "openai", "requests"]
 # ///
 """
 Import training data into Qdrant vector database.
@@ -16,28 +16,123 @@ Usage:
     uv run scripts/import_qdrant.py --force           # Recreate collection and reimport all
     uv run scripts/import_qdrant.py --dry-run          # Show what would be imported
     uv run scripts/import_qdrant.py some_file.md       # Import specific file(s)
+    uv run scripts/import_qdrant.py --workers 8        # 8 concurrent embedding requests (default: 4)
+    uv run scripts/import_qdrant.py --no-embed-cache   # Ignore stored vectors, re-embed everything
+    uv run scripts/import_qdrant.py --cache-stats      # Show embedding store size
+    uv run scripts/import_qdrant.py --cache-gc         # Drop stored vectors for text no longer in data/
+    uv run scripts/import_qdrant.py --cache-gc --cache-max-mb 200  # ...and trim LRU to 200 MB
+    uv run scripts/import_qdrant.py --blue-green       # Rebuild into a shadow collection, then swap the alias
+    uv run scripts/import_qdrant.py --resume           # Continue an interrupted run where it stopped
+    uv run scripts/import_qdrant.py --force --dims 1024 --quantization scalar  # Smaller collection
+    uv run scripts/import_qdrant.py --force --passages  # Also embed passages of long chunks
+    uv run scripts/import_qdrant.py --blue-green --passage-budget 3  # ...at most 3 per chunk
+    uv run scripts/import_qdrant.py --blocks ../blocks.json [--binary NAME]  # Static-analysis blocks of a binary
+    uv run scripts/import_qdrant.py --drop-binary NAME  # Remove a binary's blocks
+
+Embedding and upserting run as a pipeline: a pool of embedding workers feeds
+a single upsert thread through a bounded queue, so Qdrant writes overlap with
+the next embedding requests. Workers share one rate-limited client
+(llm_gateway.py: RPM/TPM token buckets, jittered retries, Retry-After), so
+they run at the account's limits instead of backing off blindly.
+
+Every embedding is also kept in a content-addressed store (embedding_store.py,
+keyed by model, dimensions and md5 of the embedded text) that --force does not
+clear, so rebuilding or recreating the collection replays stored vectors
+without API calls.
+
+Each run is logged to import_run.jsonl: which batches were embedded and which
+were committed to Qdrant. If a run dies, --resume continues it with the same
+mode and target collection, skipping every committed file (uncommitted
+batches replay their vectors from the store). --blue-green builds a complete
+new collection (c64_training_<timestamp>) while the old one keeps serving,
+then atomically repoints the c64_training alias and drops the old collection,
+so search stays up during a rebuild. The first blue/green run has to replace
+a plain c64_training collection with the alias, which is a brief gap.
+
+A new collection (--force, --blue-green, or none yet) can be built with
+matryoshka-reduced vectors (--dims 256/512/1024/...: the first N dimensions of
+the stored 3072-d vector, renormalised, which is what the API's dimensions
+parameter returns) and with int8 scalar or 1-bit binary quantization
+(--quantization scalar|binary: Qdrant keeps the quantized vectors in RAM and
+the originals on disk for rescoring). Incremental runs keep the collection's
+existing configuration. vector_quant.py measures recall@k of each
+configuration against the full-precision vectors.
+
+--passages (or --passage-budget N) also embeds long chunks in content-defined
+passages (passages.py), stored as child points in <collection>_passages with
+the parent's filename in their payload; search takes each chunk's best score
+over its own vector and its passages. Storage is at most 1 + N vectors per
+chunk (default N = 4). Once a collection has passages, incremental runs keep
+them up to date at the budget it was built with (import_cache.json records
+it; --cache-gc keeps the passage vectors of that budget); turning them on for
+an existing collection backfills every file from the embedding store.
+
+--blocks streams a static-analysis blocks.json into the same collection, one
+point per code or data block with its address interval, block type and
+call/data edges, partitioned per binary (blocks_ingest.py). --force and
+--blue-green import the ingested binaries again after the rebuild.
+
+Set QDRANT_URL / OPENAI_BASE_URL to point the import at the local stand-in
+(scripts/fake_services.py) for benchmarking without Docker or an API key.
 """
 
 import hashlib
 import json
+import math
 import os
+import queue
 import re
 import sys
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 import requests
-from openai import OpenAI
+from requests.adapters import HTTPAdapter
+
+from address_index import (ADDR_PATTERN, CODE_GAP, RANGE_PATTERN, line_intervals, merge_intervals,
+                           to_payload)
+from blocks_ingest import block_embed_hashes, drop_binary, ingest_blocks, ingested_binaries, reingest_binaries
+from embedding_store import EmbeddingStore
+from file_digests import FileDigests
+from llm_gateway import LLMGateway
+from md_sections import ChunkSections, Section, parse_sections
+from passages import DEFAULT_BUDGET, passage_collection, passage_items
+from pipeline_cache import atomic_write_json
+import telemetry
 
 # Configuration
-QDRANT_URL = "http://localhost:6333"
+QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = "c64_training"
 EMBEDDING_MODEL = "text-embedding-3-large"
 EMBEDDING_DIMENSIONS = 3072
 DATA_DIR = Path(__file__).parent.parent / "data"
 CACHE_FILE = Path(__file__).parent.parent / "import_cache.json"
+RUN_JOURNAL_FILE = Path(__file__).parent.parent / "import_run.jsonl"
+PASSAGE_BUDGET_KEY = "passages:budget"  # import_cache.json entry: the live collection's passage budget
 BATCH_SIZE = 20  # embeddings per API call
+# Qdrant quantization_config per --quantization mode; originals stay on disk for rescoring
+QUANTIZATION_CONFIGS = {
+    "scalar": {"scalar": {"type": "int8", "quantile": 0.99, "always_ram": True}},
+    "binary": {"binary": {"always_ram": True}},
+}
+PAYLOAD_INDEXES = {
+    "tags": "keyword",
+    "addr_ranges[].start": "integer",
+    "addr_ranges[].end": "integer",
+}
+# Searches group passages by parent_id (the parent chunk's point ID, so Qdrant
+# can look the chunk up); updates delete them by filename
+PASSAGE_INDEXES = {**PAYLOAD_INDEXES, "parent_id": "keyword", "filename": "keyword"}
+PASSAGE_PAYLOAD = ("type", "tags", "addr_ranges")  # parent fields the search filters need
+
+# One pooled HTTP session for every Qdrant call (keep-alive instead of a new
+# connection per request); sized for the embedding workers plus the upserter.
+_qdrant = requests.Session()
+_qdrant.mount("http://", HTTPAdapter(pool_maxsize=32))
+_qdrant.mount("https://", HTTPAdapter(pool_maxsize=32))
 
 
 def md5(text: str) -> str:
@@ -51,22 +146,96 @@ def load_cache() -> dict:
 
 
 def save_cache(cache: dict):
-    CACHE_FILE.write_text(json.dumps(cache, indent=2) + "\n")
+    atomic_write_json(CACHE_FILE, cache)
 
 
-def strip_references(content: str) -> tuple[str, list[dict]]:
+class RunJournal:
+    """Append-only log of one import run (fsynced JSON lines).
+
+    Events: start (mode, target collection), embedded / committed per batch
+    with {filename: content_hash}, resume, swapped, done. A run without a
+    done event is unfinished and can be resumed.
+    """
+
+    def __init__(self, path: Path = RUN_JOURNAL_FILE):
+        self.path = path
+        self.header: dict | None = None
+        self.committed: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def load_unfinished(self) -> dict | None:
+        """Return {"start", "committed", "embedded"} for an unfinished run, else None."""
+        if not self.path.exists():
+            return None
+        header, committed, embedded, done = None, {}, set(), False
+        for line in self.path.read_text().splitlines():
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash
+            event = rec.get("event")
+            if event == "start":
+                header, committed, embedded, done = rec, {}, set(), False
+            elif event == "embedded":
+                embedded.update(rec["files"])
+            elif event == "committed":
+                committed.update(rec["files"])
+            elif event == "done":
+                done = True
+        if header is None or done:
+            return None
+        return {"start": header, "committed": committed, "embedded": embedded}
+
+    def start(self, header: dict):
+        self.header = {"event": "start", **header}
+        self.committed = {}
+        self.path.write_text("")
+        self._append(self.header)
+
+    def resume(self, previous: dict):
+        self.header = previous["start"]
+        self.committed = dict(previous["committed"])
+        self.log("resume")
+
+    def log(self, event: str, **fields):
+        self._append({"event": event, "time": time.time(), **fields})
+
+    def batch_committed(self, batch_num: int, files: dict[str, str]):
+        self.committed.update(files)
+        self.log("committed", batch=batch_num, files=files)
+
+    def _append(self, record: dict):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def _references_section(sections: ChunkSections) -> Section | None:
+    """The "## References" section (exact heading, not the first line)."""
+    for sec in sections.find_all("References"):
+        if sec.heading == "References" and sec.start > 0 \
+                and sections.content[sec.body_start - 1] == "\n":
+            return sec
+    return None
+
+
+def strip_references(content: str, sections: ChunkSections | None = None) -> tuple[str, list[dict]]:
     """Strip the ## References section from content and parse it.
 
     Returns (content_without_refs, references_list).
     Each reference is {"chunk": "name", "description": "what it covers"}.
+    Everything from the References heading to EOF is treated as references.
     """
-    marker = "\n## References\n"
-    idx = content.find(marker)
-    if idx == -1:
+    sections = sections or parse_sections(content)
+    sec = _references_section(sections)
+    if sec is None:
         return content.strip(), []
 
-    before = content[:idx].strip()
-    refs_text = content[idx + len(marker):]
+    before = content[:sec.start].strip()
+    refs_text = content[sec.body_start:]
 
     refs = []
     for line in refs_text.split("\n"):
@@ -84,30 +253,23 @@ def strip_references(content: str) -> tuple[str, list[dict]]:
     return before, refs
 
 
-def split_source_code(content: str) -> tuple[str, str]:
+def split_source_code(content: str, sections: ChunkSections | None = None) -> tuple[str, str]:
     """Split markdown into header (for embedding) and full content (for payload).
 
     Returns (header_text, full_content).
     Header is everything before '## Source Code'.
     Works for both example files and documentation chunks with assembly listings.
     """
-    marker = "## Source Code"
-    idx = content.find(marker)
-    if idx == -1:
+    sections = sections or parse_sections(content)
+    sec = sections.find("Source Code")
+    if sec is None:
         # No source code section — embed everything
         return content.strip(), content.strip()
-    header = content[:idx].strip()
+    header = content[:sec.start].strip()
     return header, content.strip()
 
 
-# Pattern: $XXXX-$YYYY (address range, dash with optional whitespace)
-_RANGE_PATTERN = re.compile(
-    r'\$([0-9A-Fa-f]{2,4})[-–]\$([0-9A-Fa-f]{2,4})'
-)
-# Pattern: individual $XXXX
-_ADDR_PATTERN = re.compile(r'\$([0-9A-Fa-f]{2,4})')
-
-MAX_RANGE_EXPAND = 256  # don't expand ranges larger than this
+MAX_RANGE_EXPAND = 256  # wider ranges count as 2 registers (their endpoints) toward the cap below
 MAX_REGISTERS_PER_CHUNK = 16  # chunks with more registers than this are "area" docs, not register docs
 
 # Pattern: ROM disassembly line: .,XXXX (4-digit hex address at start of instruction)
@@ -115,31 +277,23 @@ _DISASM_ADDR_PATTERN = re.compile(r'^\.,([0-9A-Fa-f]{4})', re.MULTILINE)
 
 
 def extract_registers_from_line(line: str) -> list[str]:
-    """Extract register addresses from a Key Registers line, expanding ranges.
+    """Extract register address tags from a Key Registers line.
 
-    For '$D000-$D02E', expands to all addresses in the range.
+    For '$D000-$D02E', keeps the endpoints $D000 and $D02E; the addresses
+    in between are found through the chunk's addr_ranges intervals
+    (address_index.py) rather than one tag each.
     For '$D020/$D021', extracts both individually.
-    Ranges > MAX_RANGE_EXPAND just keep endpoints.
     """
     addrs = set()
 
-    # First pass: find and expand ranges like $07C0-$07E7
     range_spans = []
-    for m in _RANGE_PATTERN.finditer(line):
-        start = int(m.group(1), 16)
-        end = int(m.group(2), 16)
+    for m in RANGE_PATTERN.finditer(line):
         range_spans.append((m.start(), m.end()))
-        if start <= end and (end - start) <= MAX_RANGE_EXPAND:
-            for val in range(start, end + 1):
-                addrs.add(f"${val:04X}")
-        else:
-            # Too large or inverted — just keep endpoints
-            addrs.add(f"${start:04X}")
-            addrs.add(f"${end:04X}")
+        addrs.add(f"${int(m.group(1), 16):04X}")
+        addrs.add(f"${int(m.group(2), 16):04X}")
 
-    # Second pass: find individual addresses not part of a range
-    for m in _ADDR_PATTERN.finditer(line):
-        # Skip if this match falls within a range match
+    # Individual addresses not part of a range
+    for m in ADDR_PATTERN.finditer(line):
         in_range = any(rs <= m.start() and m.end() <= re for rs, re in range_spans)
         if not in_range:
             addrs.add(f"${m.group(1).upper()}")
@@ -147,58 +301,48 @@ def extract_registers_from_line(line: str) -> list[str]:
     return sorted(addrs)
 
 
-def extract_code_addresses(content: str) -> list[str]:
-    """Extract instruction addresses from ROM disassembly in ## Source Code.
+def register_count(intervals: list[tuple[int, int]]) -> int:
+    """Registers a chunk documents, for MAX_REGISTERS_PER_CHUNK: every
+    address of a range up to MAX_RANGE_EXPAND wide, 2 for wider ones."""
+    return sum(end - start + 1 if end - start <= MAX_RANGE_EXPAND else 2
+               for start, end in merge_intervals(intervals))
+
+
+def extract_code_intervals(content: str, sections: ChunkSections | None = None) -> list[tuple[int, int]]:
+    """Address intervals of the ROM disassembly in ## Source Code.
 
     Parses .,XXXX patterns (ROM disassembly lines) to make chunks
-    findable by any address within the disassembled range.
+    findable by any address within the disassembled range; addresses
+    less than CODE_GAP apart are joined into one interval.
     Only applies to actual disassembly — BASIC/data tables are ignored.
     """
-    marker = "## Source Code"
-    idx = content.find(marker)
-    if idx == -1:
+    sections = sections or parse_sections(content)
+    sec = sections.find("Source Code")
+    if sec is None:
         return []
 
-    # Find the end of Source Code section (next ## heading or EOF)
-    rest = content[idx + len(marker):]
-    end_idx = rest.find("\n## ")
-    source_block = rest[:end_idx] if end_idx != -1 else rest
-
-    addrs = set()
-    for m in _DISASM_ADDR_PATTERN.finditer(source_block):
-        addrs.add(f"${m.group(1).upper()}")
-
-    return sorted(addrs)
+    addrs = [int(m.group(1), 16) for m in _DISASM_ADDR_PATTERN.finditer(sections.body(sec))]
+    return merge_intervals([(a, a) for a in addrs], gap=CODE_GAP)
 
 
-def extract_section_items(content: str, heading: str) -> list[str]:
+def extract_section_items(content: str, heading: str,
+                          sections: ChunkSections | None = None) -> list[str]:
     """Extract list items from a markdown section by heading name.
 
     Parses "- ITEM" lines under the given ## heading until the next ## or EOF.
     Returns the first whitespace-delimited token from each line (uppercase).
     """
-    items = []
-    in_section = False
-    for line in content.split("\n"):
-        if line.startswith(f"## {heading}"):
-            in_section = True
-            continue
-        elif line.startswith("## ") and in_section:
-            break
-        elif in_section and line.startswith("- "):
-            token = line[2:].strip().split()[0] if line[2:].strip() else ""
-            if token:
-                items.append(token.upper())
-    return items
+    return (sections or parse_sections(content)).items(heading)
 
 
-def extract_metadata(content: str, filename: str) -> dict:
+def extract_metadata(content: str, filename: str, sections: ChunkSections | None = None) -> dict:
     """Extract structured metadata from the markdown content."""
+    sections = sections or parse_sections(content)
     meta = {"filename": filename}
 
     # Chunks with ## Source Code have concrete backing for their registers
     # (register maps, disassembly, etc.) — bypass the cap
-    has_source_code = "## Source Code" in content
+    has_source_code = sections.has("Source Code")
 
     # Detect type
     if filename.startswith("example_"):
@@ -206,83 +350,66 @@ def extract_metadata(content: str, filename: str) -> dict:
     else:
         meta["type"] = "documentation"
 
-    # Extract title from first # heading
-    for line in content.split("\n"):
-        if line.startswith("# "):
-            meta["title"] = line[2:].strip()
-            break
+    # Title from first # heading
+    if sections.title is not None:
+        meta["title"] = sections.title
+
+    # Address intervals behind the register tags (payload "addr_ranges")
+    intervals = []
 
     # For examples, extract hardware, techniques, and key registers
     if meta["type"] == "example":
-        in_techniques = False
-        in_hardware = False
-        in_registers = False
         techniques = []
         registers = []
-        for line in content.split("\n"):
-            if line.startswith("## Techniques"):
-                in_techniques = True
-                in_hardware = False
-                in_registers = False
-                continue
-            elif line.startswith("## Hardware"):
-                in_hardware = True
-                in_techniques = False
-                in_registers = False
-                continue
-            elif line.startswith("## Key Registers"):
-                in_registers = True
-                in_techniques = False
-                in_hardware = False
-                continue
-            elif line.startswith("## "):
-                in_techniques = False
-                in_hardware = False
-                in_registers = False
-                continue
-
-            if in_techniques and line.startswith("- "):
-                techniques.append(line[2:].strip())
-            elif in_hardware and line.strip():
-                meta["hardware"] = line.strip()
-            elif in_registers and line.startswith("- "):
-                registers.extend(extract_registers_from_line(line))
+        ranges = []
+        for sec in sections.sections:
+            if sec.heading.startswith("Techniques"):
+                techniques.extend(line[2:].strip() for line in sections.body(sec).split("\n")
+                                  if line.startswith("- "))
+            elif sec.heading.startswith("Hardware"):
+                for line in sections.body(sec).split("\n"):
+                    if line.strip():
+                        meta["hardware"] = line.strip()
+            elif sec.heading.startswith("Key Registers"):
+                for line in sections.body(sec).split("\n"):
+                    if line.startswith("- "):
+                        registers.extend(extract_registers_from_line(line))
+                        ranges.extend(line_intervals(line))
 
         if techniques:
             meta["techniques"] = techniques
         if registers:
             unique = sorted(set(registers))
-            if has_source_code or len(unique) <= MAX_REGISTERS_PER_CHUNK:
+            if has_source_code or register_count(ranges) <= MAX_REGISTERS_PER_CHUNK:
                 meta["tags"] = unique
+                intervals.extend(ranges)
 
     # For all types, parse ## Key Registers if present
     if "tags" not in meta:
-        in_registers = False
         registers = []
-        for line in content.split("\n"):
-            if line.startswith("## Key Registers"):
-                in_registers = True
-                continue
-            elif line.startswith("## ") and in_registers:
-                break
-            elif in_registers and line.startswith("- "):
-                registers.extend(extract_registers_from_line(line))
+        ranges = []
+        sec = sections.find("Key Registers")
+        if sec is not None:
+            for line in sections.body(sec).split("\n"):
+                if line.startswith("- "):
+                    registers.extend(extract_registers_from_line(line))
+                    ranges.extend(line_intervals(line))
         if registers:
             unique = sorted(set(registers))
-            if has_source_code or len(unique) <= MAX_REGISTERS_PER_CHUNK:
+            if has_source_code or register_count(ranges) <= MAX_REGISTERS_PER_CHUNK:
                 meta["tags"] = unique
+                intervals.extend(ranges)
 
-    # Merge in disassembly instruction addresses from ## Source Code
+    # Merge in disassembly address ranges from ## Source Code
     # These bypass MAX_REGISTERS_PER_CHUNK — they're precise code locations, not area descriptions
-    code_addrs = extract_code_addresses(content)
-    if code_addrs:
-        existing = set(meta.get("tags", []))
-        meta["tags"] = sorted(existing | set(code_addrs))
+    intervals.extend(extract_code_intervals(content, sections))
+    if intervals:
+        meta["addr_ranges"] = to_payload(merge_intervals(intervals))
 
     # Merge labels and mnemonics from ## Labels and ## Mnemonics sections
     # These are curated by OpenAI and bypass the register cap
-    labels = extract_section_items(content, "Labels")
-    mnemonics = extract_section_items(content, "Mnemonics")
+    labels = sections.items("Labels")
+    mnemonics = sections.items("Mnemonics")
     if labels or mnemonics:
         existing = set(meta.get("tags", []))
         existing.update(labels)
@@ -292,7 +419,52 @@ def extract_metadata(content: str, filename: str) -> dict:
     return meta
 
 
-def get_embedding(client: OpenAI, texts: list[str]) -> list[list[float]]:
+def _embed_and_payload_text(content: str, sections: ChunkSections) -> tuple[str, str]:
+    """(embed text, content without references) from one parse of content.
+
+    Same result as split_source_code(strip_references(content)[0]), using
+    offsets into the original content instead of re-parsing the stripped copy.
+    """
+    refs = _references_section(sections)
+    no_refs_end = refs.start if refs is not None else len(content)
+    src = sections.find("Source Code")
+    embed_end = min(src.start, no_refs_end) if src is not None else no_refs_end
+    return content[:embed_end].strip(), content[:no_refs_end].strip()
+
+
+def build_embed_text(content: str) -> str:
+    """The text that gets embedded for a chunk: references and source code stripped."""
+    embed_text, _ = _embed_and_payload_text(content, parse_sections(content))
+    return embed_text
+
+
+def prepare_item(filename: str, content: str, content_hash: str) -> dict:
+    """Build the embed text, payload content and metadata for one data file."""
+    is_example = filename.startswith("example_")
+    sections = parse_sections(content)
+    metadata = extract_metadata(content, filename, sections)
+
+    # Strip references from embedding text, store as metadata
+    _, refs = strip_references(content, sections)
+    if refs:
+        metadata["references"] = refs
+
+    # Strip source code from embedding text for all types
+    embed_text, content_no_refs = _embed_and_payload_text(content, sections)
+    # Payload stores full content (examples without refs, docs with refs)
+    full_content = content_no_refs if is_example else content
+
+    return {
+        "filename": filename,
+        "embed_text": embed_text,
+        "embed_hash": md5(embed_text),
+        "full_content": full_content,
+        "metadata": metadata,
+        "content_hash": content_hash,
+    }
+
+
+def get_embedding(client: LLMGateway, texts: list[str]) -> list[list[float]]:
     """Get embeddings for a batch of texts."""
     response = client.embeddings.create(
         model=EMBEDDING_MODEL,
@@ -301,65 +473,209 @@ def get_embedding(client: OpenAI, texts: list[str]) -> list[list[float]]:
     return [item.embedding for item in response.data]
 
 
-def qdrant_collection_exists() -> bool:
+def reduce_dims(vector: list[float], dims: int) -> list[float]:
+    """Matryoshka truncation: the first dims components, L2-renormalised."""
+    if dims >= len(vector):
+        return vector
+    head = vector[:dims]
+    norm = math.sqrt(sum(x * x for x in head)) or 1.0
+    return [x / norm for x in head]
+
+
+def _fmt_elapsed(seconds: float) -> str:
+    """Format elapsed seconds as a human-readable string."""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes = int(seconds) // 60
+    secs = seconds - minutes * 60
+    return f"{minutes}m {secs:.0f}s"
+
+
+def embed_batch_cached(client: LLMGateway | None, store: EmbeddingStore | None,
+                       batch: list[dict]) -> tuple[list[list[float]], int]:
+    """Embed a batch, serving stored vectors first. Returns (embeddings, api_count)."""
+    hashes = [item["embed_hash"] for item in batch]
+    cached = store.get_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, hashes) if store else {}
+    missing = [i for i, h in enumerate(hashes) if h not in cached]
+    if store:
+        for item, h in zip(batch, hashes):
+            telemetry.record_cache(h in cached, item.get("filename"), "embedding_store")
+
+    if missing:
+        if client is None:
+            raise RuntimeError(f"{len(missing)} embeddings not in store and no OpenAI client")
+        fresh = get_embedding(client, [batch[i]["embed_text"] for i in missing])
+        new_entries = [(hashes[i], vec) for i, vec in zip(missing, fresh)]
+        if store:
+            store.put_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, new_entries)
+        cached.update(new_entries)
+
+    return [cached[h] for h in hashes], len(missing)
+
+
+def run_cache_maintenance(store: EmbeddingStore, gc: bool, max_mb: float | None,
+                          passage_budget: int = DEFAULT_BUDGET):
+    """--cache-stats / --cache-gc: report and prune the embedding store."""
+    if gc:
+        live = set()
+        for f in sorted(DATA_DIR.glob("*.md")):
+            item = {"filename": f.name, "embed_text": build_embed_text(f.read_text())}
+            live.add(md5(item["embed_text"]))
+            live.update(passage["embed_hash"] for passage in passage_items(item, passage_budget))
+        # ...and the blocks of every ingested binary, from its recorded blocks.json
+        missing = []
+        for binary, entry in sorted(ingested_binaries(load_cache()).items()):
+            if entry["path"] and Path(entry["path"]).is_file():
+                live.update(block_embed_hashes(Path(entry["path"]), binary))
+            else:
+                missing.append(f"{binary} ({entry['path'] or 'path not recorded'})")
+        if missing:
+            print(f"Skipping the embedding store GC: the blocks.json of {', '.join(missing)} is gone"
+                  f" — re-run --blocks for it (or --drop-binary) first")
+        else:
+            max_bytes = int(max_mb * 1024 * 1024) if max_mb is not None else None
+            orphans, lru = store.gc(live, max_bytes)
+            print(f"Embedding store GC: {orphans} orphaned vectors removed, {lru} trimmed (LRU)"
+                  f" — {len(live)} live texts in {DATA_DIR.name}/ and ingested blocks")
+
+    rows = store.stats()
+    print(f"Embedding store: {store.path} ({store.file_size() / 1024 / 1024:.1f} MB on disk)")
+    if not rows:
+        print("  (empty)")
+    for row in rows:
+        print(f"  {row['model']} {row['dims']}d: {row['count']} vectors,"
+              f" {row['bytes'] / 1024 / 1024:.1f} MB")
+
+
+def qdrant_collection_exists(collection: str = COLLECTION_NAME) -> bool:
     """Check if the collection exists."""
-    r = requests.get(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")
+    r = _qdrant.get(f"{QDRANT_URL}/collections/{collection}")
     return r.status_code == 200
 
 
-def qdrant_create_collection():
-    """Create the Qdrant collection with proper vector config and payload indexes."""
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}",
-        json={
-            "vectors": {
-                "size": EMBEDDING_DIMENSIONS,
-                "distance": "Cosine",
-            }
-        },
-    )
+def qdrant_vector_config(collection: str = COLLECTION_NAME) -> tuple[int, str | None]:
+    """(vector size, quantization mode or None) of an existing collection."""
+    r = _qdrant.get(f"{QDRANT_URL}/collections/{collection}")
     r.raise_for_status()
-    print(f"  Created collection '{COLLECTION_NAME}' ({EMBEDDING_DIMENSIONS}d cosine)")
-
-    # Create payload index on tags for keyword filtering
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/index",
-        json={
-            "field_name": "tags",
-            "field_schema": "keyword",
-        },
-    )
+    config = r.json()["result"]["config"]
+    quantization = config.get("quantization_config") or {}
+    mode = next((name for name, spec in QUANTIZATION_CONFIGS.items()
+                 if next(iter(spec)) in quantization), None)
+    return config["params"]["vectors"]["size"], mode
+
+
+def qdrant_create_collection(collection: str = COLLECTION_NAME, dims: int = EMBEDDING_DIMENSIONS,
+                             quantization: str | None = None, indexes: dict[str, str] = PAYLOAD_INDEXES):
+    """Create the Qdrant collection with proper vector config and payload indexes."""
+    body = {
+        "vectors": {
+            "size": dims,
+            "distance": "Cosine",
+            "on_disk": quantization is not None,  # quantized copies are searched from RAM
+        }
+    }
+    if quantization:
+        body["quantization_config"] = QUANTIZATION_CONFIGS[quantization]
+    r = _qdrant.put(f"{QDRANT_URL}/collections/{collection}", json=body)
     r.raise_for_status()
-    print(f"  Created payload index on 'tags' (keyword)")
+    print(f"  Created collection '{collection}' ({dims}d cosine"
+          f"{f', {quantization} quantization' if quantization else ''})")
+
+    # Payload indexes: tags for keyword filtering, address interval bounds for range filters
+    for field_name, schema in indexes.items():
+        r = _qdrant.put(
+            f"{QDRANT_URL}/collections/{collection}/index",
+            json={
+                "field_name": field_name,
+                "field_schema": schema,
+            },
+        )
+        r.raise_for_status()
+        print(f"  Created payload index on '{field_name}' ({schema})")
+
+
+def passage_points(item: dict, embeddings: list[list[float]], dims: int) -> list[dict]:
+    """Child points for an item's passages: the parent's point ID, filename and
+    filter fields in the payload."""
+    parent_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, item["filename"]))
+    points = []
+    for passage, embedding in zip(item.get("passages", []), embeddings):
+        points.append({
+            "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{item['filename']}#{passage['passage']}")),
+            "vector": reduce_dims(embedding, dims),
+            "payload": {
+                "document": passage["embed_text"],
+                "parent_id": parent_id,
+                "filename": item["filename"],
+                "passage": passage["passage"],
+                **{key: item["metadata"][key] for key in PASSAGE_PAYLOAD if key in item["metadata"]},
+            },
+        })
+    return points
 
 
-def qdrant_delete_collection():
+def qdrant_delete_collection(collection: str = COLLECTION_NAME):
     """Delete the collection if it exists."""
-    r = requests.delete(f"{QDRANT_URL}/collections/{COLLECTION_NAME}")
+    r = _qdrant.delete(f"{QDRANT_URL}/collections/{collection}")
     if r.status_code == 200:
-        print(f"  Deleted existing collection '{COLLECTION_NAME}'")
+        print(f"  Deleted existing collection '{collection}'")
+
+
+def qdrant_get_aliases() -> dict[str, str]:
+    """Map of alias name -> collection name."""
+    r = _qdrant.get(f"{QDRANT_URL}/aliases")
+    r.raise_for_status()
+    return {a["alias_name"]: a["collection_name"] for a in r.json()["result"]["aliases"]}
+
+
+def qdrant_point_alias(alias: str, collection: str, replace: bool):
+    """Point alias at collection. With replace, the old alias is dropped in the
+    same request, so readers switch over atomically."""
+    actions = []
+    if replace:
+        actions.append({"delete_alias": {"alias_name": alias}})
+    actions.append({"create_alias": {"collection_name": collection, "alias_name": alias}})
+    r = _qdrant.post(f"{QDRANT_URL}/collections/aliases", json={"actions": actions})
+    r.raise_for_status()
 
 
-def qdrant_upsert_points(points: list[dict]):
+def qdrant_point_passage_alias(target: str):
+    """Point COLLECTION_NAME's passages alias at target's passage collection,
+    for a target behind the COLLECTION_NAME alias. A plain collection holding
+    the alias name (passages of a pre-alias collection) is dropped first."""
+    alias, collection = passage_collection(COLLECTION_NAME), passage_collection(target)
+    aliases = qdrant_get_aliases()
+    if aliases.get(alias) == collection:
+        return
+    if alias not in aliases and qdrant_collection_exists(alias):
+        qdrant_delete_collection(alias)
+    qdrant_point_alias(alias, collection, replace=alias in aliases)
+    print(f"  Alias '{alias}' -> '{collection}'")
+
+
+def qdrant_upsert_points(points: list[dict], collection: str = COLLECTION_NAME):
     """Upsert points into the collection."""
-    r = requests.put(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points",
+    r = _qdrant.put(
+        f"{QDRANT_URL}/collections/{collection}/points",
         json={"points": points},
     )
     r.raise_for_status()
 
 
-def qdrant_delete_by_filename(filename: str):
-    """Delete all points with a given filename in payload."""
-    r = requests.post(
-        f"{QDRANT_URL}/collections/{COLLECTION_NAME}/points/delete",
-        json={
-            "filter": {
-                "must": [
-                    {"key": "filename", "match": {"value": filename}}
-                ]
-            }
-        },
+def qdrant_delete_by_filenames(filenames: list[str], keep_ids: list[str] | None = None,
+                               collection: str = COLLECTION_NAME):
+    """Delete all points whose payload filename is in filenames, in one request.
+
+    Points listed in keep_ids are spared — the upsert that just wrote them
+    already replaced the old version in place (point IDs are derived from the
+    filename), so only stale leftovers under other IDs need removing.
+    """
+    flt = {"must": [{"key": "filename", "match": {"any": filenames}}]}
+    if keep_ids:
+        flt["must_not"] = [{"has_id": keep_ids}]
+    r = _qdrant.post(
+        f"{QDRANT_URL}/collections/{collection}/points/delete",
+        json={"filter": flt},
     )
     r.raise_for_status()
 
@@ -367,30 +683,114 @@ def qdrant_delete_by_filename(filename: str):
 def main():
     force = "--force" in sys.argv
     dry_run = "--dry-run" in sys.argv
+    resume = "--resume" in sys.argv
+    blue_green = "--blue-green" in sys.argv
+
+    use_store = "--no-embed-cache" not in sys.argv
+    cache_stats = "--cache-stats" in sys.argv
+    cache_gc = "--cache-gc" in sys.argv
+
+    workers = 4
+    if "--workers" in sys.argv:
+        idx = sys.argv.index("--workers")
+        workers = int(sys.argv[idx + 1])
+
+    cache_max_mb = None
+    if "--cache-max-mb" in sys.argv:
+        idx = sys.argv.index("--cache-max-mb")
+        cache_max_mb = float(sys.argv[idx + 1])
+
+    dims = EMBEDDING_DIMENSIONS
+    if "--dims" in sys.argv:
+        idx = sys.argv.index("--dims")
+        dims = int(sys.argv[idx + 1])
+        if not 1 <= dims <= EMBEDDING_DIMENSIONS:
+            print(f"Error: --dims must be between 1 and {EMBEDDING_DIMENSIONS}")
+            sys.exit(1)
+
+    quantization = None
+    if "--quantization" in sys.argv:
+        idx = sys.argv.index("--quantization")
+        quantization = sys.argv[idx + 1]
+        if quantization not in QUANTIZATION_CONFIGS:
+            print(f"Error: --quantization must be one of {', '.join(QUANTIZATION_CONFIGS)}")
+            sys.exit(1)
+
+    passage_budget = DEFAULT_BUDGET if "--passages" in sys.argv else None
+    if "--passage-budget" in sys.argv:
+        idx = sys.argv.index("--passage-budget")
+        passage_budget = int(sys.argv[idx + 1])
+        if passage_budget < 2:
+            print("Error: --passage-budget must be at least 2 (one passage is the chunk itself)")
+            sys.exit(1)
 
     # Collect specific files if given
     specific_files = []
+    skip_next = False
     for arg in sys.argv[1:]:
+        if skip_next:
+            skip_next = False
+            continue
+        if arg in ("--workers", "--cache-max-mb", "--dims", "--quantization", "--passage-budget",
+                   "--blocks", "--binary", "--drop-binary"):
+            skip_next = True
+            continue
         if not arg.startswith("-"):
             specific_files.append(arg)
 
-    # Check OpenAI key
-    api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
-        print("Error: OPENAI_API_KEY environment variable not set")
-        sys.exit(1)
+    store = EmbeddingStore() if use_store or cache_stats or cache_gc else None
+    if cache_stats or cache_gc:
+        passage_budget = passage_budget or load_cache().get(PASSAGE_BUDGET_KEY, DEFAULT_BUDGET)
+        run_cache_maintenance(store, cache_gc, cache_max_mb, passage_budget)
+        return
+
+    if "--blocks" in sys.argv or "--drop-binary" in sys.argv:
+        try:
+            _qdrant.get(f"{QDRANT_URL}/collections", timeout=3)
+        except requests.ConnectionError:
+            print(f"Error: Cannot connect to Qdrant at {QDRANT_URL}")
+            sys.exit(1)
+        if "--drop-binary" in sys.argv:
+            drop_binary(sys.argv[sys.argv.index("--drop-binary") + 1])
+        else:
+            binary = sys.argv[sys.argv.index("--binary") + 1] if "--binary" in sys.argv else None
+            ingest_blocks(Path(sys.argv[sys.argv.index("--blocks") + 1]), binary, workers, dry_run, force)
+        return
 
-    client = OpenAI(api_key=api_key)
+    # An interrupted run is continued with its original mode and target
+    journal = RunJournal()
+    previous = journal.load_unfinished()
+    if resume:
+        if previous is None:
+            print(f"No interrupted import run to resume ({RUN_JOURNAL_FILE.name})")
+            return
+        mode = previous["start"]["mode"]
+        force = mode == "force"
+        blue_green = mode == "blue-green"
+        dims = previous["start"].get("dims", EMBEDDING_DIMENSIONS)
+        quantization = previous["start"].get("quantization")
+        passage_budget = previous["start"].get("passages")
+        print(f"Resuming run {previous['start']['run_id']} ({mode} -> '{previous['start']['collection']}'):"
+              f" {len(previous['committed'])} files already committed")
+    elif previous is not None and not dry_run:
+        print(f"Note: run {previous['start']['run_id']} did not finish — starting over"
+              f" (use --resume to continue it instead)")
+
+    if blue_green and specific_files:
+        print("Error: --blue-green rebuilds the whole collection; don't pass specific files")
+        sys.exit(1)
+    rebuild = force or blue_green
 
     # Check Qdrant is running
     try:
-        requests.get(f"{QDRANT_URL}/collections", timeout=3)
+        _qdrant.get(f"{QDRANT_URL}/collections", timeout=3)
     except requests.ConnectionError:
         print(f"Error: Cannot connect to Qdrant at {QDRANT_URL}")
         print("Start it with: docker start qdrant-db")
         sys.exit(1)
 
     # Gather files to process
+    digests = FileDigests()
     if specific_files:
         md_files = []
         for f in specific_files:
@@ -406,7 +806,7 @@ def main():
             print("No valid files to process")
             sys.exit(1)
     else:
-        md_files = sorted(DATA_DIR.glob("*.md"))
+        md_files = digests.walk(DATA_DIR, "*.md")
 
     if not md_files:
         print("No .md files found in training/data/")
@@ -414,23 +814,44 @@ def main():
 
     print(f"Found {len(md_files)} files in {DATA_DIR}")
 
-    # Load cache
-    cache = {} if force else load_cache()
-
-    # Filter to only changed files
+    # Load cache. A rebuild drops the binaries ingested with --blocks; they
+    # are imported again from their recorded blocks.json once it's done
+    cache = load_cache()
+    reingest = previous["start"].get("blocks", {}) if resume else ingested_binaries(cache) if rebuild else {}
+    if rebuild:
+        cache = {}
+    backfill = False
+    if passage_budget and not rebuild and not resume:
+        live_passages = passage_collection(qdrant_get_aliases().get(COLLECTION_NAME, COLLECTION_NAME))
+        if not qdrant_collection_exists(live_passages):
+            # Stored vectors make this cheap: only the passages hit the API
+            print(f"No '{live_passages}' yet — importing every file to add passages")
+            backfill = True
+    committed = previous["committed"] if resume else {}
+
+    # Filter to only changed files (and, when resuming, not yet committed).
+    # Content hashes are MD5s of the file bytes, from the stat-keyed digests:
+    # only files that changed since the last run are read here
     to_process = []
-    for f in md_files:
-        content = f.read_text()
-        content_hash = md5(content)
-        if not force and cache.get(f.name) == content_hash:
+    for f, content_hash in zip(md_files, digests.md5_many(md_files)):
+        if not rebuild and not backfill and cache.get(f.name) == content_hash:
             continue
-        to_process.append((f, content, content_hash))
-
-    if not to_process:
+        if committed.get(f.name) == content_hash:
+            continue
+        to_process.append((f, f.read_text(encoding="utf-8"), content_hash))
+    digests.save()
+
+    if not to_process and not (resume and blue_green):
+        if resume and not dry_run:
+            journal.resume(previous)
+            reingest_binaries(reingest, workers)
+            journal.log("done", imported=0)
         print("All files up to date — nothing to import")
         return
 
-    print(f"{len(to_process)} files to import ({len(md_files) - len(to_process)} unchanged)")
+    skipped = len(md_files) - len(to_process)
+    print(f"{len(to_process)} files to import"
+          f" ({skipped} {'already committed or unchanged' if resume else 'unchanged'})")
 
     if dry_run:
         for f, _, _ in to_process:
@@ -438,92 +859,262 @@ def main():
             print(f"  {'[example]' if is_example else '[doc]    '} {f.name}")
         return
 
-    # Handle collection setup
-    if force:
-        qdrant_delete_collection()
-        time.sleep(0.5)  # let Qdrant settle
-        qdrant_create_collection()
-        cache = {}
-    elif not qdrant_collection_exists():
-        qdrant_create_collection()
-
-    # Prepare all items: (filename, embed_text, full_content, metadata, content_hash)
-    items = []
-    for f, content, content_hash in to_process:
-        is_example = f.name.startswith("example_")
-        metadata = extract_metadata(content, f.name)
-
-        # Strip references from embedding text, store as metadata
-        content_no_refs, refs = strip_references(content)
-        if refs:
-            metadata["references"] = refs
-
-        # Strip source code from embedding text for all types
-        embed_text, _ = split_source_code(content_no_refs)
-        # Payload stores full content (examples without refs, docs with refs)
-        if is_example:
-            _, full_content = split_source_code(content_no_refs)
+    # Handle collection setup. COLLECTION_NAME may be an alias (after a
+    # blue/green run); writes go to the collection behind it.
+    aliases = qdrant_get_aliases()
+    live = aliases.get(COLLECTION_NAME, COLLECTION_NAME)
+    if resume:
+        target = previous["start"]["collection"]
+        journal.resume(previous)
+        if not qdrant_collection_exists(target):
+            qdrant_create_collection(target, dims, quantization)
+        if passage_budget and not qdrant_collection_exists(passage_collection(target)):
+            qdrant_create_collection(passage_collection(target), dims, quantization, PASSAGE_INDEXES)
+        if not blue_green:
+            cache = load_cache()
+            if passage_budget:
+                cache[PASSAGE_BUDGET_KEY] = passage_budget
+            if passage_budget and target != COLLECTION_NAME:
+                qdrant_point_passage_alias(target)
+    else:
+        run_id = time.strftime("%Y%m%d_%H%M%S")
+        if blue_green:
+            # Drop the shadow of an abandoned blue/green run, if any
+            if previous is not None and previous["start"]["mode"] == "blue-green" \
+                    and previous["start"]["collection"] != live:
+                qdrant_delete_collection(previous["start"]["collection"])
+                qdrant_delete_collection(passage_collection(previous["start"]["collection"]))
+            target = f"{COLLECTION_NAME}_{run_id}"
+            qdrant_create_collection(target, dims, quantization)
+            if passage_budget:
+                qdrant_create_collection(passage_collection(target), dims, quantization, PASSAGE_INDEXES)
         else:
-            full_content = content
-
-        items.append({
-            "filename": f.name,
-            "embed_text": embed_text,
-            "full_content": full_content,
-            "metadata": metadata,
-            "content_hash": content_hash,
-        })
-
-    # Process in batches
-    total_imported = 0
-    for batch_start in range(0, len(items), BATCH_SIZE):
-        batch = items[batch_start:batch_start + BATCH_SIZE]
-        batch_texts = [item["embed_text"] for item in batch]
-
-        print(f"  Embedding batch {batch_start // BATCH_SIZE + 1}"
-              f" ({len(batch)} items)...", end="", flush=True)
-
-        embeddings = get_embedding(client, batch_texts)
-
-        # Delete old versions and upsert new ones
-        points = []
-        for item, embedding in zip(batch, embeddings):
-            # Delete any existing point for this file
-            if not force:  # force already wiped collection
-                qdrant_delete_by_filename(item["filename"])
-
-            point_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, item["filename"]))
-            points.append({
-                "id": point_id,
-                "vector": embedding,
-                "payload": {
-                    "document": item["full_content"],
-                    "filename": item["filename"],
-                    **item["metadata"],
-                },
-            })
-
-        qdrant_upsert_points(points)
-
-        # Update cache
-        for item in batch:
-            cache[item["filename"]] = item["content_hash"]
-        save_cache(cache)
-
-        total_imported += len(batch)
-        print(f" done")
+            target = live
+            if force:
+                qdrant_delete_collection(target)
+                qdrant_delete_collection(passage_collection(target))
+                time.sleep(0.5)  # let Qdrant settle
+                qdrant_create_collection(target, dims, quantization)
+                if passage_budget:
+                    qdrant_create_collection(passage_collection(target), dims, quantization, PASSAGE_INDEXES)
+                if target != COLLECTION_NAME:
+                    # Deleting a collection drops its aliases too
+                    qdrant_point_alias(COLLECTION_NAME, target, replace=False)
+            elif not qdrant_collection_exists(target):
+                qdrant_create_collection(target, dims, quantization)
+                if passage_budget:
+                    qdrant_create_collection(passage_collection(target), dims, quantization, PASSAGE_INDEXES)
+            else:
+                # Incremental runs keep the collection's vector configuration
+                existing = qdrant_vector_config(target)
+                if "--dims" in sys.argv or "--quantization" in sys.argv:
+                    if existing != (dims, quantization):
+                        print(f"Error: '{target}' is {existing[0]}d, quantization {existing[1] or 'none'};"
+                              f" use --force or --blue-green to change it")
+                        sys.exit(1)
+                dims, quantization = existing
+                # ...and its passages, if it has them
+                if qdrant_collection_exists(passage_collection(target)):
+                    stored_budget = load_cache().get(PASSAGE_BUDGET_KEY)
+                    if stored_budget is None:  # built before the budget was recorded
+                        stored_budget = passage_budget or DEFAULT_BUDGET
+                    elif "--passage-budget" in sys.argv and passage_budget != stored_budget:
+                        print(f"Error: '{passage_collection(target)}' has passages at budget {stored_budget};"
+                              f" use --force or --blue-green to change it")
+                        sys.exit(1)
+                    passage_budget = stored_budget
+                elif passage_budget:
+                    qdrant_create_collection(passage_collection(target), dims, quantization, PASSAGE_INDEXES)
+            if passage_budget and target != COLLECTION_NAME:
+                # The passages alias follows the collection alias (search reads through it)
+                qdrant_point_passage_alias(target)
+        mode = "blue-green" if blue_green else ("force" if force else "incremental")
+        if passage_budget:
+            cache[PASSAGE_BUDGET_KEY] = passage_budget
+        else:
+            cache.pop(PASSAGE_BUDGET_KEY, None)
+        journal.start({"run_id": run_id, "mode": mode, "collection": target,
+                       "dims": dims, "quantization": quantization, "passages": passage_budget,
+                       "blocks": reingest, "files": len(to_process), "time": time.time()})
+
+    # Prepare all items: embed text, payload content, metadata
+    items = [prepare_item(f.name, content, content_hash) for f, content, content_hash in to_process]
+    if passage_budget:
+        for item in items:
+            item["passages"] = passage_items(item, passage_budget)
+        long_items = sum(1 for item in items if item["passages"])
+        print(f"  {sum(len(item['passages']) for item in items)} passages of {long_items} long chunks"
+              f" (budget {passage_budget} per chunk) -> '{passage_collection(target)}'")
+    embed_hashes = [entry["embed_hash"] for item in items for entry in [item, *item.get("passages", [])]]
+
+    # Stored vectors are replayed; only texts never embedded before hit the API
+    stored = store.contains_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, embed_hashes) if store else set()
+    need_api = sum(1 for h in embed_hashes if h not in stored)
+    print(f"  {len(embed_hashes) - need_api} embeddings in store, {need_api} to request from OpenAI")
+
+    # Check OpenAI key (not needed when everything is stored)
+    client = None
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if need_api:
+        if not api_key:
+            print("Error: OPENAI_API_KEY environment variable not set")
+            sys.exit(1)
+        client = LLMGateway(api_key)
+
+    # Pipeline: embedding workers -> bounded queue -> single upsert thread.
+    # The queue bound is the backpressure: when Qdrant falls behind, workers
+    # block on put() instead of piling finished embeddings up in memory.
+    batches = [items[i:i + BATCH_SIZE] for i in range(0, len(items), BATCH_SIZE)]
+    upsert_queue = queue.Queue(maxsize=workers * 2)
+    counter = {"imported": 0, "passages": 0, "batches": 0, "errors": 0, "api_embeddings": 0}
+    counter_lock = threading.Lock()
+    run_start = time.time()
+
+    print(f"Importing {len(items)} files into '{target}' in {len(batches)} batches with {workers} workers...")
+
+    def embed_one(batch_num: int, batch: list[dict]):
+        call_start = time.time()
+        try:
+            # A chunk's passages ride in the same request, after the chunks
+            texts = batch + [passage for item in batch for passage in item.get("passages", [])]
+            with telemetry.file_context(f"batch {batch_num}"):
+                embeddings, api_count = embed_batch_cached(client, store, texts)
+        except Exception as e:
+            with counter_lock:
+                counter["errors"] += 1
+            print(f"  ERROR embedding batch {batch_num}: {e}")
+            return
+        with counter_lock:
+            counter["api_embeddings"] += api_count
+        journal.log("embedded", batch=batch_num,
+                    files={item["filename"]: item["content_hash"] for item in batch})
+        upsert_queue.put((batch_num, batch, embeddings, time.time() - call_start))
+
+    def upsert_loop():
+        while True:
+            entry = upsert_queue.get()
+            if entry is None:
+                break
+            batch_num, batch, embeddings, embed_elapsed = entry
+
+            try:
+                points = []
+                for item, embedding in zip(batch, embeddings):
+                    point_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, item["filename"]))
+                    points.append({
+                        "id": point_id,
+                        "vector": reduce_dims(embedding, dims),
+                        "payload": {
+                            "document": item["full_content"],
+                            "filename": item["filename"],
+                            **item["metadata"],
+                        },
+                    })
+
+                # Upsert replaces each file's point in place (same ID), then a
+                # single filter delete sweeps any stale points for the batch
+                qdrant_upsert_points(points, target)
+                if not rebuild:  # rebuilds start from an empty collection
+                    qdrant_delete_by_filenames([item["filename"] for item in batch],
+                                               keep_ids=[p["id"] for p in points],
+                                               collection=target)
+
+                children = []
+                if passage_budget:
+                    offset = len(batch)
+                    for item in batch:
+                        count = len(item["passages"])
+                        children.extend(passage_points(item, embeddings[offset:offset + count], dims))
+                        offset += count
+                    if children:
+                        qdrant_upsert_points(children, passage_collection(target))
+                    if not rebuild:  # also drops the passages of chunks that got shorter
+                        qdrant_delete_by_filenames([item["filename"] for item in batch],
+                                                   keep_ids=[p["id"] for p in children],
+                                                   collection=passage_collection(target))
+
+                journal.batch_committed(
+                    batch_num, {item["filename"]: item["content_hash"] for item in batch})
+
+                # Update cache (only this thread touches it). A blue/green
+                # build isn't live yet, so its cache is written at the swap.
+                if not blue_green:
+                    for item in batch:
+                        cache[item["filename"]] = item["content_hash"]
+                    save_cache(cache)
+            except Exception as e:
+                with counter_lock:
+                    counter["errors"] += 1
+                print(f"  ERROR upserting batch {batch_num}: {e}")
+                continue
 
-        # Rate limit
-        if batch_start + BATCH_SIZE < len(items):
-            time.sleep(0.5)
+            with counter_lock:
+                counter["imported"] += len(batch)
+                counter["passages"] += len(children)
+                counter["batches"] += 1
+                n = counter["batches"]
+            print(f"  [{n}/{len(batches)}] batch {batch_num}: {len(batch)} points"
+                  f"{f' + {len(children)} passages' if children else ''} (embed {_fmt_elapsed(embed_elapsed)}, queue {upsert_queue.qsize()})")
 
-    print(f"\nImported {total_imported} files into '{COLLECTION_NAME}'")
+    upserter = threading.Thread(target=upsert_loop, name="qdrant-upsert")
+    upserter.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(embed_one, n, b) for n, b in enumerate(batches, 1)]
+            for f in as_completed(futures):
+                f.result()  # propagate unexpected exceptions
+    finally:
+        upsert_queue.put(None)
+        upserter.join()
+
+    total_imported = counter["imported"]
+    elapsed = time.time() - run_start
+    print(f"\nImported {total_imported} files into '{target}'"
+          f" in {_fmt_elapsed(elapsed)} ({total_imported / max(elapsed, 1e-9):.1f} files/s)")
+    if counter["errors"]:
+        print(f"  {counter['errors']} batches failed (not committed — rerun with --resume to retry)")
+    elif blue_green:
+        # Atomically repoint the alias at the new collection, then drop the old one
+        if COLLECTION_NAME in aliases:
+            qdrant_point_alias(COLLECTION_NAME, target, replace=True)
+        else:
+            # One-time migration: a plain collection holds the name the alias needs
+            if qdrant_collection_exists(COLLECTION_NAME):
+                qdrant_delete_collection(COLLECTION_NAME)
+            qdrant_point_alias(COLLECTION_NAME, target, replace=False)
+        print(f"  Alias '{COLLECTION_NAME}' -> '{target}'")
+        passage_alias = passage_collection(COLLECTION_NAME)
+        if passage_budget:
+            qdrant_point_passage_alias(target)
+        elif passage_alias not in aliases:
+            qdrant_delete_collection(passage_alias)  # plain passages of the replaced collection
+        if live != target and live != COLLECTION_NAME:
+            qdrant_delete_collection(live)
+            qdrant_delete_collection(passage_collection(live))  # drops its alias if it wasn't repointed
+        cache = dict(journal.committed)
+        if passage_budget:
+            cache[PASSAGE_BUDGET_KEY] = passage_budget
+        save_cache(cache)
+        journal.log("swapped", alias=COLLECTION_NAME, collection=target, previous=live)
+    print(f"  {counter['api_embeddings']} embeddings requested from OpenAI,"
+          f" {total_imported + counter['passages'] - counter['api_embeddings']} replayed from store")
+    if client:
+        client.close()
+        print(f"  {client.summary()}")
 
     # Summary
     examples = sum(1 for i in items if i["metadata"]["type"] == "example")
     docs = total_imported - examples
     print(f"  {examples} examples (header-only embeddings)")
     print(f"  {docs} documentation chunks (full-text embeddings)")
+    if passage_budget:
+        print(f"  {counter['passages']} passage vectors"
+              f" ({(total_imported + counter['passages']) / max(total_imported, 1):.2f} vectors per chunk)")
+
+    if counter["errors"]:
+        sys.exit(1)
+    reingest_binaries(reingest, workers)
+    journal.log("done", imported=total_imported)
 
 
 if __name__ == "__main__":
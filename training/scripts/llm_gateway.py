@@ -0,0 +1,500 @@
+"""
+Shared, rate-limited gateway to the OpenAI API.
+
+Every pipeline script used to build its own synchronous OpenAI() client and
+pace itself with guessed sleeps (time.sleep(0.5) between chunks, 1s between
+auto_split windows), while its thread pool fired without any shared notion
+of the account's limits. LLMGateway instead runs one AsyncOpenAI client on a
+private asyncio event loop and puts every request through two token
+buckets: one for requests per minute, one for tokens per minute (estimated
+from the prompt size, then corrected with the usage the API reports).
+Chat completions and embeddings have a pair of buckets each, as the API
+limits them separately (embedding models' limits are several times chat's).
+
+Failures are retried here, not in the SDK: 429s honour Retry-After (or
+retry-after-ms) and pause every caller, not just the one that was told;
+connection errors, timeouts and 5xx back off exponentially with full jitter.
+When the API reports its limits (x-ratelimit-limit-requests/-tokens headers)
+the buckets of that endpoint are re-sized to them, so throughput settles at the provider's
+real ceiling rather than the conservative starting rates.
+
+Existing thread-based scripts use it as a drop-in client:
+
+    gateway = LLMGateway(api_key)
+    response = gateway.chat.completions.create(model=..., messages=...)
+    vectors = gateway.embeddings.create(model=..., input=[...])
+    print(gateway.summary())
+    gateway.close()
+
+Async code can await gateway.achat(**kwargs) / gateway.aembed(**kwargs) on
+the gateway's loop (gateway.submit(coro) schedules a coroutine there and
+returns a concurrent.futures.Future).
+
+Streamed completions go through the same limits and retries (a stream is
+retried only until it opens; once text has arrived, errors reach the
+caller). Closing the stream drops the connection, so the model stops
+generating and the rest of the reply is never paid for:
+
+    with gateway.chat.completions.stream(model=..., messages=...) as stream:
+        for delta in stream:
+            if looks_wrong(stream.text):
+                stream.close()
+
+Starting limits come from OPENAI_RPM / OPENAI_TPM (default 500 requests and
+200,000 tokens per minute for chat, 3,000 and 1,000,000 for embeddings).
+Setting either pins it for both endpoints: response headers then only ever
+lower it, never raise it.
+
+Token usage is also tallied per model, so summary() can quote an estimated
+cost from PRICES (USD per million tokens, list prices; models not in the
+table are reported without a cost). Each call is also recorded as a
+telemetry span (telemetry.py: model, tokens, latency including retries and
+waits, status), labelled with the calling thread's telemetry.file_context.
+"""
+
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import telemetry
+
+# openai is imported when a gateway is first used: the import alone takes
+# longer than a pipeline run that finds nothing to do
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200_000
+DEFAULT_EMBED_RPM = 3_000
+DEFAULT_EMBED_TPM = 1_000_000
+BURST_SECONDS = 10     # bucket capacity, in seconds of rate
+HEADROOM = 0.9         # fraction of a header-reported limit to use
+MAX_RETRIES = 6        # attempts after the first before giving up
+BACKOFF_BASE = 1.0     # seconds; doubled each attempt, full jitter
+BACKOFF_CAP = 60.0
+CHARS_PER_TOKEN = 4    # prompt size estimate before usage is known
+
+# USD per 1M (input, output) tokens, matched by model-name prefix (longest first)
+PRICES = {
+    "gpt-5-mini": (0.25, 2.00),
+    "gpt-5-nano": (0.05, 0.40),
+    "gpt-5": (1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at per_minute / 60 per second.
+
+    acquire() waits in FIFO order. adjust() settles an estimate against the
+    real cost afterwards; the level may go negative, which simply makes the
+    next callers wait longer.
+    """
+
+    def __init__(self, per_minute: float):
+        self._lock = asyncio.Lock()
+        self.set_rate(per_minute)
+        self.level = self.capacity
+        self._stamp = time.monotonic()
+
+    def set_rate(self, per_minute: float):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take amount (clamped to capacity) from the bucket. Returns the seconds waited."""
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return waited
+                delay = (amount - self.level) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def adjust(self, delta: float):
+        """Charge (positive) or refund (negative) tokens after the fact."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Rough token cost of a chat or embeddings request before it is sent."""
+    chars = 0
+    for message in kwargs.get("messages", ()):
+        content = message.get("content") or ""
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        chars += len(content)
+    inputs = kwargs.get("input")
+    if isinstance(inputs, str):
+        chars += len(inputs)
+    elif inputs:
+        chars += sum(len(text) for text in inputs if isinstance(text, str))
+    prompt = chars // CHARS_PER_TOKEN + 1
+    if "messages" not in kwargs:
+        return prompt
+    # Completions count against TPM too; assume the reply is about as long
+    # as the prompt (true for the rewrite-style prompts in this pipeline)
+    completion = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or prompt
+    return prompt + completion
+
+
+def _retry_after_seconds(error: Exception) -> float | None:
+    """Delay requested by the API via retry-after-ms / retry-after, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def model_price(model: str) -> tuple[float, float] | None:
+    """(input, output) USD per 1M tokens for a model name or dated snapshot."""
+    for prefix in sorted(PRICES, key=len, reverse=True):
+        if model.startswith(prefix):
+            return PRICES[prefix]
+    return None
+
+
+def _env_limit(name: str) -> float | None:
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+class LLMGateway:
+    """One rate-limited AsyncOpenAI client shared by every worker in a process."""
+
+    def __init__(self, api_key: str | None = None, rpm: float | None = None,
+                 tpm: float | None = None, max_retries: int = MAX_RETRIES):
+        rpm = rpm if rpm is not None else _env_limit("OPENAI_RPM")
+        tpm = tpm if tpm is not None else _env_limit("OPENAI_TPM")
+        self._rpm_pinned = rpm is not None
+        self._tpm_pinned = tpm is not None
+        self.max_retries = max_retries
+
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.throttled_seconds = 0.0
+        self.streams_aborted = 0
+        self.usage_by_model = {}  # model -> [prompt_tokens, completion_tokens]
+        self._stats_lock = threading.Lock()
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name="llm-gateway", daemon=True)
+        self._thread.start()
+
+        async def setup():
+            from openai import AsyncOpenAI
+            # endpoint -> (requests bucket, tokens bucket)
+            self._buckets = {
+                "chat": (TokenBucket(rpm or DEFAULT_RPM), TokenBucket(tpm or DEFAULT_TPM)),
+                "embeddings": (TokenBucket(rpm or DEFAULT_EMBED_RPM), TokenBucket(tpm or DEFAULT_EMBED_TPM)),
+            }
+            self._used = set()  # endpoints called, for summary()
+            self._resume_at = 0.0
+            # The gateway owns retries, so every 429 is seen by the buckets
+            self._client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+        self.submit(setup()).result()
+        self.chat = _Namespace(completions=_Endpoint(self, "chat"))
+        self.embeddings = _Endpoint(self, "embeddings")
+
+    # -- async API (runs on the gateway loop) --
+
+    async def achat(self, span_file: str | None = None, **kwargs):
+        """chat.completions.create() with rate limiting and retries."""
+        return await self._call(self._client.chat.completions.with_raw_response.create, kwargs,
+                                "chat", span_file)
+
+    async def aembed(self, span_file: str | None = None, **kwargs):
+        """embeddings.create() with rate limiting and retries."""
+        return await self._call(self._client.embeddings.with_raw_response.create, kwargs,
+                                "embeddings", span_file, endpoint="embeddings")
+
+    async def _stream(self, kwargs: dict, sink: "ChatStream"):
+        """Pump a streamed completion into sink's queue until it ends or is closed."""
+        kwargs = dict(kwargs, stream=True, stream_options={"include_usage": True})
+        start = time.monotonic()
+        status = "error"
+        try:
+            stream = await self._call(self._client.chat.completions.with_raw_response.create, kwargs)
+            try:
+                async for chunk in stream:
+                    if sink._cancel.is_set():
+                        sink.aborted = True
+                        self._count(streams_aborted=1)
+                        break
+                    sink.model = chunk.model or sink.model
+                    if chunk.usage:
+                        sink.usage = chunk.usage
+                    for choice in chunk.choices:
+                        if choice.delta and choice.delta.content:
+                            sink._queue.put(choice.delta.content)
+            finally:
+                await stream.close()
+            if sink.usage is not None:
+                self._settle(SimpleNamespace(usage=sink.usage, model=sink.model), estimate_tokens(kwargs), "chat")
+            status = "aborted" if sink.aborted else "ok"
+        except Exception as e:
+            sink._queue.put(e)
+        finally:
+            usage = sink.usage
+            telemetry.record("stream", file=sink.file, model=sink.model or kwargs.get("model"),
+                             prompt_tokens=getattr(usage, "prompt_tokens", None),
+                             completion_tokens=getattr(usage, "completion_tokens", None),
+                             latency=time.monotonic() - start, status=status)
+            sink._queue.put(_END)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the gateway loop; returns a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    async def _wait_for_resume(self):
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay <= 0:
+                return
+            self._count(throttled_seconds=delay)
+            await asyncio.sleep(delay)
+
+    async def _call(self, create, kwargs: dict, kind: str | None = None, span_file: str | None = None,
+                    endpoint: str = "chat"):
+        """One request with endpoint's limits and retries; recorded as a telemetry span of kind, if given."""
+        from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+        estimate = estimate_tokens(kwargs)
+        requests, tokens = self._buckets[endpoint]
+        self._used.add(endpoint)
+        start = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_resume()
+            waited = await requests.acquire(1)
+            waited += await tokens.acquire(estimate)
+            self._count(requests=1, throttled_seconds=waited)
+            try:
+                raw = await create(**kwargs)
+            except RateLimitError as e:
+                error = e
+                retry_after = _retry_after_seconds(e)
+                delay = retry_after if retry_after is not None else _backoff(attempt)
+                # Limits are per account: hold every caller, not just this one
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                self._count(rate_limited=1)
+            except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+                error = e
+                delay = _backoff(attempt)
+            except Exception:
+                if kind:  # not retryable (bad request, auth, ...)
+                    telemetry.record(kind, file=span_file, model=kwargs.get("model"),
+                                     latency=time.monotonic() - start, retries=attempt, status="error")
+                raise
+            else:
+                self._calibrate(raw.headers, endpoint)
+                response = raw.parse()
+                self._settle(response, estimate, endpoint)
+                if kind:
+                    usage = getattr(response, "usage", None)
+                    telemetry.record(kind, file=span_file,
+                                     model=getattr(response, "model", None) or kwargs.get("model"),
+                                     prompt_tokens=getattr(usage, "prompt_tokens", None),
+                                     completion_tokens=getattr(usage, "completion_tokens", None),
+                                     latency=time.monotonic() - start, retries=attempt)
+                return response
+            if attempt == self.max_retries:
+                self._count(failed=1)
+                if kind:
+                    telemetry.record(kind, file=span_file, model=kwargs.get("model"),
+                                     latency=time.monotonic() - start, retries=attempt, status="error")
+                raise error
+            self._count(retries=1)
+            await asyncio.sleep(delay)
+
+    def _calibrate(self, headers, endpoint: str):
+        """Re-size endpoint's buckets to the limits the API reports."""
+        requests, tokens = self._buckets[endpoint]
+        for header, bucket, pinned in (
+            ("x-ratelimit-limit-requests", requests, self._rpm_pinned),
+            ("x-ratelimit-limit-tokens", tokens, self._tpm_pinned),
+        ):
+            value = headers.get(header)
+            if value is None:
+                continue
+            try:
+                limit = float(value) * HEADROOM
+            except ValueError:
+                continue
+            if limit > 0 and (limit < bucket.per_minute or not pinned) and limit != bucket.per_minute:
+                bucket.set_rate(limit)
+
+    def _settle(self, response, estimate: int, endpoint: str):
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        self._buckets[endpoint][1].adjust((getattr(usage, "total_tokens", 0) or prompt + completion) - estimate)
+        self._count(prompt_tokens=prompt, completion_tokens=completion)
+        model = getattr(response, "model", None) or "unknown"
+        with self._stats_lock:
+            tally = self.usage_by_model.setdefault(model, [0, 0])
+            tally[0] += prompt
+            tally[1] += completion
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    # -- reporting / shutdown --
+
+    def limits(self, endpoint: str = "chat") -> tuple[float, float]:
+        """Current (requests, tokens) per minute endpoint's buckets are running at."""
+        requests, tokens = self._buckets[endpoint]
+        return requests.per_minute, tokens.per_minute
+
+    def cost(self) -> float | None:
+        """Estimated USD spent so far, or None if no model used has a known price."""
+        total = None
+        with self._stats_lock:
+            for model, (prompt, completion) in self.usage_by_model.items():
+                price = model_price(model)
+                if price is not None:
+                    total = (total or 0.0) + (prompt * price[0] + completion * price[1]) / 1e6
+        return total
+
+    def summary(self) -> str:
+        line = (f"API: {self.requests} requests, {self.prompt_tokens + self.completion_tokens:,} tokens"
+                f" ({self.prompt_tokens:,} in, {self.completion_tokens:,} out)")
+        cost = self.cost()
+        if cost is not None:
+            line += f", ~${cost:.2f}"
+        if self.retries or self.rate_limited:
+            line += f", {self.retries} retries ({self.rate_limited} rate limited)"
+        limits = []
+        for endpoint in sorted(self._used) or ["chat"]:
+            rpm, tpm = self.limits(endpoint)
+            label = f"{endpoint} " if len(self._used) > 1 else ""
+            limits.append(f"{label}{rpm:,.0f} RPM / {tpm:,.0f} TPM")
+        line += f", limits {', '.join(limits)}"
+        if self.throttled_seconds >= 1:
+            line += f", {self.throttled_seconds:.0f}s spent waiting on limits"
+        if self.streams_aborted:
+            line += f", {self.streams_aborted} streams aborted early"
+        return line
+
+    def close(self):
+        telemetry.flush()
+        if not self._loop.is_running():
+            return
+        self.submit(self._client.close()).result()
+        # Streams abandoned mid-response leave suspended async generators behind
+        self.submit(self._loop.shutdown_asyncgens()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_END = object()  # end-of-stream marker in ChatStream's queue
+
+
+class ChatStream:
+    """Text deltas of one streamed chat completion, for a worker thread.
+
+    Iterating yields content strings as they arrive; .text is everything
+    received so far. close() aborts the request. Once the stream has ended,
+    .model and .usage hold what the API reported (usage is None if it was
+    aborted) and .aborted says whether close() cut it short.
+    """
+
+    def __init__(self, gateway: LLMGateway, kwargs: dict):
+        self._queue = queue.Queue()
+        self._cancel = threading.Event()
+        self._parts = []
+        self.model = None
+        self.usage = None
+        self.aborted = False
+        self.file = telemetry.current_file()
+        self._future = gateway.submit(gateway._stream(kwargs, self))
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        item = self._queue.get()
+        if item is _END:
+            self._queue.put(_END)  # keep later next() calls stopping too
+            raise StopIteration
+        if isinstance(item, BaseException):
+            raise item
+        self._parts.append(item)
+        return item
+
+    def close(self):
+        """Abort the request if it is still running and wait for the connection to drop."""
+        self._cancel.set()
+        self._future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Endpoint:
+    """Synchronous create() bridging a worker thread onto the gateway loop."""
+
+    def __init__(self, gateway: LLMGateway, kind: str):
+        self._gateway = gateway
+        self._kind = kind
+
+    def create(self, **kwargs):
+        file = telemetry.current_file()
+        coro = (self._gateway.achat(span_file=file, **kwargs) if self._kind == "chat"
+                else self._gateway.aembed(span_file=file, **kwargs))
+        return self._gateway.submit(coro).result()
+
+    def stream(self, **kwargs) -> ChatStream:
+        """Start a streamed chat completion (chat endpoint only)."""
+        return ChatStream(self._gateway, kwargs)
+
+
+class _Namespace:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
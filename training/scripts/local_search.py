@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["numpy", "openai", "requests"]
+# ///
+"""
+In-process hybrid search over training/data/ (BM25 + exact vector kNN).
+
+Searching the knowledge base normally needs Qdrant running in Docker and an
+OpenAI embedding for every query. LocalIndex gives the same chunks without
+either:
+
+  - BM25 over each chunk's payload document (what import_qdrant stores),
+    kept as a sorted term array plus CSR postings holding the precomputed
+    BM25 weight of every (term, chunk) pair, so a query is a few slice adds.
+  - Exact cosine kNN over a float32 matrix of the chunk embeddings, stored
+    as a raw memory-mapped file: one matrix-vector product per query.
+  - Optionally (--passages), vectors of the content-defined passages of
+    long chunks (passages.py), the same child vectors import_qdrant
+    --passages stores; a chunk's similarity is the best of its own vector
+    and its passages'.
+  - Reciprocal-rank fusion (RRF_K) of the two rankings.
+  - The tags filter import_qdrant writes and query/ applies: a chunk passes
+    if one of its tags equals a filter tag, or a "$XXXX" filter tag falls
+    inside one of its addr_ranges intervals. As in the query tool's hybrid
+    mode, filtered hits come first and unfiltered ones fill the rest.
+
+Two embedders:
+  - openai: text-embedding-3-large vectors served from the embedding store
+    (embedding_store.py; missing ones are embedded through the gateway),
+    and one API call per query.
+  - hash: a deterministic feature-hashing stand-in (HashEmbedder, no
+    network, no key) for CI and offline use; both chunks and queries go
+    through it.
+
+Everything lives in training/local_index/ and is opened with mmap, so cold
+start is a JSON load plus a few np.load(mmap_mode="r") calls.
+
+Usage:
+    python3 training/scripts/local_search.py --build --embedder hash
+    python3 training/scripts/local_search.py --build --embedder hash --passages   # + passage vectors
+    uv run training/scripts/local_search.py --build              # openai vectors from the store
+    python3 training/scripts/local_search.py "sid filter volume" -k 5
+    python3 training/scripts/local_search.py "sprite colors" --tags '$D027,$D028'
+    python3 training/scripts/local_search.py "sid filter volume" --no-passages    # chunk vectors only
+    python3 training/scripts/local_search.py --bench             # cold start and query latency
+"""
+
+import hashlib
+import json
+import math
+import re
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from passages import DEFAULT_BUDGET, passage_items
+
+INDEX_DIR = Path(__file__).parent.parent / "local_index"
+INDEX_VERSION = 1
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60          # reciprocal-rank fusion constant
+FUSION_DEPTH = 50   # candidates taken from each ranking before fusion
+MAX_TERM_CHARS = 32
+HASH_DIMS = 256
+
+_TOKEN = re.compile(r"\$[0-9a-f]{1,4}\b|[a-z_][a-z0-9_]+|[0-9]+")
+_ADDRESS_TAG = re.compile(r"^\$([0-9A-Fa-f]{2,4})$")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word, number and $hex tokens (terms are cut to MAX_TERM_CHARS)."""
+    return [t[:MAX_TERM_CHARS] for t in _TOKEN.findall(text.lower())]
+
+
+def query_tags(query: str) -> list[str]:
+    """Filter tags the query tool's number enrichment would add: $XXXX addresses above $FF."""
+    tags = set()
+    for m in re.finditer(r"(?<!\w)\$([0-9A-Fa-f]{1,4})(?!\w)", query):
+        value = int(m.group(1), 16)
+        if value > 0xFF:
+            tags.add(f"${value:04X}")
+    return sorted(tags)
+
+
+class HashEmbedder:
+    """Offline stand-in embedder: signed feature hashing of tokens and token
+    bigrams, log-scaled and L2-normalised. Deterministic across processes."""
+
+    model = "local-hash"
+
+    def __init__(self, dims: int = HASH_DIMS):
+        self.dims = dims
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            counts = {}
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                counts[feature] = counts.get(feature, 0) + 1
+            for feature, count in counts.items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                out[row, h % self.dims] += (1.0 if h & 0x80000000 else -1.0) * (1.0 + math.log(count))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms > 0, norms, 1.0)
+
+
+class OpenAIEmbedder:
+    """text-embedding-3-large through the embedding store and the shared gateway."""
+
+    def __init__(self, dims: int | None = None):
+        from import_qdrant import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+        self.model = EMBEDDING_MODEL
+        self.full_dims = EMBEDDING_DIMENSIONS
+        self.dims = dims or EMBEDDING_DIMENSIONS  # below full_dims: matryoshka-reduced
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            import os
+            from llm_gateway import LLMGateway
+            self._client = LLMGateway(os.environ.get("OPENAI_API_KEY"))
+        return self._client
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Query vectors; kept in the embedding store so benchmark reruns stay offline."""
+        from embedding_store import EmbeddingStore
+        from vector_quant import reduce_dims
+        full = self.full_dims
+        hashes = [hashlib.md5(text.encode()).hexdigest() for text in texts]
+        store = EmbeddingStore()
+        try:
+            found = store.get_many(self.model, full, hashes)
+            missing = [i for i, h in enumerate(hashes) if h not in found]
+            if missing:
+                response = self.client().embeddings.create(model=self.model, input=[texts[i] for i in missing])
+                fresh = [(hashes[i], item.embedding) for i, item in zip(missing, response.data)]
+                store.put_many(self.model, full, fresh)
+                found.update(fresh)
+        finally:
+            store.close()
+        return reduce_dims(_normalise(np.asarray([found[h] for h in hashes], dtype=np.float32)), self.dims)
+
+    def embed_items(self, items: list[dict]) -> np.ndarray:
+        """Chunk vectors: stored ones first, the rest embedded (and stored)."""
+        from embedding_store import EmbeddingStore
+        from import_qdrant import BATCH_SIZE, embed_batch_cached
+        from vector_quant import reduce_dims
+        store = EmbeddingStore()
+        rows = []
+        try:
+            for i in range(0, len(items), BATCH_SIZE):
+                vectors, _ = embed_batch_cached(self.client(), store, items[i:i + BATCH_SIZE])
+                rows.extend(vectors)
+        finally:
+            store.close()
+        return reduce_dims(_normalise(np.asarray(rows, dtype=np.float32)), self.dims)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def make_embedder(name: str, dims: int | None = None):
+    if name == "hash":
+        return HashEmbedder(dims or HASH_DIMS)
+    if name == "openai":
+        return OpenAIEmbedder(dims)
+    raise ValueError(f"unknown embedder {name!r} (hash, openai)")
+
+
+def _bm25_postings(docs: list[list[str]]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(sorted terms, offsets, doc ids, BM25 weights) for tokenised documents."""
+    lengths = np.array([len(d) for d in docs], dtype=np.float32)
+    avgdl = float(lengths.mean()) if len(docs) else 0.0
+    postings = {}
+    for doc_id, tokens in enumerate(docs):
+        counts = {}
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for t, tf in counts.items():
+            postings.setdefault(t, []).append((doc_id, tf))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    doc_ids, weights = [], []
+    n = len(docs)
+    for i, term in enumerate(terms):
+        entries = postings[term]
+        idf = math.log(1.0 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+        for doc_id, tf in entries:
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[doc_id] / avgdl)
+            doc_ids.append(doc_id)
+            weights.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+        offsets[i + 1] = len(doc_ids)
+    return (np.array(terms, dtype=f"<U{MAX_TERM_CHARS}"), offsets,
+            np.array(doc_ids, dtype=np.int32), np.array(weights, dtype=np.float32))
+
+
+def build_index(embedder_name: str = "hash", dims: int | None = None,
+                index_dir: Path = INDEX_DIR, data_dir: Path | None = None,
+                passage_budget: int | None = None) -> dict:
+    """Index every data/*.md chunk (and, with a passage budget, the passages of
+    the long ones). Returns the written meta (with build timings)."""
+    from import_qdrant import DATA_DIR, md5, prepare_item
+
+    start = time.perf_counter()
+    items = []
+    for path in sorted((data_dir or DATA_DIR).glob("*.md")):
+        content = path.read_text(encoding="utf-8")
+        items.append(prepare_item(path.name, content, md5(content)))
+    passages, passage_doc = [], []
+    if passage_budget:
+        for doc_id, item in enumerate(items):
+            for passage in passage_items(item, passage_budget):
+                passages.append(passage)
+                passage_doc.append(doc_id)
+    prepared = time.perf_counter()
+
+    terms, offsets, doc_ids, weights = _bm25_postings([tokenize(i["full_content"]) for i in items])
+    indexed = time.perf_counter()
+
+    embedder = make_embedder(embedder_name, dims)
+    try:
+        if isinstance(embedder, HashEmbedder):
+            vectors = embedder.embed([i["embed_text"] for i in items])
+            passage_vectors = embedder.embed([p["embed_text"] for p in passages])
+        else:
+            vectors = embedder.embed_items(items)
+            passage_vectors = embedder.embed_items(passages) if passages else None
+    finally:
+        if hasattr(embedder, "close"):
+            embedder.close()
+    embedded = time.perf_counter()
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    np.save(index_dir / "terms.npy", terms)
+    np.save(index_dir / "offsets.npy", offsets)
+    np.save(index_dir / "doc_ids.npy", doc_ids)
+    np.save(index_dir / "weights.npy", weights)
+    vectors.astype(np.float32).tofile(index_dir / "vectors.f32")
+    for stale in ("passages.f32", "passage_doc.npy"):
+        (index_dir / stale).unlink(missing_ok=True)
+    if passages:
+        passage_vectors.astype(np.float32).tofile(index_dir / "passages.f32")
+        np.save(index_dir / "passage_doc.npy", np.array(passage_doc, dtype=np.int32))
+    meta = {
+        "version": INDEX_VERSION,
+        "embedder": embedder_name,
+        "model": embedder.model,
+        "dims": int(vectors.shape[1]) if len(items) else embedder.dims,
+        "built": time.time(),
+        "docs": [{"filename": i["filename"], "title": i["metadata"].get("title", ""),
+                  "tags": i["metadata"].get("tags", []),
+                  "addr_ranges": i["metadata"].get("addr_ranges", [])} for i in items],
+        "passages": {"budget": passage_budget, "count": len(passages)} if passages else None,
+        "timings": {"prepare": prepared - start, "bm25": indexed - prepared, "embed": embedded - indexed},
+    }
+    (index_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return meta
+
+
+class LocalIndex:
+    """A built index opened read-only. search() returns [(filename, score)]."""
+
+    def __init__(self, index_dir: Path = INDEX_DIR, embedder=None):
+        meta_path = index_dir / "meta.json"
+        if not meta_path.exists():
+            raise FileNotFoundError(f"No local index in {index_dir}; run local_search.py --build first")
+        self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Local index version {self.meta.get('version')} != {INDEX_VERSION}; rebuild it")
+        self.docs = self.meta["docs"]
+        self.terms = np.load(index_dir / "terms.npy", mmap_mode="r")
+        self.offsets = np.load(index_dir / "offsets.npy", mmap_mode="r")
+        self.doc_ids = np.load(index_dir / "doc_ids.npy", mmap_mode="r")
+        self.weights = np.load(index_dir / "weights.npy", mmap_mode="r")
+        n = len(self.docs)
+        self.vectors = (np.memmap(index_dir / "vectors.f32", dtype=np.float32, mode="r",
+                                  shape=(n, self.meta["dims"])) if n else np.zeros((0, self.meta["dims"]), np.float32))
+        self.passage_vectors = self.passage_doc = None
+        if self.meta.get("passages"):
+            self.passage_vectors = np.memmap(index_dir / "passages.f32", dtype=np.float32, mode="r",
+                                             shape=(self.meta["passages"]["count"], self.meta["dims"]))
+            self.passage_doc = np.load(index_dir / "passage_doc.npy", mmap_mode="r")
+        self._embedder = embedder
+        self._tag_index = None
+
+    @property
+    def embedder(self):
+        """The query embedder the index was built with (created on first use)."""
+        if self._embedder is None:
+            self._embedder = make_embedder(self.meta["embedder"], self.meta["dims"])
+        return self._embedder
+
+    def bm25(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk."""
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for term in set(tokenize(query)):
+            pos = int(np.searchsorted(self.terms, term))
+            if pos < len(self.terms) and self.terms[pos] == term:
+                lo, hi = self.offsets[pos], self.offsets[pos + 1]
+                scores[self.doc_ids[lo:hi]] += self.weights[lo:hi]  # doc ids are unique per term
+        return scores
+
+    def similarity(self, vector: np.ndarray, use_passages: bool = True) -> np.ndarray:
+        """Cosine similarity of every chunk to a normalised query vector: the
+        best of the chunk's own vector and its passages' (if indexed)."""
+        vector = vector.astype(np.float32)
+        sims = self.vectors @ vector
+        if use_passages and self.passage_vectors is not None:
+            sims = np.array(sims)
+            np.maximum.at(sims, self.passage_doc, self.passage_vectors @ vector)
+        return sims
+
+    def tag_mask(self, tags: list[str]) -> np.ndarray:
+        """Chunks matching any tag, by keyword or (for $XXXX tags) address interval."""
+        if self._tag_index is None:
+            index = {}
+            for doc_id, doc in enumerate(self.docs):
+                for tag in doc["tags"]:
+                    index.setdefault(tag, []).append(doc_id)
+            spans = [(r["start"], r["end"], doc_id) for doc_id, doc in enumerate(self.docs)
+                     for r in doc["addr_ranges"]]
+            self._tag_index = index
+            self._spans = np.array(spans, dtype=np.int32).reshape(-1, 3)
+        mask = np.zeros(len(self.docs), dtype=bool)
+        for tag in tags:
+            mask[self._tag_index.get(tag, [])] = True
+            m = _ADDRESS_TAG.match(tag)
+            if m:
+                address = int(m.group(1), 16)
+                hit = (self._spans[:, 0] <= address) & (address <= self._spans[:, 1])
+                mask[self._spans[hit, 2]] = True
+        return mask
+
+    @staticmethod
+    def _top(scores: np.ndarray, candidates: np.ndarray, depth: int) -> np.ndarray:
+        """Indices of the best-scoring candidates (score > 0 for BM25 callers), best first."""
+        if len(candidates) > depth:
+            candidates = candidates[np.argpartition(-scores[candidates], depth - 1)[:depth]]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def _fuse(self, bm25: np.ndarray | None, sims: np.ndarray | None, candidates: np.ndarray,
+              depth: int) -> list[tuple[int, float]]:
+        fused = {}
+        rankings = []
+        if bm25 is not None:
+            rankings.append(self._top(bm25, candidates[bm25[candidates] > 0], depth))
+        if sims is not None:
+            rankings.append(self._top(sims, candidates, depth))
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking.tolist()):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    def search(self, query: str, k: int = 10, tags: list[str] | None = None,
+               vector: np.ndarray | None = None, use_vectors: bool = True,
+               use_bm25: bool = True, use_passages: bool = True) -> list[tuple[str, float]]:
+        """Top k (filename, fused score). tags default to query_tags(query)."""
+        if tags is None:
+            tags = query_tags(query)
+        bm25 = self.bm25(query) if use_bm25 else None
+        sims = None
+        if use_vectors and len(self.docs):
+            if vector is None:
+                vector = self.embedder.embed([query])[0]
+            sims = self.similarity(vector, use_passages)
+        everything = np.arange(len(self.docs))
+        depth = max(k, FUSION_DEPTH)
+
+        ranked = []
+        if tags:
+            ranked = self._fuse(bm25, sims, np.flatnonzero(self.tag_mask(tags)), depth)
+        seen = {doc_id for doc_id, _ in ranked}
+        ranked += [hit for hit in self._fuse(bm25, sims, everything, depth) if hit[0] not in seen]
+        return [(self.docs[doc_id]["filename"], score) for doc_id, score in ranked[:k]]
+
+
+BENCH_QUERIES = [
+    "$D418 filter volume", "sprite multiplexing", "raster interrupt setup", "SID ADSR envelope",
+    "CIA timer A interrupt", "KERNAL CHROUT", "bitmap mode $D011", "color RAM $D800",
+    "1541 disk drive commands", "zero page pointers indirect indexed",
+]
+
+
+def _bench():
+    t0 = time.perf_counter()
+    index = LocalIndex()
+    t1 = time.perf_counter()
+    index.search(BENCH_QUERIES[0])  # first touch of the mmaps
+    t2 = time.perf_counter()
+    vectors = index.embedder.embed(BENCH_QUERIES) if isinstance(index.embedder, HashEmbedder) else None
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for i, query in enumerate(BENCH_QUERIES):
+            index.search(query, vector=None if vectors is None else vectors[i])
+    per_query = (time.perf_counter() - start) / (rounds * len(BENCH_QUERIES))
+    passages = index.meta.get("passages")
+    extra = f" + {passages['count']} passages" if passages else ""
+    print(f"Index: {len(index.docs)} chunks, {len(index.terms)} terms, {len(index.doc_ids)} postings,"
+          f" {index.meta['dims']}d {index.meta['model']} vectors{extra}")
+    print(f"Cold start: {(t1 - t0) * 1000:.1f} ms open, {(t2 - t1) * 1000:.1f} ms first query")
+    print(f"Query: {per_query * 1000:.3f} ms (BM25 + kNN + fusion; query embedding"
+          f" {'excluded' if vectors is not None else 'included'})")
+
+
+def main():
+    k = 10
+    if "-k" in sys.argv:
+        k = int(sys.argv[sys.argv.index("-k") + 1])
+    embedder = "openai"
+    if "--embedder" in sys.argv:
+        embedder = sys.argv[sys.argv.index("--embedder") + 1]
+    dims = None
+    if "--dims" in sys.argv:
+        dims = int(sys.argv[sys.argv.index("--dims") + 1])
+    tags = None
+    if "--tags" in sys.argv:
+        tags = [t.strip() for t in sys.argv[sys.argv.index("--tags") + 1].split(",") if t.strip()]
+    passage_budget = DEFAULT_BUDGET if "--passages" in sys.argv else None
+    if "--passage-budget" in sys.argv:
+        passage_budget = int(sys.argv[sys.argv.index("--passage-budget") + 1])
+
+    if "--build" in sys.argv:
+        meta = build_index(embedder, dims, passage_budget=passage_budget)
+        t = meta["timings"]
+        extra = f" + {meta['passages']['count']} passages" if meta["passages"] else ""
+        print(f"Built {INDEX_DIR.name}/: {len(meta['docs'])} chunks, {meta['dims']}d {meta['model']} vectors{extra}"
+              f" (prepare {t['prepare']:.1f}s, BM25 {t['bm25']:.1f}s, embed {t['embed']:.1f}s)")
+        return
+    if "--bench" in sys.argv:
+        _bench()
+        return
+
+    skip_next = False
+    words = []
+    for a in sys.argv[1:]:
+        if skip_next:
+            skip_next = False
+            continue
+        if a in ("-k", "--embedder", "--dims", "--tags", "--passage-budget"):
+            skip_next = True
+            continue
+        if a == "--no-passages":
+            continue
+        words.append(a)
+    query = " ".join(words)
+    if not query:
+        print(__doc__)
+        sys.exit(1)
+
+    index = LocalIndex()
+    start = time.perf_counter()
+    results = index.search(query, k, tags, use_passages="--no-passages" not in sys.argv)
+    elapsed = time.perf_counter() - start
+    filter_tags = query_tags(query) if tags is None else tags
+    label = f", filtered on {', '.join(filter_tags)}" if filter_tags else ""
+    print(f"{len(results)} results in {elapsed * 1000:.1f} ms{label}")
+    titles = {d["filename"]: d["title"] for d in index.docs}
+    for rank, (filename, score) in enumerate(results, 1):
+        print(f"  {rank:2}. {filename}  ({score:.4f})  {titles.get(filename, '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Single-pass section map for training chunks.
+
+Every consumer of training/data/*.md (import_qdrant metadata extraction,
+audit_chunks scoring, enrich_chunks and fix_incomplete section removal)
+needs to know where the ## sections are. Instead of each one re-splitting
+the content and scanning for its own marker, parse_sections() finds the
+# title and every ## heading in one pass and records each section as
+character offsets into the original string; consumers then slice only the
+spans they need.
+
+Headings follow the conventions of the pipeline: a "## " line starts a
+section, which runs to the next "## " line or EOF ("### " lines are body
+text). Lookups match heading prefixes, like the line.startswith() checks
+they replace.
+
+Usage:
+    sections = parse_sections(content)
+    sections.title                          # "# Title" text, or None
+    sec = sections.find("Key Registers")    # first matching Section, or None
+    sections.body(sec)                      # text after the heading line
+    sections.items("Labels")                # first token of "- " lines
+
+Benchmark (metadata extraction over all of training/data/):
+    python3 training/scripts/md_sections.py
+    python3 training/scripts/md_sections.py --repeat 5
+"""
+
+import sys
+import time
+from typing import NamedTuple
+
+class Section(NamedTuple):
+    heading: str     # heading text after "## "
+    start: int       # offset of the "## " line
+    body_start: int  # offset just past the heading line
+    end: int         # offset of the next "## " line, or len(content)
+
+
+class ChunkSections:
+    """Title and ## section spans of one markdown chunk."""
+
+    __slots__ = ("content", "title", "sections")
+
+    def __init__(self, content: str):
+        self.content = content
+        self.title: str | None = None
+        self.sections: list[Section] = []
+
+        # Hop between line starts that begin with "#" (str.find runs in C;
+        # a MULTILINE regex would be tried at every character)
+        size = len(content)
+        heads = []  # (start, end of heading line)
+        pos = 0
+        while True:
+            if content.startswith("## ", pos) or (self.title is None and content.startswith("# ", pos)):
+                eol = content.find("\n", pos)
+                if eol == -1:
+                    eol = size
+                if content[pos + 1] == "#":
+                    heads.append((pos, eol))
+                else:
+                    self.title = content[pos + 2:eol].strip()
+            nxt = content.find("\n#", pos)
+            if nxt == -1:
+                break
+            pos = nxt + 1
+
+        for i, (start, eol) in enumerate(heads):
+            end = heads[i + 1][0] if i + 1 < len(heads) else size
+            self.sections.append(Section(content[start + 3:eol], start, min(eol + 1, size), end))
+
+    def find(self, prefix: str) -> Section | None:
+        """First section whose heading starts with prefix."""
+        for sec in self.sections:
+            if sec.heading.startswith(prefix):
+                return sec
+        return None
+
+    def find_all(self, prefix: str) -> list[Section]:
+        """All sections whose heading starts with prefix, in document order."""
+        return [sec for sec in self.sections if sec.heading.startswith(prefix)]
+
+    def has(self, prefix: str) -> bool:
+        return self.find(prefix) is not None
+
+    def body(self, sec: Section) -> str:
+        """Section text after its heading line, up to the next ## heading."""
+        return self.content[sec.body_start:sec.end]
+
+    def before(self, sec: Section | None) -> str:
+        """Everything before the section's heading (the whole chunk if None)."""
+        return self.content if sec is None else self.content[:sec.start]
+
+    def items(self, prefix: str) -> list[str]:
+        """First token (uppercased) of each "- " line in the first matching section."""
+        sec = self.find(prefix)
+        if sec is None:
+            return []
+        tokens = []
+        for line in self.body(sec).split("\n"):
+            if line.startswith("- "):
+                rest = line[2:].split()
+                if rest:
+                    tokens.append(rest[0].upper())
+        return tokens
+
+    def without(self, heading: str) -> str:
+        """Content with every section titled exactly heading cut out.
+
+        The newline before the heading goes with it; the one before the
+        next heading stays, matching a regex cut of "\\n## heading ... "
+        up to (not including) "\\n## ".
+        """
+        content = self.content
+        pieces = []
+        pos = 0
+        for sec in self.sections:
+            if sec.heading.rstrip() != heading or content[sec.body_start - 1] != "\n":
+                continue
+            cut_start = max(sec.start - 1, 0)
+            cut_end = sec.end - 1 if sec.end < len(content) else len(content)
+            pieces.append(content[pos:cut_start])
+            pos = cut_end
+        if not pieces:
+            return content
+        pieces.append(content[pos:])
+        return "".join(pieces)
+
+
+def parse_sections(content: str) -> ChunkSections:
+    """Parse a chunk's title and ## sections in one pass."""
+    return ChunkSections(content)
+
+
+def main():
+    from pathlib import Path
+
+    from import_qdrant import DATA_DIR, extract_metadata, prepare_item
+
+    repeat = 1
+    if "--repeat" in sys.argv:
+        repeat = int(sys.argv[sys.argv.index("--repeat") + 1])
+
+    read_start = time.perf_counter()
+    files = [(f.name, f.read_text()) for f in sorted(Path(DATA_DIR).glob("*.md"))]
+    read_elapsed = time.perf_counter() - read_start
+    total_bytes = sum(len(c) for _, c in files)
+    print(f"{len(files)} chunks, {total_bytes / 1024 / 1024:.1f} MB (read in {read_elapsed:.2f}s)")
+
+    timings = {}
+    for label, fn in (
+        ("parse_sections", lambda name, content: parse_sections(content)),
+        ("extract_metadata", lambda name, content: extract_metadata(content, name)),
+        ("prepare_item", lambda name, content: prepare_item(name, content, "")),
+    ):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for name, content in files:
+                fn(name, content)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+        print(f"  {label:<18} {best * 1000:8.1f} ms  ({best / max(len(files), 1) * 1e6:.0f} µs/chunk)")
+
+    ok = timings["extract_metadata"] < 1.0
+    print(f"{'OK' if ok else 'SLOW'}: metadata extraction over all chunks"
+          f" {'under' if ok else 'over'} 1s")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Content-defined passages of long chunks, for sub-chunk embeddings.
+
+Every data/*.md chunk is embedded as one vector. A long reference chunk
+(a register map, a KERNAL routine table, a chapter section) is diluted in
+that vector: a query about one register or one routine matches a small
+part of the text and scores below shorter, vaguer chunks. With --passages,
+import_qdrant also embeds the long chunks in pieces:
+
+  - split_blocks() cuts the embed text at blank lines into blocks, keeping
+    fenced code and tables whole; a heading starts a new section and stays
+    with the block that follows it.
+  - split_passages() packs each section's blocks into passages of about
+    PASSAGE_CHARS. Boundaries come from the text (blank lines, headings),
+    not fixed offsets, so an edit usually changes only the passages of its
+    own section and the rest replay from the embedding store (passages are
+    keyed by the md5 of their text like chunks). A block too big for a passage
+    is cut at line boundaries; a table cut this way repeats its header rows
+    in every piece. Each passage is prefixed with the chunk title and its
+    section heading, so it still says what it is about.
+  - Chunks under MIN_CHUNK_CHARS get no passages (the chunk vector covers
+    them), and no chunk gets more than its budget (--passage-budget,
+    DEFAULT_BUDGET): the smallest adjacent pair is merged until it fits,
+    so storage is at most 1 + budget vectors per chunk.
+
+Passages are stored as child points in a sibling collection,
+<collection>_passages, with the parent's point ID (parent_id), filename,
+tags and addr_ranges in their payload. A search asks that collection for
+the best passage per parent (Qdrant's search/groups, group_by parent_id,
+which can also look the parent chunk up) and aggregate() folds those scores
+into the chunk hits: a chunk scores the maximum of its own vector and its
+best passage.
+
+    python3 training/scripts/passages.py                 # passage stats over training/data/
+    python3 training/scripts/passages.py some_chunk.md   # show one chunk's passages
+"""
+
+import hashlib
+import re
+import sys
+
+PASSAGE_CHARS = 1200      # target passage size (~300 tokens)
+MIN_CHUNK_CHARS = 2400    # shorter chunks keep a single vector
+DEFAULT_BUDGET = 4        # passage vectors per chunk at most
+PASSAGE_SUFFIX = "_passages"
+
+_HEADING = re.compile(r"^#{1,6}\s")
+_TABLE_ROW = re.compile(r"^\s*\|")
+_TABLE_RULE = re.compile(r"^\s*\|?[\s:|-]+\|[\s:|-]*$")
+
+
+def passage_collection(collection: str) -> str:
+    """Name of the collection holding collection's passages."""
+    return collection + PASSAGE_SUFFIX
+
+
+def split_blocks(text: str) -> list[tuple[str, str]]:
+    """(section heading, block) pairs: blank-line separated blocks, with fenced
+    code kept whole and each heading attached to the block after it."""
+    blocks = []
+    section = ""
+    current = []
+    pending_heading = []
+    in_fence = False
+
+    def flush():
+        if current:
+            blocks.append((section, "\n".join(pending_heading + current).strip()))
+            current.clear()
+            pending_heading.clear()
+
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+            current.append(line)
+            continue
+        if in_fence:
+            current.append(line)
+            continue
+        if _HEADING.match(line):
+            flush()
+            if line.startswith("# "):
+                continue  # the chunk title; prefixed to every passage instead
+            section = line.strip()
+            pending_heading[:] = [line]
+            continue
+        if not line.strip():
+            flush()
+            continue
+        current.append(line)
+    flush()
+    if pending_heading:  # a trailing heading with nothing under it
+        blocks.append((section, pending_heading[0]))
+    return [(s, b) for s, b in blocks if b]
+
+
+def _cut(block: str, target: int) -> list[str]:
+    """Pieces of an oversized block, cut at line boundaries; table pieces
+    repeat the table's header rows."""
+    lines = block.splitlines()
+    header = []
+    table = [i for i, line in enumerate(lines) if _TABLE_ROW.match(line)]
+    if len(table) > 2 and len(lines) > table[0] + 1 and _TABLE_RULE.match(lines[table[0] + 1]):
+        header = lines[:table[0] + 2]
+        lines = lines[table[0] + 2:]
+    pieces, current, size = [], [], 0
+    header_size = sum(len(h) + 1 for h in header)
+    for line in lines:
+        while len(line) > target:  # one enormous line: cut at whitespace
+            cut = line.rfind(" ", 0, target)
+            cut = cut if cut > 0 else target
+            pieces.append("\n".join(header + current + [line[:cut]]))
+            current, size, line = [], 0, line[cut:].lstrip()
+        if current and header_size + size + len(line) > target:
+            pieces.append("\n".join(header + current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        pieces.append("\n".join(header + current))
+    return pieces
+
+
+def _title(text: str) -> str:
+    for line in text.splitlines():
+        if line.startswith("# "):
+            return line.strip()
+        if line.strip():
+            break
+    return ""
+
+
+def split_passages(text: str, budget: int = DEFAULT_BUDGET, target: int = PASSAGE_CHARS,
+                   min_chars: int = MIN_CHUNK_CHARS) -> list[str]:
+    """Passages of a chunk's embed text, at most budget of them; [] for short chunks."""
+    if len(text) < min_chars or budget < 2:
+        return []
+    sections = []  # [(heading, [passage body, ...])]
+    for heading, block in split_blocks(text):
+        if not sections or sections[-1][0] != heading:
+            sections.append((heading, []))
+        bodies = sections[-1][1]
+        for piece in (_cut(block, target) if len(block) > target else [block]):
+            if bodies and len(bodies[-1]) + len(piece) + 2 <= target:
+                bodies[-1] += "\n\n" + piece
+            else:
+                bodies.append(piece)
+
+    passages = [(heading, body) for heading, bodies in sections for body in bodies]
+    while len(passages) > budget:
+        # Merge the adjacent pair with the smallest combined size
+        i = min(range(len(passages) - 1), key=lambda j: len(passages[j][1]) + len(passages[j + 1][1]))
+        heading = passages[i][0]
+        passages[i:i + 2] = [(heading, passages[i][1] + "\n\n" + passages[i + 1][1])]
+    if len(passages) < 2:
+        return []
+
+    title = _title(text)
+    out = []
+    for heading, body in passages:
+        prefix = [p for p in (title, heading if heading and not body.startswith(heading) else "") if p]
+        out.append("\n\n".join(prefix + [body]))
+    return out
+
+
+def passage_items(item: dict, budget: int = DEFAULT_BUDGET) -> list[dict]:
+    """Embed items for the passages of a prepared chunk (import_qdrant.prepare_item)."""
+    return [{
+        "filename": item["filename"],
+        "passage": i,
+        "embed_text": passage,
+        "embed_hash": hashlib.md5(passage.encode()).hexdigest(),
+    } for i, passage in enumerate(split_passages(item["embed_text"], budget))]
+
+
+def aggregate(chunk_hits: list[tuple[str, float]], passage_hits: list[tuple[str, float]],
+              k: int) -> list[tuple[str, float]]:
+    """Top k (filename, score): each chunk scores the best of its own vector and its passages."""
+    best = {}
+    for filename, score in list(chunk_hits) + list(passage_hits):
+        if score > best.get(filename, float("-inf")):
+            best[filename] = score
+    return sorted(best.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+
+
+def long_chunks(data_dir=None, min_chars: int = MIN_CHUNK_CHARS) -> set[str]:
+    """Filenames of the chunks whose embed text is long enough to get passages."""
+    from import_qdrant import DATA_DIR, build_embed_text
+    return {p.name for p in sorted((data_dir or DATA_DIR).glob("*.md"))
+            if len(build_embed_text(p.read_text(encoding="utf-8"))) >= min_chars}
+
+
+def main():
+    from import_qdrant import DATA_DIR, build_embed_text
+
+    budget = DEFAULT_BUDGET
+    if "--passage-budget" in sys.argv:
+        budget = int(sys.argv[sys.argv.index("--passage-budget") + 1])
+    names = [a for a in sys.argv[1:] if a.endswith(".md")]
+
+    if names:
+        for name in names:
+            text = build_embed_text((DATA_DIR / name).read_text(encoding="utf-8"))
+            passages = split_passages(text, budget)
+            print(f"{name}: {len(text)} chars, {len(passages)} passages")
+            for i, passage in enumerate(passages):
+                print(f"\n--- passage {i} ({len(passage)} chars) ---\n{passage}")
+        return
+
+    chunks = 0
+    counts = []
+    for path in sorted(DATA_DIR.glob("*.md")):
+        chunks += 1
+        passages = split_passages(build_embed_text(path.read_text(encoding="utf-8")), budget)
+        if passages:
+            counts.append(len(passages))
+    total = sum(counts)
+    print(f"{chunks} chunks, {len(counts)} long enough for passages (>= {MIN_CHUNK_CHARS} chars),"
+          f" {total} passages at budget {budget}")
+    if chunks:
+        print(f"  vectors per chunk: {(chunks + total) / chunks:.2f} on average,"
+              f" {1 + max(counts, default=0)} at most")
+
+
+if __name__ == "__main__":
+    main()
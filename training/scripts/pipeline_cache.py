@@ -0,0 +1,162 @@
+"""
+Crash-safe, incremental cache for parsed_sources.json.
+
+The pipeline scripts (clean_chunks, document_examples, enrich_chunks) used to
+rewrite the whole pretty-printed parsed_sources.json after every file. That is
+O(n²) bytes over a full run, and a crash mid-write leaves a truncated file.
+
+Instead, each per-file update is appended as one JSON line to a journal next
+to the snapshot (parsed_sources.journal.jsonl) — O(1) per file. Every
+COMPACT_EVERY records, and on close(), the journal is folded into the
+snapshot: the snapshot and journal are re-read from disk (so records written
+by other scripts running concurrently are kept), written to a temp file,
+fsynced and swapped in with an atomic rename, then the journal is truncated.
+A crash at any point leaves either the old snapshot plus a replayable
+journal, or the new snapshot — never a half-written file. A torn final
+journal line is ignored on replay.
+
+Journal appends and compaction are serialised across processes with an
+advisory lock file (fcntl; on platforms without it, only in-process locking
+applies).
+
+Usage:
+    cache = PipelineCache(project_root / 'parsed_sources.json')
+    chunks = cache.section('chunks')          # live dict view
+    cache.record('chunks', name, {...})       # O(1) durable update
+    cache.close()                             # final compaction
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+COMPACT_EVERY = 500  # journal records between snapshot rewrites
+
+
+def atomic_write_json(path: Path, data, indent: int = 2, ensure_ascii: bool = True):
+    """Write JSON to path via temp file + fsync + rename (never half-written)."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=ensure_ascii)
+        f.write('\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_journal(journal_path: Path):
+    """Yield (section, key, value) records; skip a torn trailing line."""
+    if not journal_path.exists():
+        return
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield rec['s'], rec['k'], rec.get('v')
+
+
+def _apply(data: dict, section: str, key: str, value):
+    bucket = data.setdefault(section, {})
+    if value is None:
+        bucket.pop(key, None)
+    else:
+        bucket[key] = value
+
+
+class PipelineCache:
+    """parsed_sources.json snapshot + append-only journal. Thread-safe."""
+
+    def __init__(self, path: Path, compact_every: int = COMPACT_EVERY):
+        self.path = Path(path)
+        self.journal_path = self.path.with_name(self.path.stem + '.journal.jsonl')
+        self.lock_path = self.path.with_name('.' + self.path.name + '.lock')
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._pending = 0
+        with self._file_lock():
+            self.data = self._load_from_disk()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def _load_from_disk(self) -> dict:
+        data = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        for section, key, value in _read_journal(self.journal_path):
+            _apply(data, section, key, value)
+        return data
+
+    def section(self, name: str) -> dict:
+        """Live dict for a cache section ('chunks', 'examples', ...)."""
+        with self._lock:
+            return self.data.setdefault(name, {})
+
+    def record(self, section: str, key: str, value):
+        """Set data[section][key] = value and journal it. value=None deletes."""
+        line = json.dumps({'s': section, 'k': key, 'v': value}, ensure_ascii=False) + '\n'
+        with self._lock:
+            _apply(self.data, section, key, value)
+            with self._file_lock():
+                with open(self.journal_path, 'a+b') as f:
+                    # Start a fresh line if a crashed writer left a torn record
+                    if f.tell() > 0:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            line = '\n' + line
+                    f.write(line.encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._pending += 1
+            if self._pending >= self.compact_every:
+                self._compact_locked()
+
+    def compact(self):
+        """Fold the journal into the snapshot with an atomic rename."""
+        with self._lock:
+            self._compact_locked()
+
+    def _compact_locked(self):
+        with self._file_lock():
+            if not self.journal_path.exists() or self.journal_path.stat().st_size == 0:
+                self._pending = 0
+                return
+            merged = self._load_from_disk()
+            atomic_write_json(self.path, merged)
+            # Snapshot is durable; the journal is now redundant
+            with open(self.journal_path, 'w'):
+                pass
+            # Adopt the compacted state: it has everything other processes
+            # recorded since we loaded, their deletions included, and all of
+            # ours (record() journals before it returns). Sections are updated
+            # in place, as callers hold the dicts section() returned
+            for section in merged.keys() | self.data.keys():
+                bucket = self.data.setdefault(section, {})
+                on_disk = merged.get(section, {})
+                for key in bucket.keys() - on_disk.keys():
+                    del bucket[key]
+                bucket.update(on_disk)
+            self._pending = 0
+
+    def close(self):
+        self.compact()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Reference prefetch planning for clean_chunks.py.
+
+A chunk whose cleaning needs a neighbour costs two requests: the model
+answers NEED_REFERENCE: <name>, and clean_chunk() replays the whole
+conversation with the referenced chunk appended. The split configs already
+declare which chunks reference which ("references", rendered as the
+"Additional information" footer by split_training.py), so most of those
+round trips can be predicted and the neighbour sent with the first request.
+
+plan_prefetch() picks at most one reference per chunk:
+  - the reference its last clean asked for (clean_chunks records it as
+    "ref" in parsed_sources.json, and keeps it while this inline answers
+    the request; a continuation inline the model did not need is never
+    recorded), if that chunk still exists, else
+  - the first declared reference that continues it: the topic says
+    "continuation"/"continued"/..., or both names are numbered parts of one
+    sequence (declare_zero_page_part1 / declare_zero_page_part2).
+References over MAX_INLINE_TOKENS are left to the normal follow-up.
+
+order_by_references() moves prefetch targets, then chunks referenced by
+more of the chunks being cleaned, to the front of the work queue, so their
+cleaned Markdown (shorter than the raw split text) is usually already in
+training/data/ when a chunk that inlines them is sent.
+
+Plan statistics for the current tree:
+    python3 training/scripts/reference_plan.py
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+
+from llm_gateway import CHARS_PER_TOKEN
+from pipeline_cache import PipelineCache
+from split_training import sanitize_name
+
+MAX_INLINE_TOKENS = 3000  # estimated tokens of a reference worth inlining
+
+_CONTINUATION = re.compile(r"\bcontinu(?:ation|ed|es|ing)\b", re.IGNORECASE)
+_SEQUENCE = re.compile(r"^(.+?)(?:_part)?_?(\d+)$")
+
+
+def load_reference_graph(config_dir: Path) -> dict[str, list[tuple[str, str]]]:
+    """Map chunk filename -> [(referenced chunk name, topic), ...] from the split configs."""
+    graph = {}
+    for config_path in sorted(config_dir.glob("*.json")):
+        try:
+            config = json.loads(config_path.read_text(encoding="utf-8"))
+        except (json.JSONDecodeError, OSError):
+            continue
+        for split in config.get("splits", []):
+            name = split.get("name", "")
+            references = split.get("references")
+            if not name or not references or split.get("ignore") or "ignored" in name.lower():
+                continue
+            graph[f"{sanitize_name(name)}.txt"] = [
+                (sanitize_name(ref["chunk"]), ref.get("topic", ""))
+                for ref in references if ref.get("chunk")
+            ]
+    return graph
+
+
+def is_continuation(chunk_stem: str, ref_name: str, topic: str) -> bool:
+    """True if the reference reads as the other half of the chunk."""
+    if _CONTINUATION.search(topic):
+        return True
+    a, b = _SEQUENCE.match(chunk_stem), _SEQUENCE.match(ref_name)
+    return bool(a and b and a.group(1) == b.group(1) and abs(int(a.group(2)) - int(b.group(2))) == 1)
+
+
+def plan_prefetch(names: list[str], graph: dict, history: dict[str, str], split_dir: Path,
+                  max_tokens: int = MAX_INLINE_TOKENS) -> dict[str, tuple[str, str]]:
+    """Choose the reference to inline for each chunk filename in names.
+
+    history maps chunk filename -> reference its last clean used. Returns
+    {chunk filename: (referenced chunk name, reason)} where reason is
+    "history" or "continuation".
+    """
+    def usable(ref_name):
+        path = split_dir / f"{ref_name}.txt"
+        try:
+            return path.stat().st_size // CHARS_PER_TOKEN <= max_tokens
+        except FileNotFoundError:
+            return False
+
+    plan = {}
+    for name in names:
+        stem = name.removesuffix(".txt")
+        previous = history.get(name)
+        if previous and previous != stem and usable(previous):
+            plan[name] = (previous, "history")
+            continue
+        for ref_name, topic in graph.get(name, []):
+            if ref_name != stem and is_continuation(stem, ref_name, topic) and usable(ref_name):
+                plan[name] = (ref_name, "continuation")
+                break
+    return plan
+
+
+def order_by_references(names: list[str], graph: dict, plan: dict) -> list[str]:
+    """names reordered so prefetch targets, then the most referenced chunks, go first.
+
+    The sort is stable: otherwise the original order is kept.
+    """
+    wanted = set(names)
+    targets = {f"{ref_name}.txt" for ref_name, _ in plan.values()}
+    referenced = {}
+    for name in names:
+        for ref_name, _ in graph.get(name, []):
+            ref_file = f"{ref_name}.txt"
+            if ref_file in wanted:
+                referenced[ref_file] = referenced.get(ref_file, 0) + 1
+    return sorted(names, key=lambda n: (n not in targets, -referenced.get(n, 0)))
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    split_dir = project_root / "split"
+    graph = load_reference_graph(project_root / "split_config")
+
+    # Snapshot + journal, as clean_chunks.py reads it (unflushed entries included)
+    chunks = PipelineCache(project_root / "parsed_sources.json").section("chunks")
+    history = {name: entry["ref"] for name, entry in chunks.items() if entry.get("ref")}
+
+    names = sorted(p.name for p in split_dir.glob("*.txt"))
+    plan = plan_prefetch(names, graph, history, split_dir)
+    edges = sum(len(refs) for refs in graph.values())
+    reasons = {}
+    for _, reason in plan.values():
+        reasons[reason] = reasons.get(reason, 0) + 1
+
+    print(f"Reference graph: {len(graph)} chunks with references, {edges} edges")
+    print(f"Prefetch plan: {len(plan)} of {len(names)} chunks inline a reference"
+          + "".join(f", {count} by {reason}" for reason, count in sorted(reasons.items())))
+    if "-v" in sys.argv:
+        for name, (ref_name, reason) in sorted(plan.items()):
+            print(f"  {name} <- {ref_name} ({reason})")
+
+
+if __name__ == "__main__":
+    main()
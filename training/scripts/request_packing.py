@@ -0,0 +1,186 @@
+"""
+Token-budget request packing for the per-chunk chat scripts.
+
+clean_chunks, enrich_chunks and add_key_registers send one chat completion
+per chunk, each re-sending a multi-KB system prompt. For the many small
+chunks in training/data/ the system prompt is most of the input tokens and
+the request count most of the wall time. Packed mode (--pack) instead puts
+several chunks into one request:
+
+    system: <script's SYSTEM_PROMPT> + PACK_INSTRUCTIONS
+    user:   [{"id": "a.md", "content": "..."}, {"id": "b.md", ...}]
+    reply:  {"results": [{"id": "a.md", "output": "..."}, ...]}
+
+Each slot's output is exactly what the script would have got back from a
+single request, so the scripts keep their existing parsing. Chunks are
+grouped greedily in order until the estimated content tokens reach the
+budget (--token-budget, default DEFAULT_BUDGET); a chunk over half the
+budget gains little from packing and is sent on its own. A slot that is
+missing, duplicated or rejected by the script's validator is retried as a
+normal single request, so packing never loses a chunk.
+
+ModeReport prints the request count, throughput and estimated cost of a run
+so packed, batch (batch_runner.py) and single runs can be compared.
+"""
+
+import json
+import threading
+import time
+
+from llm_gateway import CHARS_PER_TOKEN
+
+DEFAULT_BUDGET = 8000  # estimated content tokens per packed request
+
+PACK_INSTRUCTIONS = """
+
+## Packed request format
+
+The user message is a JSON array of documents, each {"id": ..., "content": ...}.
+Apply the instructions above to EACH document independently, exactly as if it
+had been sent on its own; never mix content between documents.
+
+Respond with ONLY a JSON object of this form, one entry per input document, in
+input order:
+{"results": [{"id": "<document id>", "output": "<your complete response for that document>"}]}
+
+"output" is a string holding precisely the response the instructions above ask
+for (markdown, directives, NONE, ...), with newlines escaped as JSON requires.
+"""
+
+
+def content_tokens(text: str) -> int:
+    """Estimated tokens of one chunk's content."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def plan_packs(items: list[tuple[str, str]], budget: int) -> tuple[list[list[tuple[str, str]]], list[tuple[str, str]]]:
+    """Group (id, content) items into packs under the token budget.
+
+    Returns (packs, singles): packs hold two or more items; singles are
+    items too large to pack, or left alone at the end of a group.
+    """
+    packs = []
+    singles = []
+    current = []
+    used = 0
+    for item in items:
+        cost = content_tokens(item[1])
+        if cost > budget // 2:
+            singles.append(item)
+            continue
+        if current and used + cost > budget:
+            packs.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        packs.append(current)
+    # A pack of one is just a single request with a bigger prompt
+    singles.extend(p[0] for p in packs if len(p) == 1)
+    return [p for p in packs if len(p) > 1], singles
+
+
+def parse_pack_response(text: str, ids: list[str]) -> dict[str, str]:
+    """Map id -> output for every well-formed slot of a packed reply.
+
+    Slots with an unknown id, a non-string or empty output, or an id that
+    appears twice are dropped (the caller retries those ids singly).
+    """
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    results = data.get("results") if isinstance(data, dict) else data
+    if not isinstance(results, list):
+        return {}
+
+    wanted = set(ids)
+    outputs = {}
+    duplicated = set()
+    for entry in results:
+        if not isinstance(entry, dict):
+            continue
+        slot_id = entry.get("id")
+        output = entry.get("output")
+        if slot_id not in wanted or not isinstance(output, str) or not output.strip():
+            continue
+        if slot_id in outputs:
+            duplicated.add(slot_id)
+        outputs[slot_id] = output.strip()
+    for slot_id in duplicated:
+        del outputs[slot_id]
+    return outputs
+
+
+def request_pack(client, model: str, system_prompt: str, pack: list[tuple[str, str]],
+                 validate=None, **create_kwargs) -> tuple[dict[str, str], object]:
+    """Send one packed request. Returns ({id: output} for valid slots, response).
+
+    validate(output) -> bool rejects slots the script could not use; those
+    ids are simply absent from the result.
+    """
+    payload = json.dumps([{"id": slot_id, "content": content} for slot_id, content in pack],
+                         ensure_ascii=False)
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt + PACK_INSTRUCTIONS},
+            {"role": "user", "content": payload},
+        ],
+        response_format={"type": "json_object"},
+        **create_kwargs,
+    )
+    outputs = parse_pack_response(response.choices[0].message.content,
+                                  [slot_id for slot_id, _ in pack])
+    if validate is not None:
+        outputs = {k: v for k, v in outputs.items() if validate(v)}
+    return outputs, response
+
+
+class ModeReport:
+    """Requests, throughput and cost of one run, for comparing --pack / --batch with single mode."""
+
+    def __init__(self, mode: str, budget: int | None = None):
+        self.mode = mode
+        self.budget = budget
+        self.packs = 0
+        self.packed_items = 0
+        self.retried = 0
+        self.batch_requests = 0
+        self.batch_cost = None
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def count(self, packs: int = 0, packed_items: int = 0, retried: int = 0):
+        with self._lock:
+            self.packs += packs
+            self.packed_items += packed_items
+            self.retried += retried
+
+    def count_batch(self, requests: int, cost: float | None):
+        """Add requests answered by a Batch API job (not seen by the gateway)."""
+        with self._lock:
+            self.batch_requests += requests
+            if cost is not None:
+                self.batch_cost = (self.batch_cost or 0.0) + cost
+
+    def lines(self, items: int, gateway) -> list[str]:
+        elapsed = time.monotonic() - self._start
+        label = self.mode if self.budget is None else f"{self.mode} (budget {self.budget:,} tokens)"
+        lines = [f"Mode: {label}"]
+        if self.packs:
+            lines.append(f"  {self.packs} packed requests carrying {self.packed_items} chunks"
+                         f" ({self.packed_items / self.packs:.1f}/request),"
+                         f" {self.retried} slots retried singly")
+        rate = items / elapsed * 60 if elapsed > 0 else 0.0
+        requests = gateway.requests + self.batch_requests
+        per_chunk = items and requests / items
+        line = (f"  {items} chunks, {requests} requests ({per_chunk:.2f}/chunk)"
+                f" in {elapsed:.1f}s ({rate:.0f} chunks/min)")
+        cost = gateway.cost()
+        if self.batch_cost is not None:
+            cost = (cost or 0.0) + self.batch_cost
+        if cost is not None and items:
+            line += f", ~${cost:.4f} (${cost / items:.5f}/chunk)"
+        lines.append(line)
+        return lines
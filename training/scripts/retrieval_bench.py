@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["numpy", "openai", "requests"]
+# ///
+"""
+Retrieval quality and latency benchmark over a versioned golden query set.
+
+training/benchmarks/golden_queries.json maps queries ("$D418 filter volume",
+"sprite multiplexing", ...) to the chunk filenames a good search returns.
+Its "version" is bumped whenever a query or its expected files change;
+results carry it, and --baseline refuses to compare across versions.
+
+For every query the benchmark records the top k filenames and reports:
+  - recall@k: share of the expected files found in the top k (mean)
+  - long-chunk recall@k: the same over the expected files long enough to
+    get passages (passages.py), for the queries that have any
+  - vectors per chunk: 1, or more with passage vectors
+  - MRR@k: 1 / rank of the first expected file, 0 if none (mean)
+  - p50 / p95 search latency (query embedding timed separately)
+  - index build time, index size and peak process RSS
+
+Backends:
+  local (default)  local_search.LocalIndex, --mode hybrid|bm25|vector;
+                   --rebuild times a fresh build (build time otherwise
+                   comes from the last build; --passages / --passage-budget
+                   N add passage vectors), size is the index files.
+  --qdrant         a Qdrant collection at QDRANT_URL (--collection, default
+                   c64_training), searched like query/src/search/: address
+                   tags in the query are filtered on tags / addr_ranges and
+                   merged ahead of the unfiltered hits (hybrid), quantized
+                   collections are rescored. Query vectors come from the
+                   embedding store / API at the collection's size. Size
+                   is the vector storage implied by the collection config.
+                   A <collection>_passages collection, if there is one, is
+                   searched too and merged by filename (best score).
+  --load-qdrant    first copies the local index (vectors and tag payloads)
+                   into a fresh c64_training_bench collection, timed as the
+                   build, and searches it with the index's own embedder.
+--no-passages searches chunk vectors only, for a before/after on one index.
+
+With the hash stand-in embedder and fake_services.py as Qdrant, the whole
+benchmark runs offline:
+
+    python3 training/scripts/local_search.py --build --embedder hash
+    python3 training/scripts/retrieval_bench.py                   # local hybrid, k=10
+    python3 training/scripts/retrieval_bench.py --mode bm25 -v     # per-query hits and misses
+    python3 training/scripts/retrieval_bench.py --json after.json --baseline before.json
+    python3 training/scripts/retrieval_bench.py --rebuild --passages --baseline before.json
+    QDRANT_URL=http://localhost:8999 python3 training/scripts/retrieval_bench.py --load-qdrant
+"""
+
+import json
+import re
+import resource
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from local_search import INDEX_DIR, LocalIndex, build_index, make_embedder, query_tags
+from passages import DEFAULT_BUDGET, aggregate, long_chunks, passage_collection
+
+GOLDEN_FILE = Path(__file__).parent.parent / "benchmarks" / "golden_queries.json"
+BENCH_COLLECTION = "c64_training_bench"
+QUANTIZATION_OVERSAMPLING = 2.0  # query/src/search/qdrant.ts
+MODES = ("hybrid", "bm25", "vector")
+
+
+def load_golden(path: Path = GOLDEN_FILE) -> dict:
+    """{"version": int, "queries": [{"query", "expected"}]}."""
+    golden = json.loads(path.read_text(encoding="utf-8"))
+    for entry in golden["queries"]:
+        if not entry.get("expected"):
+            raise ValueError(f"{path.name}: query {entry.get('query')!r} has no expected files")
+    return golden
+
+
+def recall_at_k(found: list[str], expected: list[str]) -> float:
+    return len(set(found) & set(expected)) / len(expected)
+
+
+def reciprocal_rank(found: list[str], expected: list[str]) -> float:
+    wanted = set(expected)
+    for rank, filename in enumerate(found, 1):
+        if filename in wanted:
+            return 1.0 / rank
+    return 0.0
+
+
+def percentile(values: list[float], pct: float) -> float:
+    return float(np.percentile(values, pct)) if values else 0.0
+
+
+# --- Qdrant backend (mirrors query/src/search/) ---
+
+_ADDRESS_TAG = re.compile(r"^\$([0-9A-Fa-f]{2,4})$")
+
+
+def tag_conditions(tag: str) -> list[dict]:
+    """Keyword match on tags, plus the addr_ranges interval match for address tags (qdrant.ts)."""
+    conditions = [{"key": "tags", "match": {"value": tag}}]
+    m = _ADDRESS_TAG.match(tag)
+    if m:
+        value = int(m.group(1), 16)
+        conditions.append({"nested": {"key": "addr_ranges", "filter": {"must": [
+            {"key": "start", "range": {"lte": value}},
+            {"key": "end", "range": {"gte": value}},
+        ]}}})
+    return conditions
+
+
+def has_natural_language(query: str) -> bool:
+    """2+ words left after removing addresses, numbers and punctuation (strategy.ts)."""
+    stripped = re.sub(r"(?<!\w)\$[0-9A-Fa-f]{1,4}(?!\w)", "", query)
+    stripped = re.sub(r"(?<!\w)%[01]{4,8}(?!\w)", "", stripped)
+    stripped = re.sub(r"[0-9$%,#()\s]+", " ", stripped)
+    return len([w for w in stripped.split() if len(w) > 1]) >= 2
+
+
+class QdrantBackend:
+    """Searches a collection over REST the way the query tool does."""
+
+    def __init__(self, collection: str, embedder=None, use_passages: bool = True):
+        import import_qdrant
+        self.q = import_qdrant
+        self.collection = collection
+        self.dims, self.quantization = import_qdrant.qdrant_vector_config(collection)
+        self.embedder = embedder or make_embedder("openai", self.dims)
+        self.points = self._points_count(collection)
+        self.passages = passage_collection(collection)
+        if not use_passages or not import_qdrant.qdrant_collection_exists(self.passages):
+            self.passages = None
+        self.passage_points = self._points_count(self.passages) if self.passages else 0
+
+    def _points_count(self, collection: str) -> int:
+        r = self.q._qdrant.get(f"{self.q.QDRANT_URL}/collections/{collection}")
+        return r.json()["result"].get("points_count") or 0
+
+    def memory_bytes(self) -> int:
+        """Vector storage held in RAM: quantized copies if quantized, else float32."""
+        per_vector = {None: self.dims * 4, "scalar": self.dims, "binary": (self.dims + 7) // 8}[self.quantization]
+        return (self.points + self.passage_points) * per_vector
+
+    def _body(self, vector: np.ndarray, limit: int, tags: list[str] | None) -> dict:
+        body = {"vector": vector.tolist(), "limit": limit, "with_payload": True}
+        if self.quantization:
+            body["params"] = {"quantization": {"rescore": True, "oversampling": QUANTIZATION_OVERSAMPLING}}
+        if tags:
+            body["filter"] = {"should": [c for tag in tags for c in tag_conditions(tag)]}
+        return body
+
+    def _search(self, vector: np.ndarray, limit: int, tags: list[str] | None = None) -> list[str]:
+        body = self._body(vector, limit, tags)
+        r = self.q._qdrant.post(f"{self.q.QDRANT_URL}/collections/{self.collection}/points/search", json=body)
+        r.raise_for_status()
+        hits = [(hit["payload"]["filename"], hit["score"]) for hit in r.json()["result"]]
+        if self.passages:
+            # Best passage per parent chunk, folded into the chunk scores
+            body = {**self._body(vector, limit, tags), "group_by": "parent_id", "group_size": 1}
+            r = self.q._qdrant.post(f"{self.q.QDRANT_URL}/collections/{self.passages}/points/search/groups",
+                                    json=body)
+            r.raise_for_status()
+            best = [(group["hits"][0]["payload"]["filename"], group["hits"][0]["score"])
+                    for group in r.json()["result"]["groups"]]
+            hits = aggregate(hits, best, limit)
+        return [filename for filename, _ in hits]
+
+    def search(self, query: str, k: int, vector: np.ndarray) -> list[str]:
+        tags = query_tags(query)
+        if not tags:
+            return self._search(vector, k)
+        filtered = self._search(vector, k, tags)
+        if not has_natural_language(query):
+            return filtered
+        merged = filtered + [f for f in self._search(vector, k) if f not in filtered]
+        return merged[:k]
+
+
+def load_bench_collection(index: LocalIndex, collection: str = BENCH_COLLECTION) -> float:
+    """Copy the local index (and its passages) into fresh collections. Returns the seconds taken."""
+    import import_qdrant as q
+    start = time.perf_counter()
+    q.qdrant_delete_collection(collection)
+    q.qdrant_delete_collection(passage_collection(collection))
+    q.qdrant_create_collection(collection, index.meta["dims"])
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    for i in range(0, len(index.docs), 256):
+        q.qdrant_upsert_points([{
+            "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, doc["filename"])),
+            "vector": vectors[n].tolist(),
+            "payload": {"filename": doc["filename"], "title": doc["title"],
+                        "tags": doc["tags"], "addr_ranges": doc["addr_ranges"]},
+        } for n, doc in enumerate(index.docs[i:i + 256], i)], collection)
+    if index.passage_vectors is not None:
+        q.qdrant_create_collection(passage_collection(collection), index.meta["dims"],
+                                   indexes=q.PASSAGE_INDEXES)
+        passage_vectors = np.asarray(index.passage_vectors, dtype=np.float32)
+        parents = np.asarray(index.passage_doc).tolist()
+        for i in range(0, len(parents), 256):
+            q.qdrant_upsert_points([{
+                "id": str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{index.docs[parent]['filename']}#{n}")),
+                "vector": passage_vectors[n].tolist(),
+                "payload": {"parent_id": str(uuid.uuid5(uuid.NAMESPACE_DNS, index.docs[parent]["filename"])),
+                            "filename": index.docs[parent]["filename"], "tags": index.docs[parent]["tags"],
+                            "addr_ranges": index.docs[parent]["addr_ranges"]},
+            } for n, parent in enumerate(parents[i:i + 256], i)], passage_collection(collection))
+    return time.perf_counter() - start
+
+
+# --- Benchmark ---
+
+def run_benchmark(golden: dict, search, embed, k: int, long_files: set[str] | None = None) -> dict:
+    """Score search(query, k, vector) over the golden set; embed(texts) gives query vectors.
+
+    With long_files, recall is also averaged over just those expected files
+    (the queries that expect none of them are left out of it).
+    """
+    queries = [entry["query"] for entry in golden["queries"]]
+    start = time.perf_counter()
+    vectors = embed(queries)
+    embed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    search(queries[0], k, vectors[0])  # warm-up (page faults, lazy tables, connections)
+    per_query, latencies = [], []
+    for entry, vector in zip(golden["queries"], vectors):
+        start = time.perf_counter()
+        found = search(entry["query"], k, vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+        expected_long = [f for f in entry["expected"] if f in (long_files or ())]
+        per_query.append({
+            "query": entry["query"],
+            "recall": recall_at_k(found, entry["expected"]),
+            "recall_long": recall_at_k(found, expected_long) if expected_long else None,
+            "rr": reciprocal_rank(found, entry["expected"]),
+            "missed": [f for f in entry["expected"] if f not in found],
+            "found": found,
+        })
+    long_recalls = [q["recall_long"] for q in per_query if q["recall_long"] is not None]
+    return {
+        "golden_version": golden["version"],
+        "k": k,
+        "queries": len(per_query),
+        "recall": float(np.mean([q["recall"] for q in per_query])),
+        "recall_long": float(np.mean(long_recalls)) if long_recalls else None,
+        "long_queries": len(long_recalls),
+        "mrr": float(np.mean([q["rr"] for q in per_query])),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "embed_ms": embed_ms,
+        "per_query": per_query,
+    }
+
+
+def _index_bytes(index_dir: Path) -> int:
+    return sum(p.stat().st_size for p in index_dir.iterdir() if p.is_file())
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def print_report(result: dict, baseline: dict | None, verbose: bool):
+    if verbose:
+        for q in result["per_query"]:
+            mark = "ok  " if not q["missed"] else "MISS"
+            print(f"  {mark} recall {q['recall']:.2f} rr {q['rr']:.2f}  {q['query']}")
+            for filename in q["missed"]:
+                print(f"         missing {filename}")
+        print()
+
+    print("=" * 50)
+    print(f"Retrieval benchmark: {result['backend']}, golden v{result['golden_version']},"
+          f" {result['queries']} queries, k={result['k']}")
+    rows = [
+        ("recall@k", "recall", "{:.3f}"),
+        (f"long-chunk recall@k ({result.get('long_queries', 0)}q)", "recall_long", "{:.3f}"),
+        ("MRR@k", "mrr", "{:.3f}"),
+        ("p50 latency (ms)", "p50_ms", "{:.3f}"),
+        ("p95 latency (ms)", "p95_ms", "{:.3f}"),
+        ("query embedding (ms)", "embed_ms", "{:.3f}"),
+        ("index build (s)", "build_s", "{:.2f}"),
+        ("index size (MB)", "index_mb", "{:.1f}"),
+        ("vectors per chunk", "vectors_per_chunk", "{:.2f}"),
+        ("peak RSS (MB)", "rss_mb", "{:.1f}"),
+    ]
+    for label, key, fmt in rows:
+        value = result.get(key)
+        if value is None:
+            continue
+        line = f"  {label:<27} {fmt.format(value):>10}"
+        if baseline and baseline.get(key) is not None:
+            line += f"  ({value - baseline[key]:+.3f} vs baseline)"
+        print(line)
+    print("=" * 50)
+
+
+def main():
+    k = 10
+    if "-k" in sys.argv:
+        k = int(sys.argv[sys.argv.index("-k") + 1])
+    mode = "hybrid"
+    if "--mode" in sys.argv:
+        mode = sys.argv[sys.argv.index("--mode") + 1]
+        if mode not in MODES:
+            print(f"Error: --mode must be one of {', '.join(MODES)}")
+            sys.exit(1)
+    embedder_name = None
+    if "--embedder" in sys.argv:
+        embedder_name = sys.argv[sys.argv.index("--embedder") + 1]
+    collection = None
+    if "--collection" in sys.argv:
+        collection = sys.argv[sys.argv.index("--collection") + 1]
+    golden_path = GOLDEN_FILE
+    if "--golden" in sys.argv:
+        golden_path = Path(sys.argv[sys.argv.index("--golden") + 1])
+    json_path = None
+    if "--json" in sys.argv:
+        json_path = Path(sys.argv[sys.argv.index("--json") + 1])
+    baseline = None
+    if "--baseline" in sys.argv:
+        baseline = json.loads(Path(sys.argv[sys.argv.index("--baseline") + 1]).read_text())
+    verbose = "-v" in sys.argv
+    use_passages = "--no-passages" not in sys.argv
+    passage_budget = DEFAULT_BUDGET if "--passages" in sys.argv else None
+    if "--passage-budget" in sys.argv:
+        passage_budget = int(sys.argv[sys.argv.index("--passage-budget") + 1])
+
+    golden = load_golden(golden_path)
+    if baseline and (baseline.get("golden_version"), baseline.get("k")) != (golden["version"], k):
+        print(f"Error: baseline is golden v{baseline.get('golden_version')} k={baseline.get('k')},"
+              f" this run v{golden['version']} k={k}")
+        sys.exit(1)
+
+    build_s = None
+    if "--rebuild" in sys.argv:
+        start = time.perf_counter()
+        build_index(embedder_name or "hash", passage_budget=passage_budget)
+        build_s = time.perf_counter() - start
+    long_files = long_chunks()
+
+    if "--qdrant" in sys.argv or "--load-qdrant" in sys.argv:
+        embedder = None
+        if "--load-qdrant" in sys.argv:
+            index = LocalIndex()
+            collection = collection or BENCH_COLLECTION
+            build_s = load_bench_collection(index, collection)
+            embedder = index.embedder
+        elif embedder_name:
+            embedder = make_embedder(embedder_name)
+        backend = QdrantBackend(collection or "c64_training", embedder, use_passages)
+        if embedder is None or getattr(embedder, "dims", backend.dims) != backend.dims:
+            backend.embedder = make_embedder(embedder_name or "openai", backend.dims)
+        result = run_benchmark(golden, backend.search, backend.embedder.embed, k, long_files)
+        result["backend"] = (f"qdrant {backend.collection} ({backend.dims}d"
+                             f"{f', {backend.quantization}' if backend.quantization else ''}"
+                             f"{', passages' if backend.passages else ''})")
+        result["index_mb"] = backend.memory_bytes() / 1024 / 1024
+        result["vectors_per_chunk"] = (backend.points + backend.passage_points) / max(backend.points, 1)
+    else:
+        index = LocalIndex(embedder=make_embedder(embedder_name) if embedder_name else None)
+        if build_s is None:
+            build_s = sum(index.meta.get("timings", {}).values()) or None
+
+        def search(query, k, vector):
+            return [f for f, _ in index.search(query, k, vector=vector, use_vectors=mode != "bm25",
+                                                use_bm25=mode != "vector", use_passages=use_passages)]
+
+        embed = index.embedder.embed if mode != "bm25" else (lambda texts: [None] * len(texts))
+        result = run_benchmark(golden, search, embed, k, long_files)
+        passages = use_passages and mode != "bm25" and index.passage_vectors is not None
+        result["backend"] = (f"local {mode} ({index.meta['dims']}d {index.meta['model']}"
+                             f"{', passages' if passages else ''})")
+        result["index_mb"] = _index_bytes(INDEX_DIR) / 1024 / 1024
+        result["vectors_per_chunk"] = 1 + (len(index.passage_doc) / max(len(index.docs), 1) if passages else 0)
+    result["rss_mb"] = _peak_rss_bytes() / 1024 / 1024
+    result["build_s"] = build_s
+
+    print_report(result, baseline, verbose)
+    if json_path:
+        json_path.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,13 +36,33 @@ Splits are by concept/topic, not by size. Each split covers a specific
 subject (e.g. "addressing_modes", "sprite_registers"). The name field
 becomes the output filename. Ignored sections (TOC, indexes, line numbers)
 are skipped. Each output chunk gets "# <context> - <description>" prepended.
+
+Configs are processed in parallel (one worker process per config, --workers N,
+default: CPU count). A chunk file is only rewritten when its bytes change, and
+training/split_manifest.json records the md5, size and mtime of every chunk
+plus the names changed by the last run; clean_chunks.py uses it to skip
+re-hashing chunks that were not touched.
+
+Usage:
+    python3 scripts/split_training.py                      # Split all configs
+    python3 scripts/split_training.py mapping-c64.json     # Split one config
+    python3 scripts/split_training.py --workers 4          # Limit worker processes
 """
 
+import hashlib
 import json
+import mmap
+import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from pipeline_cache import atomic_write_json
+
+# Line terminators as text-mode readlines() sees them (universal newlines)
+_NEWLINE = re.compile(rb'\r\n|\r|\n')
+
 
 def sanitize_name(name: str) -> str:
     """Convert a name to a safe filename component."""
@@ -52,15 +72,29 @@ def sanitize_name(name: str) -> str:
     return name
 
 
-def write_chunk(lines, start, end, total_lines, name, description, context,
-                references, split_dir, verbose):
-    """Write a single output chunk file. Returns (lines_covered, chunk_size) or None if skipped."""
-    end = min(end, total_lines)
+def line_offsets(buf) -> list[int]:
+    """Byte offset of the start of every line in buf."""
+    offsets = [0]
+    offsets.extend(m.end() for m in _NEWLINE.finditer(buf))
+    if offsets[-1] == len(buf):
+        offsets.pop()  # no line after the final terminator
+    return offsets
+
+
+def slice_lines(buf, offsets: list[int], start: int, end: int) -> str:
+    """Lines start..end (1-indexed, inclusive), decoded like text-mode readlines()."""
+    if start > end or start > len(offsets):
+        return ''
+    lo = offsets[start - 1]
+    hi = offsets[end] if end < len(offsets) else len(buf)
+    text = buf[lo:hi].decode('utf-8', errors='replace')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
 
-    # Extract lines (convert 1-indexed to 0-indexed)
-    chunk_lines = lines[start - 1:end]
-    chunk_content = ''.join(chunk_lines)
 
+def render_chunk(body: str, description, context, references) -> str:
+    """Chunk text: context header + source lines + cross-references footer."""
     # Prepend context header
     if context and description:
         header = f"# {context} - {description}\n\n"
@@ -71,7 +105,7 @@ def write_chunk(lines, start, end, total_lines, name, description, context,
     else:
         header = ""
 
-    chunk_content = header + chunk_content
+    chunk_content = header + body
 
     # Append cross-references footer if present
     if references:
@@ -80,76 +114,128 @@ def write_chunk(lines, start, end, total_lines, name, description, context,
             ref_lines.append(f'- "{ref["chunk"]}" which expands on {ref["topic"]}\n')
         chunk_content += ''.join(ref_lines)
 
-    # Output filename is the topic name
-    safe_name = sanitize_name(name)
-    output_name = f"{safe_name}.txt"
-    output_path = split_dir / output_name
+    return chunk_content
 
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(chunk_content)
 
-    chunk_size = len(chunk_content.encode('utf-8'))
-    line_count = end - start + 1
+def _read_existing(path: Path) -> bytes | None:
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
 
-    if verbose:
-        print(f"  Created {output_name} ({chunk_size:,} bytes, lines {start}-{end})")
-
-    return line_count, chunk_size
 
+def plan_split(config_path: Path, raw_dir: Path, split_dir: Path, verbose: bool = True) -> dict:
+    """Render every chunk of one config and compare it with what is on disk.
 
-def split_file(config_path: Path, raw_dir: Path, split_dir: Path, verbose: bool = True) -> int:
-    """Split a single file based on its config. Returns the number of chunks created."""
+    Runs in a worker process and writes nothing. Returns {"log": [lines],
+    "chunks": [(output_name, data or None if unchanged, md5, start, end)],
+    "lines": (extracted, ignored, uncovered) or None if the source is missing}. A log entry that is an int
+    stands for the "Wrote" line of that chunk index; the caller prints it
+    only if that chunk is actually written.
+    The source document is mmap'd and each chunk decoded from its own
+    byte range, instead of reading the whole file into a list of lines.
+    """
     with open(config_path, 'r', encoding='utf-8') as f:
         config = json.load(f)
 
     source_file = config['source_file']
     context = config.get('context', '')
     splits = config.get('splits', [])
+    log = []
+    result = {'log': log, 'chunks': [], 'lines': None}
 
     raw_path = raw_dir / source_file
     if not raw_path.exists():
-        print(f"  Warning: Source file not found: {raw_path}")
-        return 0
-
-    with open(raw_path, 'r', encoding='utf-8', errors='replace') as f:
-        lines = f.readlines()
-
-    total_lines = len(lines)
-    chunks_created = 0
-    lines_covered = 0
-    lines_ignored = 0
-
-    for split in splits:
-        start = split['start']
-        end = min(split['end'], total_lines)
-
-        name = split.get('name', f'chunk_{chunks_created + 1}')
-        if split.get('ignore', False) or 'ignored' in name.lower():
-            reason = split.get('reason', 'no reason given')
-            line_count = end - start + 1
-            lines_ignored += line_count
-            if verbose:
-                print(f"  Ignored lines {start}-{end} ({line_count} lines): {reason}")
-            continue
-        description = split.get('description', name)
-        references = split.get('references', [])
+        log.append(f"  Warning: Source file not found: {raw_path}")
+        return result
+
+    with open(raw_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        try:
+            offsets = line_offsets(buf)
+            total_lines = len(offsets)
+            lines_covered = 0
+            lines_ignored = 0
+
+            for split in splits:
+                start = split['start']
+                end = min(split['end'], total_lines)
+
+                name = split.get('name', f"chunk_{len(result['chunks']) + 1}")
+                if split.get('ignore', False) or 'ignored' in name.lower():
+                    reason = split.get('reason', 'no reason given')
+                    line_count = end - start + 1
+                    lines_ignored += line_count
+                    if verbose:
+                        log.append(f"  Ignored lines {start}-{end} ({line_count} lines): {reason}")
+                    continue
+                description = split.get('description', name)
+                references = split.get('references', [])
+
+                content = render_chunk(slice_lines(buf, offsets, start, end),
+                                       description, context, references)
+                data = content.encode('utf-8')
+
+                # Output filename is the topic name
+                output_name = f"{sanitize_name(name)}.txt"
+                changed = _read_existing(split_dir / output_name) != data
+                if verbose and changed:
+                    log.append(len(result['chunks']))
+                result['chunks'].append(
+                    (output_name, data if changed else None, hashlib.md5(data).hexdigest(), start, end))
+                lines_covered += end - start + 1
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    uncovered = total_lines - lines_covered - lines_ignored
+    result['lines'] = (lines_covered, lines_ignored, uncovered)
+    return result
+
+
+def print_split_log(config_name: str, result: dict, written: set[int]):
+    """Print a config's log, "Wrote" lines for the chunk indexes in written,
+    and its summary."""
+    print(f"Processing: {config_name}")
+    for entry in result['log']:
+        if isinstance(entry, int):
+            if entry in written:
+                output_name, data, _, start, end = result['chunks'][entry]
+                print(f"  Wrote {output_name} ({len(data):,} bytes, lines {start}-{end})")
+        else:
+            print(entry)
+    if result['lines'] is None:
+        return
+    covered, ignored, uncovered = result['lines']
+    chunks = len(result['chunks'])
+    print(f"  Summary: {chunks} chunks ({len(written)} written, {chunks - len(written)} unchanged), "
+          f"{covered} lines extracted, {ignored} lines ignored, {uncovered} lines uncovered")
+    if uncovered > 0:
+        print(f"  Warning: {uncovered} lines not covered by any split or ignore entry")
 
-        result = write_chunk(lines, start, end, total_lines,
-                             name, description, context, references,
-                             split_dir, verbose)
-        if result:
-            line_count, _ = result
-            lines_covered += line_count
-            chunks_created += 1
 
+def split_file(config_path: Path, raw_dir: Path, split_dir: Path, verbose: bool = True) -> int:
+    """Split a single file based on its config. Returns the number of chunks created."""
+    result = plan_split(config_path, raw_dir, split_dir, verbose)
+    written = set()
+    for i, (output_name, data, _, _, _) in enumerate(result['chunks']):
+        if data is not None:
+            (split_dir / output_name).write_bytes(data)
+            written.add(i)
     if verbose:
-        uncovered = total_lines - lines_covered - lines_ignored
-        print(f"  Summary: {chunks_created} chunks, {lines_covered} lines extracted, "
-              f"{lines_ignored} lines ignored, {uncovered} lines uncovered")
-        if uncovered > 0:
-            print(f"  Warning: {uncovered} lines not covered by any split or ignore entry")
+        print_split_log(config_path.name, result, written)
+    return len(result['chunks'])
+
 
-    return chunks_created
+def load_manifest(path: Path) -> dict:
+    """Load the split manifest ({"chunks": {name: {md5, size, mtime_ns}}, "changed": [...]})."""
+    if path.exists():
+        try:
+            return json.loads(path.read_text())
+        except json.JSONDecodeError:
+            pass
+    return {'chunks': {}, 'changed': []}
 
 
 def main():
@@ -159,6 +245,7 @@ def main():
     config_dir = project_root / 'split_config'
     raw_dir = project_root / 'documents'
     split_dir = project_root / 'split'
+    manifest_path = project_root / 'split_manifest.json'
 
     split_dir.mkdir(parents=True, exist_ok=True)
 
@@ -170,7 +257,21 @@ def main():
         print(f"Error: Documents directory not found: {raw_dir}")
         sys.exit(1)
 
-    args = [a for a in sys.argv[1:]]
+    workers = os.cpu_count() or 4
+    if '--workers' in sys.argv:
+        idx = sys.argv.index('--workers')
+        workers = int(sys.argv[idx + 1])
+
+    args = []
+    skip_next = False
+    for a in sys.argv[1:]:
+        if skip_next:
+            skip_next = False
+            continue
+        if a == '--workers':
+            skip_next = True
+            continue
+        args.append(a)
 
     # Process specific config or all
     if args:
@@ -184,28 +285,60 @@ def main():
         print("No config files found.")
         sys.exit(1)
 
-    total_chunks = 0
-
+    to_split = []
     for config_path in config_files:
         if not config_path.exists():
             print(f"Config not found: {config_path}")
             continue
+        to_split.append(config_path)
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+    # Render and diff in worker processes; results come back in config
+    # order, so when two configs produce the same chunk name the later one
+    # wins, exactly as with serial processing.
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(to_split) or 1))) as pool:
+        results = list(pool.map(plan_split, to_split,
+                                [raw_dir] * len(to_split), [split_dir] * len(to_split)))
 
-        raw_path = raw_dir / config['source_file']
-        if not raw_path.exists():
-            print(f"Processing: {config_path.name}")
-            print(f"  Warning: Source file not found: {raw_path}")
-            continue
-
-        print(f"Processing: {config_path.name}")
-        chunks = split_file(config_path, raw_dir, split_dir)
-        total_chunks += chunks
+    final = {}  # output_name -> (data or None, md5, (config index, chunk index))
+    duplicates = set()
+    total_chunks = 0
+    for c, result in enumerate(results):
+        for i, (output_name, data, digest, _, _) in enumerate(result['chunks']):
+            if output_name in final:
+                duplicates.add(output_name)
+            final[output_name] = (data, digest, (c, i))
+        total_chunks += len(result['chunks'])
+
+    # Only chunks whose bytes differ are rewritten; untouched files keep
+    # their mtime so downstream change detection can trust it
+    changed = []
+    written = [set() for _ in results]
+    for output_name, (data, _, (c, i)) in final.items():
+        if data is not None:
+            (split_dir / output_name).write_bytes(data)
+            changed.append(output_name)
+            written[c].add(i)
+
+    for config_path, result, config_written in zip(to_split, results, written):
+        print_split_log(config_path.name, result, config_written)
+
+    # Manifest: md5 + stat of every chunk, so clean_chunks can reuse the
+    # hash instead of re-reading files whose size and mtime still match
+    manifest = load_manifest(manifest_path) if args else {'chunks': {}}
+    for output_name, (_, digest, _) in final.items():
+        st = (split_dir / output_name).stat()
+        manifest['chunks'][output_name] = {
+            'md5': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+        }
+    manifest['changed'] = sorted(changed)
+    atomic_write_json(manifest_path, manifest)
 
     print(f"\nTotal chunks created: {total_chunks}")
+    print(f"Written: {len(changed)} changed, {len(final) - len(changed)} unchanged")
+    if duplicates:
+        print(f"Warning: {len(duplicates)} chunk names produced by more than one split (last one wins)")
     print(f"Output directory: {split_dir}")
+    print(f"Manifest: {manifest_path}")
 
 
 if __name__ == '__main__':
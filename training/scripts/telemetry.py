@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Per-call spans of every pipeline run, and a report over them.
+
+Every script used to print a [model, tokens, elapsed] line per request and
+a gateway summary at the end, and then throw both away. Spans are recorded
+instead, to training/metrics.sqlite (WAL mode, like the embedding store):
+
+    runs:  run_id, stage, argv, started, finished
+    spans: run_id, stage, kind, file, model, prompt_tokens, completion_tokens,
+           latency, retries, cache, status, started
+
+LLMGateway writes one span per API call (kind chat / stream / embeddings;
+status ok, error or aborted, with the retries it took), batch_runner.py one
+per Batch API reply (kind batch, started at the job's submission, its
+latency the job's turnaround), and the scripts one per cache decision
+(kind cache, cache "hit" or "miss"): parsed_sources.json skips and
+embedding-store lookups. The stage is the running script's name, and a
+worker labels its work with
+
+    with telemetry.file_context(chunk_name):
+        ...   # spans recorded on this thread, and the API calls it makes
+
+A run starts when the script imports this module (at startup: every stage
+imports it, via llm_gateway.py, with its other imports), so its wall time
+covers the whole process, not just the span of its API calls; the runs row
+itself is written with the first span. Spans are buffered and written in
+batches (and at exit), so recording costs microseconds per call.
+PIPELINE_TELEMETRY=0 turns it off (as does --dry-run); PIPELINE_METRICS
+points it at another database.
+
+    python3 training/scripts/telemetry.py report             # latest run of each stage
+    python3 training/scripts/telemetry.py report --all       # every recorded run
+    python3 training/scripts/telemetry.py report --run ID --top 10
+    python3 training/scripts/telemetry.py runs               # list recorded runs
+    python3 training/scripts/telemetry.py export spans.jsonl [--run ID]
+
+The report gives, per stage: files per minute of wall time, calls, errors,
+retries, tokens and estimated cost, latency p50 / p95 / p99 / max, cache
+hit rate, and the files that took longest in total.
+"""
+
+import atexit
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+DEFAULT_PATH = Path(__file__).parent.parent / "metrics.sqlite"
+FLUSH_EVERY = 100  # buffered spans per write
+PROCESS_STARTED = time.time()  # import time, i.e. script startup: the run's start
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id   TEXT PRIMARY KEY,
+    stage    TEXT NOT NULL,
+    argv     TEXT,
+    started  REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS spans (
+    run_id            TEXT NOT NULL,
+    stage             TEXT NOT NULL,
+    kind              TEXT NOT NULL,
+    file              TEXT,
+    model             TEXT,
+    prompt_tokens     INTEGER,
+    completion_tokens INTEGER,
+    latency           REAL,
+    retries           INTEGER,
+    cache             TEXT,
+    status            TEXT,
+    started           REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spans_run ON spans (run_id);
+"""
+
+SPAN_FIELDS = ("run_id", "stage", "kind", "file", "model", "prompt_tokens", "completion_tokens",
+               "latency", "retries", "cache", "status", "started")
+
+
+class Recorder:
+    """Buffered span writer for one run. Thread-safe; one instance per process."""
+
+    def __init__(self, stage: str, path: Path = DEFAULT_PATH, started: float | None = None):
+        self.stage = stage
+        self.path = Path(path)
+        self.run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{stage}_{os.getpid()}"
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?, NULL)",
+                           (self.run_id, stage, " ".join(sys.argv[1:]), started or time.time()))
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._closed = False
+
+    def span(self, kind: str, **fields):
+        """Record one span; fields are SPAN_FIELDS (started defaults to now - latency)."""
+        latency = fields.get("latency")
+        started = fields.get("started") or time.time() - (latency or 0.0)
+        row = (self.run_id, self.stage, kind, fields.get("file"), fields.get("model"),
+               fields.get("prompt_tokens"), fields.get("completion_tokens"), latency,
+               fields.get("retries"), fields.get("cache"), fields.get("status", "ok"), started)
+        with self._lock:
+            if self._closed:
+                return
+            self._buffer.append(row)
+            if len(self._buffer) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        self._conn.execute("BEGIN")
+        self._conn.executemany(f"INSERT INTO spans VALUES ({', '.join('?' * len(SPAN_FIELDS))})",
+                               self._buffer)
+        self._conn.execute("COMMIT")
+        self._buffer = []
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            self._conn.execute("UPDATE runs SET finished = ? WHERE run_id = ?", (time.time(), self.run_id))
+            self._conn.close()
+            self._closed = True
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+_context = threading.local()
+
+
+def enabled() -> bool:
+    """Off with PIPELINE_TELEMETRY=0, and for --dry-run invocations (nothing is done)."""
+    if "--dry-run" in sys.argv:
+        return False
+    return os.environ.get("PIPELINE_TELEMETRY", "1") not in ("0", "false", "no", "off")
+
+
+def recorder() -> Recorder | None:
+    """The process's recorder (stage = script name), created on first use; None if disabled."""
+    global _recorder
+    if _recorder is None and enabled():
+        with _recorder_lock:
+            if _recorder is None:
+                stage = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+                try:
+                    _recorder = Recorder(stage, Path(os.environ.get("PIPELINE_METRICS") or DEFAULT_PATH),
+                                         PROCESS_STARTED)
+                except sqlite3.Error as e:
+                    print(f"Warning: telemetry disabled ({e})")
+                    os.environ["PIPELINE_TELEMETRY"] = "0"
+                    return None
+                atexit.register(_recorder.close)
+    return _recorder
+
+
+def record(kind: str, **fields):
+    """Record a span on the process recorder; file defaults to the current file_context."""
+    rec = recorder()
+    if rec is not None:
+        fields.setdefault("file", current_file())
+        rec.span(kind, **fields)
+
+
+def record_cache(hit: bool, file: str | None = None, what: str | None = None):
+    """A cache decision: hit (work skipped) or miss (work done)."""
+    record("cache", file=file, model=what, cache="hit" if hit else "miss")
+
+
+def flush():
+    if _recorder is not None:
+        _recorder.flush()
+
+
+@contextmanager
+def file_context(name: str):
+    """Label spans recorded by this thread (and API calls it makes) with a file name."""
+    previous = getattr(_context, "file", None)
+    _context.file = name
+    try:
+        yield
+    finally:
+        _context.file = previous
+
+
+def current_file() -> str | None:
+    return getattr(_context, "file", None)
+
+
+# --- Report ---
+
+def _percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, min(len(values), math.ceil(pct / 100 * len(values))))
+    return values[rank - 1]
+
+
+def _span_cost(kind: str, model: str | None, prompt: int, completion: int) -> float | None:
+    from batch_runner import BATCH_DISCOUNT
+    from llm_gateway import model_price
+    price = model_price(model or "")
+    if price is None:
+        return None
+    cost = (prompt * price[0] + completion * price[1]) / 1e6
+    return cost * BATCH_DISCOUNT if kind == "batch" else cost
+
+
+def _fmt_seconds(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds) // 60}m {seconds % 60:.0f}s"
+
+
+def stage_report(conn: sqlite3.Connection, stage: str, run_ids: list[str], top: int) -> list[str]:
+    marks = ", ".join("?" * len(run_ids))
+    runs = conn.execute(f"SELECT started, finished FROM runs WHERE run_id IN ({marks})", run_ids).fetchall()
+    spans = conn.execute(f"SELECT kind, file, model, prompt_tokens, completion_tokens, latency, retries,"
+                         f" cache, status, started FROM spans WHERE run_id IN ({marks})", run_ids).fetchall()
+    api = [s for s in spans if s[0] != "cache"]
+    cache = [s for s in spans if s[0] == "cache"]
+
+    # Wall time: each run's start to finish (or its last span, if it never finished)
+    wall = 0.0
+    for started, finished in runs:
+        end = finished or max((s[9] + (s[5] or 0.0) for s in spans if s[9] >= started), default=started)
+        wall += max(end - started, 0.0)
+    # Files worked on: the cache misses where a script records them (a packed
+    # request's spans carry one label for several files), else the span labels
+    files = {s[1] for s in cache if s[7] == "miss" and s[1]} or {s[1] for s in api if s[1]}
+    prompt = sum(s[3] or 0 for s in api)
+    completion = sum(s[4] or 0 for s in api)
+    costs = [_span_cost(s[0], s[2], s[3] or 0, s[4] or 0) for s in api if s[3] or s[4]]
+    known = [c for c in costs if c is not None]
+    latencies = sorted(s[5] for s in api if s[5] is not None and s[0] != "batch")
+    errors = sum(1 for s in api if s[8] == "error")
+    aborted = sum(1 for s in api if s[8] == "aborted")
+    retries = sum(s[6] or 0 for s in api)
+    hits = sum(1 for s in cache if s[7] == "hit")
+
+    lines = [f"{stage}: {len(runs)} run{'s' if len(runs) != 1 else ''}, wall {_fmt_seconds(wall)}"]
+    rate = f", {len(files) / (wall / 60):.1f} files/min" if wall > 0 and files else ""
+    lines.append(f"  {len(api)} calls for {len(files)} files{rate}; {errors} errors, {aborted} aborted,"
+                 f" {retries} retries")
+    cost = f", ~${sum(known):.2f}" if known else ""
+    lines.append(f"  tokens {prompt + completion:,} ({prompt:,} in, {completion:,} out){cost}")
+    if latencies:
+        lines.append(f"  latency p50 {_fmt_seconds(_percentile(latencies, 50))},"
+                     f" p95 {_fmt_seconds(_percentile(latencies, 95))},"
+                     f" p99 {_fmt_seconds(_percentile(latencies, 99))},"
+                     f" max {_fmt_seconds(latencies[-1])}")
+    turnaround = sorted(s[5] for s in api if s[5] is not None and s[0] == "batch")
+    if turnaround:
+        lines.append(f"  batch turnaround p50 {_fmt_seconds(_percentile(turnaround, 50))},"
+                     f" max {_fmt_seconds(turnaround[-1])} (submission to collection)")
+    if cache:
+        lines.append(f"  cache {hits}/{len(cache)} hits ({hits / len(cache):.1%})")
+
+    per_file = {}
+    for s in api:
+        if s[1] and s[5] is not None and s[0] != "batch":  # a job's turnaround isn't any one file's
+            total, calls = per_file.get(s[1], (0.0, 0))
+            per_file[s[1]] = (total + s[5], calls + 1)
+    slowest = sorted(per_file.items(), key=lambda kv: -kv[1][0])[:top]
+    if slowest:
+        lines.append("  slowest files:")
+        for name, (total, calls) in slowest:
+            lines.append(f"    {_fmt_seconds(total):>8}  {calls:>3} calls  {name}")
+    return lines
+
+
+def _select_runs(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    """{stage: [run_id, ...]} for --run ID, --all, or (default) each stage's latest run."""
+    if "--run" in sys.argv:
+        run_id = sys.argv[sys.argv.index("--run") + 1]
+        rows = conn.execute("SELECT stage, run_id FROM runs WHERE run_id = ?", (run_id,)).fetchall()
+    elif "--all" in sys.argv:
+        rows = conn.execute("SELECT stage, run_id FROM runs ORDER BY started").fetchall()
+    else:
+        rows = conn.execute("SELECT stage, run_id FROM runs r WHERE started ="
+                            " (SELECT MAX(started) FROM runs WHERE stage = r.stage) ORDER BY started").fetchall()
+    selected = {}
+    for stage, run_id in rows:
+        selected.setdefault(stage, []).append(run_id)
+    return selected
+
+
+def main():
+    path = Path(os.environ.get("PIPELINE_METRICS") or DEFAULT_PATH)
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    if not path.exists():
+        print(f"No metrics recorded yet ({path})")
+        return
+    conn = sqlite3.connect(path)
+
+    if command == "runs":
+        for run_id, argv, started, finished, count in conn.execute(
+                "SELECT r.run_id, r.argv, r.started, r.finished, COUNT(s.run_id) FROM runs r"
+                " LEFT JOIN spans s ON s.run_id = r.run_id GROUP BY r.run_id ORDER BY r.started"):
+            duration = _fmt_seconds(finished - started) if finished else "unfinished"
+            print(f"  {run_id}  {duration:>10}  {count:>6} spans  {argv}")
+    elif command == "export":
+        if len(sys.argv) < 3 or sys.argv[2].startswith("-"):
+            print("Usage: telemetry.py export OUT.jsonl [--run ID | --all]")
+            sys.exit(1)
+        run_ids = [r for ids in _select_runs(conn).values() for r in ids]
+        marks = ", ".join("?" * len(run_ids))
+        with open(sys.argv[2], "w", encoding="utf-8") as out:
+            rows = conn.execute(f"SELECT * FROM spans WHERE run_id IN ({marks}) ORDER BY started", run_ids)
+            count = 0
+            for row in rows:
+                out.write(json.dumps(dict(zip(SPAN_FIELDS, row))) + "\n")
+                count += 1
+        print(f"Exported {count} spans to {sys.argv[2]}")
+    elif command == "report":
+        top = 5
+        if "--top" in sys.argv:
+            top = int(sys.argv[sys.argv.index("--top") + 1])
+        selected = _select_runs(conn)
+        if not selected:
+            print("No matching runs")
+        for stage, run_ids in selected.items():
+            print("\n".join(stage_report(conn, stage, run_ids, top)))
+            print()
+    else:
+        print(__doc__)
+        sys.exit(1)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
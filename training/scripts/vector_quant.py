@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# /// script
+# dependencies = ["numpy", "openai", "requests"]
+# ///
+"""
+Recall@k of reduced and quantized vectors against full precision.
+
+import_qdrant.py can build the collection with matryoshka-reduced vectors
+(--dims) and int8 scalar or 1-bit binary quantization (--quantization).
+This harness reproduces those storage options locally over the vectors of
+the local index (local_search.py --build) and scores each one on the
+golden query set (retrieval_bench.py) against exact kNN over the
+full-precision vectors:
+
+  - reduce_dims(): first N components, renormalised (text-embedding-3's
+    dimensions parameter gives the same vectors).
+  - QuantizedVectors: Qdrant-style int8 scalar quantization (linear over
+    the QUANTILE range of all components) or sign-bit binary quantization
+    (Hamming distance), searched for k * OVERSAMPLING candidates that are
+    then rescored with the float vectors, as Qdrant does with rescore on.
+
+For each configuration it prints recall@k with and without rescoring, the
+bytes per vector held in RAM, and the numpy search time per query (a
+relative cost, not Qdrant's SIMD latency). The numbers only mean something
+for text-embedding-3-large vectors: the hash stand-in embedder's sparse
+features are neither matryoshka-ordered nor balanced around zero, so its
+reduced and binary rows are poor by construction.
+
+    python3 training/scripts/local_search.py --build --embedder hash --dims 3072
+    python3 training/scripts/vector_quant.py                 # k=10, dims 256/512/1024 + full
+    python3 training/scripts/vector_quant.py -k 5 --dims 512,1024
+"""
+
+import sys
+import time
+
+import numpy as np
+
+DIMS = (256, 512, 1024)
+QUANTIZATIONS = (None, "scalar", "binary")
+QUANTILE = 0.99      # import_qdrant.QUANTIZATION_CONFIGS["scalar"]
+OVERSAMPLING = 2.0   # query/src/search/qdrant.ts QUANTIZATION_OVERSAMPLING
+
+
+def reduce_dims(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """Matryoshka truncation of row vectors, L2-renormalised."""
+    if dims >= matrix.shape[-1]:
+        return np.asarray(matrix, dtype=np.float32)
+    head = np.asarray(matrix[..., :dims], dtype=np.float32)
+    norms = np.linalg.norm(head, axis=-1, keepdims=True)
+    return head / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class QuantizedVectors:
+    """Normalised float32 vectors stored as-is, int8 scalar or packed sign bits."""
+
+    def __init__(self, vectors: np.ndarray, quantization: str | None = None, quantile: float = QUANTILE):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.quantization = quantization
+        if quantization == "scalar":
+            lo, hi = np.quantile(self.vectors, [(1 - quantile) / 2, (1 + quantile) / 2])
+            self.offset = float(lo)
+            self.alpha = float(hi - lo) / 255.0 or 1.0
+            codes = np.clip(np.rint((self.vectors - lo) / self.alpha), 0, 255)
+            self.codes = (codes - 128).astype(np.int8)
+            self._kernel = self.codes.astype(np.float32)  # numpy has no fast int8 matmul
+        elif quantization == "binary":
+            self.codes = np.packbits(self.vectors > 0, axis=1)
+        elif quantization is not None:
+            raise ValueError(f"unknown quantization {quantization!r} (scalar, binary)")
+
+    @property
+    def ram_bytes(self) -> int:
+        """Bytes per vector searched in RAM (quantized copies; originals would stay on disk)."""
+        dims = self.vectors.shape[1]
+        return {None: dims * 4, "scalar": dims, "binary": (dims + 7) // 8}[self.quantization]
+
+    def approximate(self, query: np.ndarray) -> np.ndarray:
+        """Scores from the stored representation (higher is closer)."""
+        if self.quantization == "scalar":
+            # x ~= alpha * (code + 128) + offset, so x.q ~= alpha * (code.q + 128 sum q) + offset sum q
+            total = float(query.sum())
+            return self.alpha * (self._kernel @ query + 128.0 * total) + self.offset * total
+        if self.quantization == "binary":
+            bits = np.packbits(query > 0)
+            return -np.bitwise_count(self.codes ^ bits).sum(axis=1, dtype=np.int32).astype(np.float32)
+        return self.vectors @ query
+
+    def search(self, query: np.ndarray, k: int, rescore: bool = True,
+               oversampling: float = OVERSAMPLING) -> np.ndarray:
+        """Indices of the k best vectors; quantized candidates are rescored in float."""
+        if self.quantization is None or not rescore:
+            return top_k(self.approximate(query), k)
+        candidates = top_k(self.approximate(query), int(k * oversampling))
+        return candidates[top_k(self.vectors[candidates] @ query, k)]
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    return len(set(found.tolist()) & set(expected.tolist())) / max(len(expected), 1)
+
+
+def evaluate(vectors: np.ndarray, queries: np.ndarray, k: int,
+             dims_list: tuple[int, ...] = DIMS) -> list[dict]:
+    """One row per (dims, quantization): mean recall@k vs exact full-precision kNN."""
+    full = vectors.shape[1]
+    baseline = [top_k(vectors @ q, k) for q in queries]
+    rows = []
+    for dims in sorted({d for d in dims_list if d < full} | {full}):
+        reduced = reduce_dims(vectors, dims)
+        reduced_queries = reduce_dims(queries, dims)
+        for quantization in QUANTIZATIONS:
+            store = QuantizedVectors(reduced, quantization)
+            row = {"dims": dims, "quantization": quantization or "none", "ram_bytes": store.ram_bytes}
+            for rescore in ((False, True) if quantization else (True,)):
+                start = time.perf_counter()
+                found = [store.search(q, k, rescore=rescore) for q in reduced_queries]
+                elapsed = (time.perf_counter() - start) / len(queries)
+                recall = float(np.mean([recall_at_k(f, b) for f, b in zip(found, baseline)]))
+                key = "rescored" if rescore else "raw"
+                row[f"recall_{key}"] = recall
+                row[f"ms_{key}"] = elapsed * 1000
+            rows.append(row)
+    return rows
+
+
+def main():
+    from local_search import LocalIndex
+    from retrieval_bench import load_golden
+
+    k = 10
+    if "-k" in sys.argv:
+        k = int(sys.argv[sys.argv.index("-k") + 1])
+    dims_list = DIMS
+    if "--dims" in sys.argv:
+        dims_list = tuple(int(d) for d in sys.argv[sys.argv.index("--dims") + 1].split(","))
+
+    index = LocalIndex()
+    vectors = np.asarray(index.vectors, dtype=np.float32)
+    golden = load_golden()
+    queries = index.embedder.embed([entry["query"] for entry in golden["queries"]])
+    print(f"{len(vectors)} chunks, {vectors.shape[1]}d {index.meta['model']} vectors,"
+          f" {len(queries)} golden v{golden['version']} queries, recall@{k} vs exact {vectors.shape[1]}d float32")
+    if vectors.shape[1] <= min(dims_list):
+        print("  (index has no dimensions to reduce; rebuild it with --dims 3072 to compare reductions)")
+
+    print(f"\n{'dims':>5} {'quant':>7} {'RAM/vec':>8}  {'recall raw':>10} {'recall rescored':>15} {'ms/query':>9}")
+    for row in evaluate(vectors, queries, k, dims_list):
+        raw = f"{row['recall_raw']:.3f}" if "recall_raw" in row else "-"
+        print(f"{row['dims']:>5} {row['quantization']:>7} {row['ram_bytes']:>7}B"
+              f"  {raw:>10} {row['recall_rescored']:>15.3f} {row['ms_rescored']:>9.3f}")
+    print(f"\nRescoring takes the top {OVERSAMPLING:g}x{k} quantized candidates and reorders them in float32.")
+
+
+if __name__ == "__main__":
+    main()